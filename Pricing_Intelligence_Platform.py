@@ -1,5 +1,10 @@
+import time
+
 import streamlit as st
 
+from src.shared_data import DEFAULT_N_ROWS, DEFAULT_SEED, default_source, get_dataset
+from src.warmup import start_warmup, warmup_progress
+
 st.set_page_config(page_title="Pricing Analytics Portfolio", layout="wide")
 
 st.title("Pricing Analytics Portfolio")
@@ -16,3 +21,40 @@ Use the **left sidebar** to open:
 - All data is **synthetic** and for demonstration only.
 - These POCs are designed to show pricing decision workflows: raise opportunities, leakage control, and governance.
 """)
+
+st.divider()
+
+# -----------------------------
+# Shared dataset (one copy per process, reused by both engines)
+# -----------------------------
+st.subheader("Shared Dataset")
+source = default_source()
+st.caption(
+    "Both engines read the same cached transaction set per data source. "
+    + (f"Default: extract `{source[1]}`." if source[0] == "file" else f"Defaults: {DEFAULT_N_ROWS:,} synthetic rows, seed {DEFAULT_SEED}.")
+)
+
+# -----------------------------
+# Background warm-up (default parameters of both engines)
+# -----------------------------
+# Progress is rendered once per run; while the warm-up is still going the page
+# reruns itself every REFRESH_SECONDS instead of holding its script thread.
+REFRESH_SECONDS = 2.0
+
+state = start_warmup(source)
+frac, finished = warmup_progress(state)
+if not finished:
+    st.progress(frac, text=f"Warming up engine caches in the background... {frac:.0%}")
+    st.dataframe(
+        [
+            {"stage": label, "status": t["status"], "seconds": t["seconds"]}
+            for label, t in state["tasks"].items()
+        ],
+        use_container_width=True,
+    )
+    time.sleep(REFRESH_SECONDS)
+    st.rerun()
+
+st.progress(1.0, text=f"Engines ready — warm-up took {state['finished'] - state['started']:.1f}s")
+df = get_dataset(source)
+st.caption(f"Shared dataset: {len(df):,} rows ({df.memory_usage(deep=True).sum() / 1e6:,.1f} MB), used by both pages.")
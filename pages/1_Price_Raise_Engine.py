@@ -2,9 +2,20 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 
-from src.synth_data import make_synthetic_transactions
-from src.model_elasticity import derive_elasticity_cube
-from src.uplift import compute_price_lift_impact
+from src.shared_data import data_source_controls, ingest_report_panel
+from src.app_stages import PRICE_LIFT_COLUMNS, stage_data, stage_elasticity_cube, stage_price_lift
+from src.uplift import normalize_reward_weights
+from src.scenarios import (
+    compare_scenarios,
+    make_scenario,
+    scenario_movers,
+    session_store,
+    tier_transitions,
+)
+from src.ranking import top_k, rank_page
+from src.export import export_panel
+from src.instrument import start_collecting, records_frame
+from src.charts import LARGE_DATA_ROWS, histogram, scatter, show_chart, chart_stats_frame
 
 
 #st.set_page_config(page_title="Pricing Intelligence Engine – POC1", layout="wide")
@@ -22,6 +33,7 @@ with st.sidebar:
         "Simulate Price Increase (%)",
         0.0, 5.0, 2.0, 0.5
     )
+    raise_box = st.container()  # category scope + substitution, filled once the cube is loaded
 
     st.subheader("Raise Score Weights")
     w_el = st.slider("Elasticity (reward)", 0.0, 1.0, 0.35, 0.05)
@@ -29,9 +41,7 @@ with st.sidebar:
     w_rev = st.slider("Revenue uplift (reward)", 0.0, 1.0, 0.25, 0.05)
     w_risk = st.slider("Volume risk (penalty)", 0.0, 1.0, 0.10, 0.05)
 
-    # Normalize reward weights to sum to 1 (penalty stays separate)
-    s = (w_el + w_mg + w_rev) or 1.0
-    w_el, w_mg, w_rev = w_el / s, w_mg / s, w_rev / s
+    w_el, w_mg, w_rev = normalize_reward_weights(w_el, w_mg, w_rev)
 
     st.subheader("Tier Thresholds")
     t1 = st.slider("Tier 1 threshold (Safe Raise)", 0.50, 0.90, 0.65, 0.01)
@@ -48,29 +58,36 @@ with st.sidebar:
     min_uplift = st.number_input("Min Revenue Lift ($)", value=0, step=1000)
 
     st.subheader("Data Settings")
-    n_rows = st.slider("Synthetic rows", 20000, 150000, 80000, 10000)
-    seed = st.number_input("Random seed", value=42, step=1)
+    source = data_source_controls()
 
     show_debug = st.checkbox("Show debug panel", value=False)
+    trace_memory = show_debug and st.checkbox("Trace memory (slower)", value=False)
+
+# Per-stage timings for this run (None unless the debug panel is open)
+timings = start_collecting(show_debug, trace_memory=trace_memory)
 
 # -----------------------------
-# Data + Elasticity cube (cached)
+# Data + Elasticity cube (shared dataset, cached cube)
 # -----------------------------
-@st.cache_data(show_spinner=False)
-def load_data(n_rows: int, seed: int):
-    df_raw = make_synthetic_transactions(n_rows=n_rows, seed=seed)
-    cube = derive_elasticity_cube(df_raw)
-    return df_raw, cube
-
-
-with st.spinner("Building synthetic data + elasticity cube..."):
-    df_raw, cube = load_data(n_rows, seed)
+with st.spinner("Loading transactions + building elasticity cube..."):
+    df_raw = stage_data(source)
+    cube = stage_elasticity_cube(source)
+ingest_report_panel(df_raw)
+
+categories = sorted(map(str, cube["category"].unique()))
+with raise_box:
+    raise_categories = st.multiselect("Raise categories", categories, default=categories)
+    cross_on = st.checkbox(
+        "Within-category substitution",
+        value=False,
+        help="Volume also moves between SKUs of a category (sparse cross-price elasticities per segment).",
+    )
 
 # -----------------------------
-# Simulate price lift + score
+# Simulate price lift + score (only the columns this page shows; cached per plan)
 # -----------------------------
-sim_df = compute_price_lift_impact(
-    cube,
+show_cols = PRICE_LIFT_COLUMNS
+plan = dict(
     price_increase_pct=price_increase,
     w_elasticity=w_el,
     w_margin=w_mg,
@@ -78,7 +95,10 @@ sim_df = compute_price_lift_impact(
     w_vol_risk=w_risk,
     t1=t1,
     t2=t2,
+    raise_categories=None if len(raise_categories) == len(categories) else tuple(raise_categories),
+    cross_elasticity=cross_on,
 )
+sim_df = stage_price_lift(source, **plan)
 
 # -----------------------------
 # KPIs
@@ -99,46 +119,55 @@ st.divider()
 # -----------------------------
 # Visuals
 # -----------------------------
+chart_stats = []
 c1, c2 = st.columns(2)
 
 with c1:
-    fig_el = px.histogram(
-        sim_df,
-        x="elasticity",
-        nbins=40,
-        title="Elasticity Distribution (SKU × Segment × Region)"
+    show_chart(
+        lambda: histogram(
+            sim_df,
+            x="elasticity",
+            nbins=40,
+            title="Elasticity Distribution (SKU × Segment × Region)"
+        ),
+        "Elasticity Distribution", chart_stats,
     )
-    st.plotly_chart(fig_el, use_container_width=True)
 
 with c2:
-    fig_score = px.histogram(
-        sim_df,
-        x="raise_score",
-        nbins=40,
-        title="Raise Score Distribution"
+    show_chart(
+        lambda: histogram(
+            sim_df,
+            x="raise_score",
+            nbins=40,
+            title="Raise Score Distribution"
+        ),
+        "Raise Score Distribution", chart_stats,
     )
-    st.plotly_chart(fig_score, use_container_width=True)
 
 c3, c4 = st.columns(2)
 
 with c3:
-    fig_scatter = px.scatter(
-        sim_df,
-        x="elasticity",
-        y="avg_margin",
-        color="raise_tier",
-        hover_data=["sku", "segment", "region", "category", "raise_score", "revenue_delta", "vol_delta_pct"],
-        title="Elasticity vs Margin (colored by Raise Tier)"
+    show_chart(
+        lambda: scatter(
+            sim_df,
+            x="elasticity",
+            y="avg_margin",
+            color="raise_tier",
+            hover_data=["sku", "segment", "region", "category", "raise_score", "revenue_delta", "vol_delta_pct"],
+            title="Elasticity vs Margin (colored by Raise Tier)"
+        ),
+        "Elasticity vs Margin", chart_stats,
     )
-    st.plotly_chart(fig_scatter, use_container_width=True)
 
 with c4:
-    fig_tiers = px.histogram(
-        sim_df,
-        x="raise_tier",
-        title="Raise Tier Counts"
+    show_chart(
+        lambda: histogram(
+            sim_df,
+            x="raise_tier",
+            title="Raise Tier Counts"
+        ),
+        "Raise Tier Counts", chart_stats,
     )
-    st.plotly_chart(fig_tiers, use_container_width=True)
 
 st.divider()
 
@@ -147,36 +176,39 @@ st.divider()
 # -----------------------------
 st.subheader("Recommended Actions (Ranked)")
 
-action_df = sim_df[
+# Rank in place via a mask + top-k (no filtered copy, no full sort)
+action_mask = (
     (sim_df["raise_tier"].isin(tier_filter)) &
     (sim_df["revenue_delta"] >= float(min_uplift))
-].copy()
-
-action_df = action_df.sort_values("revenue_delta", ascending=False)
-
-show_cols = [
-    "sku", "segment", "region", "category",
-    "elasticity", "avg_margin",
-    "avg_price", "new_price",
-    "avg_units", "new_units",
-    "vol_delta_pct",
-    "base_revenue", "revenue_delta",
-    "raise_score", "raise_tier"
-]
+).to_numpy()
+n_actions = int(action_mask.sum())
+
+n_pages = max((n_actions + 49) // 50, 1)
+page = st.number_input(f"Page (50 rows per page, {n_actions:,} actions)", 1, n_pages, 1, 1) - 1
+st.dataframe(
+    rank_page(sim_df, "revenue_delta", page, 50, mask=action_mask, columns=show_cols),
+    use_container_width=True
+)
 
-st.dataframe(action_df[show_cols].head(50), use_container_width=True)
+with st.expander("Export full results"):
+    export_panel(
+        "actions", "actions", sim_df,
+        key_parts=(source, tuple(plan.items())),
+        filters={"Only rows matching the tier filter / minimum lift": action_mask},
+        sort_by="revenue_delta",
+    )
 
 # -----------------------------
 # Explain a Recommendation (drill-down)
 # -----------------------------
 st.subheader("Explain a Recommendation")
 
-if len(action_df) == 0:
+if n_actions == 0:
     st.info("No rows match your tier filter / minimum uplift. Adjust sidebar settings.")
 else:
     # Add a key for selection (don’t mutate sim_df; keep it local)
-    tmp = action_df.head(50).copy()
-    tmp["key"] = tmp["sku"] + " | " + tmp["segment"] + " | " + tmp["region"]
+    tmp = top_k(sim_df, "revenue_delta", 50, mask=action_mask).copy()
+    tmp["key"] = tmp["sku"].astype(str) + " | " + tmp["segment"].astype(str) + " | " + tmp["region"].astype(str)
 
     selected = st.selectbox("Select SKU / Segment / Region", tmp["key"].tolist())
 
@@ -199,6 +231,45 @@ else:
 
 st.divider()
 
+# -----------------------------
+# Scenario comparison (stored per session, compared from cached arrays)
+# -----------------------------
+st.subheader("Compare Raise Plans")
+
+store = session_store(st.session_state)
+sc1, sc2 = st.columns([3, 1])
+scenario_name = sc1.text_input(
+    "Scenario name",
+    value=f"+{price_increase:.1f}% · T1 {t1:.2f} · T2 {t2:.2f}",
+)
+if sc2.button("Save current plan", use_container_width=True):
+    evicted = store.save(make_scenario(scenario_name, source, plan, sim_df))
+    if evicted:
+        st.caption(f"Dropped least recently used: {', '.join(evicted)}")
+
+saved = store.names(source)
+if len(saved) < 2:
+    st.info("Save two or more plans to compare them side by side.")
+else:
+    # peek(): reading must not reorder `saved`, or the widgets reset on the next rerun
+    picked = st.multiselect("Scenarios (first = baseline)", saved, default=saved[:2][::-1], key="scenario_compare")
+    if len(picked) >= 2:
+        scenarios = [store.peek(n) for n in picked]
+        st.dataframe(compare_scenarios(scenarios), use_container_width=True, hide_index=True)
+
+        other = st.selectbox("Compare baseline with", picked[1:], key="scenario_compare_other")
+        a, b = scenarios[0], store.peek(other)
+        t_left, t_right = st.columns(2)
+        with t_left:
+            st.write("Tier moves (rows: baseline, columns: other)")
+            st.dataframe(tier_transitions(a, b), use_container_width=True)
+        with t_right:
+            st.write("Rows that change most (tier moves first)")
+            st.dataframe(scenario_movers(a, b, cube[["sku", "segment", "region"]], k=20), use_container_width=True, hide_index=True)
+    st.caption(f"{len(store)} scenarios stored ({store.nbytes() / 1e3:,.0f} KB)")
+
+st.divider()
+
 # -----------------------------
 # Optional Debug Panel
 # -----------------------------
@@ -210,6 +281,9 @@ if show_debug:
     d2.metric("Cube rows", f"{len(cube):,}")
     d3.metric("Sim rows", f"{len(sim_df):,}")
 
+    if "ingest_report" in df_raw.attrs:
+        st.write("Ingest report:", df_raw.attrs["ingest_report"])
+
     st.write("Overall price-units correlation (raw):", float(df_raw["net_price"].corr(df_raw["units"])))
 
     st.write("Raw price std dev:", float(df_raw["net_price"].std()))
@@ -220,4 +294,10 @@ if show_debug:
     fig_raw = px.scatter(sample, x="net_price", y="units", color="segment", title="Raw Price vs Units (sample)")
     st.plotly_chart(fig_raw, use_container_width=True)
 
+    st.write(f"Chart payloads (large-data mode above {LARGE_DATA_ROWS:,} rows):")
+    st.dataframe(chart_stats_frame(chart_stats), use_container_width=True)
+
+    st.write("Stage timing breakdown (this run; cache = hit/miss of the staged cache):")
+    st.dataframe(records_frame(timings), use_container_width=True)
+
 st.caption("Note: This POC uses synthetic data for demonstration only.")
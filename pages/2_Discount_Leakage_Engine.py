@@ -1,13 +1,21 @@
 import streamlit as st
 import plotly.express as px
 
-from src.synth_data import make_synthetic_transactions
-from src.poc2_features import build_customer_features
-from src.poc2_segmentation import segment_customers, SEGMENT_FEATURES
-from src.poc2_leakage import (
-    leakage_flags,
-    leakage_summary_by_customer,
-    leakage_summary_by_rep,
+from src.poc2_segmentation import SEGMENT_FEATURES
+from src.shared_data import data_source_controls, ingest_report_panel
+from src.ranking import top_k, rank_page
+from src.export import export_panel
+from src.instrument import start_collecting, records_frame
+from src.charts import LARGE_DATA_ROWS, scatter, show_chart, chart_stats_frame
+from src.app_stages import (
+    DEFAULT_K,
+    DEFAULT_PERCENTILE,
+    DEFAULT_MIN_PEER_N,
+    stage_data,
+    stage_segmentation,
+    stage_leakage_flags,
+    stage_leakage_by_customer,
+    stage_leakage_by_rep,
 )
 
 #st.set_page_config(page_title="Pricing Intelligence Engine – POC2", layout="wide")
@@ -20,36 +28,30 @@ st.caption("Customer Segmentation + Discount Leakage (Synthetic data)")
 # -----------------------------
 with st.sidebar:
     st.header("Controls")
-    n_rows = st.slider("Synthetic rows", 20000, 150000, 80000, 10000)
-    seed = st.number_input("Random seed", value=42, step=1)
+    source = data_source_controls()
 
     st.subheader("Segmentation")
-    k = st.slider("Number of clusters (K)", 3, 10, 5, 1)
+    k = st.slider("Number of clusters (K)", 3, 10, DEFAULT_K, 1)
 
     st.subheader("Leakage Rules")
-    percentile = st.slider("Leakage percentile threshold", 0.80, 0.99, 0.90, 0.01)
-    min_peer_n = st.slider("Minimum peer transactions", 10, 200, 30, 10)
+    percentile = st.slider("Leakage percentile threshold", 0.80, 0.99, DEFAULT_PERCENTILE, 0.01)
+    min_peer_n = st.slider("Minimum peer transactions", 10, 200, DEFAULT_MIN_PEER_N, 10)
     st.caption("Leakage = discount above peer percentile (SKU×segment×region), when peer count ≥ minimum.")
 
-# -----------------------------
-# Load / Compute (cached)
-# -----------------------------
-@st.cache_data(show_spinner=False)
-def load_all(n_rows, seed, k, percentile, min_peer_n):
-    df = make_synthetic_transactions(n_rows=n_rows, seed=seed)
-
-    # Customer features + segmentation
-    cust = build_customer_features(df)
-    cust_seg = segment_customers(cust, k=k)
+    show_debug = st.checkbox("Show debug panel", value=False)
+    trace_memory = show_debug and st.checkbox("Trace memory (slower)", value=False)
 
-    # Leakage
-    txn_flagged = leakage_flags(df, percentile=percentile, min_peer_n=min_peer_n)
-    cust_leak = leakage_summary_by_customer(txn_flagged)
-    rep_leak = leakage_summary_by_rep(txn_flagged)
+# Per-stage timings for this run (None unless the debug panel is open)
+timings = start_collecting(show_debug, trace_memory=trace_memory)
 
-    return df, cust_seg, txn_flagged, cust_leak, rep_leak
-
-df, cust_seg, txn_flagged, cust_leak, rep_leak = load_all(n_rows, seed, k, percentile, min_peer_n)
+# -----------------------------
+# Load / Compute (staged cache: each slider only reruns its downstream stages)
+# -----------------------------
+ingest_report_panel(stage_data(source))
+cust_seg = stage_segmentation(source, k)
+txn_flagged = stage_leakage_flags(source, percentile, min_peer_n)
+cust_leak = stage_leakage_by_customer(source, percentile, min_peer_n)
+rep_leak = stage_leakage_by_rep(source, percentile, min_peer_n)
 
 # -----------------------------
 # KPIs
@@ -65,31 +67,36 @@ st.divider()
 # -----------------------------
 # Segmentation visuals
 # -----------------------------
+chart_stats = []
 left, right = st.columns(2)
 
 with left:
-    fig1 = px.scatter(
-        cust_seg,
-        x="avg_discount",
-        y="gm_pct",
-        color="cluster_label",
-        hover_data=["customer_id", "segment", "region", "total_revenue", "orders"],
-        title="Customer Segments: Discount vs GM%"
+    show_chart(
+        lambda: scatter(
+            cust_seg,
+            x="avg_discount",
+            y="gm_pct",
+            color="cluster_label",
+            hover_data=["customer_id", "segment", "region", "total_revenue", "orders"],
+            title="Customer Segments: Discount vs GM%"
+        ),
+        "Customer Segments", chart_stats,
     )
-    st.plotly_chart(fig1, use_container_width=True)
 
 with right:
-    fig2 = px.bar(
-        cust_seg.groupby("cluster_label", as_index=False)
-               .agg(customers=("customer_id", "count"),
-                    avg_disc=("avg_discount", "mean"),
-                    avg_gm=("gm_pct", "mean"),
-                    revenue=("total_revenue", "sum")),
-        x="cluster_label",
-        y="customers",
-        title="Cluster Sizes"
+    show_chart(
+        lambda: px.bar(
+            cust_seg.groupby("cluster_label", as_index=False)
+                   .agg(customers=("customer_id", "count"),
+                        avg_disc=("avg_discount", "mean"),
+                        avg_gm=("gm_pct", "mean"),
+                        revenue=("total_revenue", "sum")),
+            x="cluster_label",
+            y="customers",
+            title="Cluster Sizes"
+        ),
+        "Cluster Sizes", chart_stats,
     )
-    st.plotly_chart(fig2, use_container_width=True)
 
 st.subheader("Cluster Profile (Averages)")
 profile = cust_seg.groupby("cluster_label")[SEGMENT_FEATURES].mean().reset_index()
@@ -107,18 +114,24 @@ show_cols = [
     "leakage_txns", "leakage_est_dollars",
     "avg_discount", "p90_discount", "gm_pct", "revenue"
 ]
-st.dataframe(cust_leak[show_cols].head(50), use_container_width=True)
+n_cust_pages = max((len(cust_leak) + 49) // 50, 1)
+cust_page = st.number_input("Page (50 accounts per page)", 1, n_cust_pages, 1, 1) - 1
+st.dataframe(
+    rank_page(cust_leak, "leakage_est_dollars", cust_page, 50, columns=show_cols),
+    use_container_width=True
+)
 
 st.subheader("Explain Leakage (pick a customer)")
-cust_list = cust_leak["customer_id"].head(50).tolist()
+cust_list = top_k(cust_leak, "leakage_est_dollars", 50)["customer_id"].tolist()
 
 if len(cust_list) == 0:
     st.info("No customers flagged under current leakage rules. Try lowering the percentile or min peer threshold.")
 else:
     selected = st.selectbox("Select customer", cust_list)
 
-    tx = txn_flagged[txn_flagged["customer_id"] == selected].copy()
-    tx_leak = tx[tx["leakage_flag"]].sort_values("leakage_dollars_est", ascending=False).head(25)
+    sel_mask = (txn_flagged["customer_id"] == selected).to_numpy()
+    tx = txn_flagged[sel_mask]
+    tx_leak = top_k(txn_flagged, "leakage_dollars_est", 25, mask=sel_mask & txn_flagged["leakage_flag"].to_numpy())
 
     e1, e2, e3 = st.columns(3)
     e1.metric("Leakage Txns", f"{int(tx['leakage_flag'].sum()):,}")
@@ -149,18 +162,19 @@ rep_cols = [
     "leakage_txns", "leakage_est_dollars",
     "avg_discount", "gm_pct", "revenue"
 ]
-st.dataframe(rep_leak[rep_cols].head(30), use_container_width=True)
+st.dataframe(top_k(rep_leak, "leakage_est_dollars", 30, columns=rep_cols), use_container_width=True)
 
 st.subheader("Explain Rep Leakage (pick a rep)")
-rep_list = rep_leak["sales_rep_id"].head(30).tolist()
+rep_list = top_k(rep_leak, "leakage_est_dollars", 30)["sales_rep_id"].tolist()
 
 if len(rep_list) == 0:
     st.info("No reps flagged under current leakage rules. Try lowering the percentile or min peer threshold.")
 else:
     selected_rep = st.selectbox("Select rep", rep_list)
 
-    rep_tx = txn_flagged[txn_flagged["sales_rep_id"] == selected_rep].copy()
-    rep_tx_leak = rep_tx[rep_tx["leakage_flag"]].sort_values("leakage_dollars_est", ascending=False).head(25)
+    rep_mask = (txn_flagged["sales_rep_id"] == selected_rep).to_numpy()
+    rep_tx = txn_flagged[rep_mask]
+    rep_tx_leak = top_k(txn_flagged, "leakage_dollars_est", 25, mask=rep_mask & txn_flagged["leakage_flag"].to_numpy())
 
     r1, r2, r3 = st.columns(3)
     r1.metric("Leakage Txns", f"{int(rep_tx['leakage_flag'].sum()):,}")
@@ -179,4 +193,39 @@ else:
         use_container_width=True
     )
 
+# -----------------------------
+# Export full results
+# -----------------------------
+with st.expander("Export full results"):
+    leak_key = (source, percentile, min_peer_n)
+    st.write("Transactions")
+    export_panel(
+        "leakage_flags", "transactions", txn_flagged, key_parts=leak_key,
+        filters={"Only flagged transactions": txn_flagged["leakage_flag"].to_numpy(dtype=bool)},
+        sort_by="leakage_dollars_est",
+    )
+    st.write("Customer rollup")
+    export_panel("leakage_by_customer", "customer rollup", cust_leak, key_parts=leak_key, sort_by="leakage_est_dollars")
+    st.write("Rep rollup")
+    export_panel("leakage_by_rep", "rep rollup", rep_leak, key_parts=leak_key, sort_by="leakage_est_dollars")
+
+st.divider()
+
+# -----------------------------
+# Optional Debug Panel
+# -----------------------------
+if show_debug:
+    st.subheader("Debug Panel")
+
+    d1, d2, d3 = st.columns(3)
+    d1.metric("Flagged txn rows", f"{len(txn_flagged):,}")
+    d2.metric("Customers", f"{len(cust_seg):,}")
+    d3.metric("Reps", f"{len(rep_leak):,}")
+
+    st.write(f"Chart payloads (large-data mode above {LARGE_DATA_ROWS:,} rows):")
+    st.dataframe(chart_stats_frame(chart_stats), use_container_width=True)
+
+    st.write("Stage timing breakdown (this run; cache = hit/miss of the staged cache):")
+    st.dataframe(records_frame(timings), use_container_width=True)
+
 st.caption("Note: This POC uses synthetic data for demonstration only.")
@@ -0,0 +1,167 @@
+"""
+Cached stage graph for the Streamlit pages.
+
+Each stage is keyed only on its own parameters and pulls its upstream stage
+through the same cache, so a slider change recomputes just the stages below it:
+
+  data(source)                          (src.shared_data)
+    ├─ elasticity cube ─┬─ price lift(plan parameters)
+    ├─ cross elasticity ─┴─ cross operator (when the plan includes substitution)
+    ├─ features ── segmentation(k)
+    └─ leakage flags(percentile, min_peer_n) ── customer / rep summaries
+
+Stages use st.cache_resource so hits hand back the cached object by reference
+(no pickle/copy). Callers must treat returned frames as read-only.
+Leakage summaries are returned unsorted; pages rank them with src.ranking.
+Every stage records a cache hit/miss span (src.instrument) when instrumentation is on.
+Aggregations run on the process-wide backend (src.backends, PRICING_BACKEND).
+With PRICING_CACHE_DIR set, a stage miss first looks in the shared on-disk
+result cache (src.result_cache, keyed on the source and parameters) and only
+then loads its upstream stages and computes; the span then reads cache="disk".
+"""
+import streamlit as st
+
+from src.instrument import cached_stage, mark_cache_miss
+from src.result_cache import get_or_compute
+
+from src.shared_data import get_dataset
+from src.backends import get_backend
+from src.poc2_segmentation import segment_customers
+from src.uplift import compute_price_lift_impact
+from src.cross_elasticity import cross_operator, fit_cross_elasticity
+from src.poc2_leakage import DEFAULT_MIN_PEER_N, DEFAULT_PERCENTILE  # noqa: F401 (page defaults)
+
+MAX_ENTRIES = 8
+
+# Leakage Engine slider defaults (also what the landing page warms up);
+# the percentile / peer-n defaults live in src.poc2_leakage
+DEFAULT_K = 5
+
+# What the Price Raise Engine shows from compute_price_lift_impact
+PRICE_LIFT_COLUMNS = [
+    "sku", "segment", "region", "category",
+    "elasticity", "avg_margin",
+    "avg_price", "new_price",
+    "avg_units", "new_units",
+    "vol_delta_pct",
+    "base_revenue", "revenue_delta",
+    "raise_score", "raise_tier",
+]
+
+# What the summaries and the Leakage Engine tables read from the flagged transactions
+LEAKAGE_FLAG_COLUMNS = [
+    "customer_id", "sales_rep_id", "sku", "category", "segment", "region",
+    "list_price", "net_price", "units",
+    "discount_pct", "revenue", "gm", "peer_q_disc", "peer_n",
+    "leakage_flag", "leakage_dollars_est",
+]
+
+
+def stage_data(source: tuple):
+    return get_dataset(source)
+
+
+@cached_stage("elasticity_cube")
+@st.cache_resource(show_spinner=False, max_entries=MAX_ENTRIES)
+def stage_elasticity_cube(source: tuple):
+    mark_cache_miss()
+    return get_or_compute(
+        "elasticity_cube", (source,),
+        lambda: get_backend().derive_elasticity_cube(stage_data(source)),
+    )
+
+
+@cached_stage("cross_elasticity")
+@st.cache_resource(show_spinner=False, max_entries=MAX_ENTRIES)
+def stage_cross_elasticity(source: tuple):
+    mark_cache_miss()
+    return get_or_compute("cross_elasticity", (source,), lambda: fit_cross_elasticity(stage_data(source)))
+
+
+@cached_stage("cross_operator")
+@st.cache_resource(show_spinner=False, max_entries=MAX_ENTRIES)
+def stage_cross_operator(source: tuple):
+    mark_cache_miss()
+    return cross_operator(stage_cross_elasticity(source), stage_elasticity_cube(source))
+
+
+# Keyed on the plan parameters: moving a slider back to an earlier plan is a hit
+@cached_stage("price_lift")
+@st.cache_resource(show_spinner=False, max_entries=4 * MAX_ENTRIES)
+def stage_price_lift(
+    source: tuple,
+    price_increase_pct: float,
+    w_elasticity: float,
+    w_margin: float,
+    w_rev_uplift: float,
+    w_vol_risk: float,
+    t1: float,
+    t2: float,
+    raise_categories: tuple | None = None,
+    cross_elasticity: bool = False,
+):
+    mark_cache_miss()
+    params = dict(
+        price_increase_pct=price_increase_pct,
+        w_elasticity=w_elasticity,
+        w_margin=w_margin,
+        w_rev_uplift=w_rev_uplift,
+        w_vol_risk=w_vol_risk,
+        t1=t1,
+        t2=t2,
+        raise_categories=raise_categories,
+        cross=stage_cross_operator(source) if cross_elasticity else None,
+    )
+    return compute_price_lift_impact(stage_elasticity_cube(source), **params, columns=PRICE_LIFT_COLUMNS)
+
+
+@cached_stage("customer_features")
+@st.cache_resource(show_spinner=False, max_entries=MAX_ENTRIES)
+def stage_customer_features(source: tuple):
+    mark_cache_miss()
+    return get_or_compute(
+        "customer_features", (source,),
+        lambda: get_backend().build_customer_features(stage_data(source)),
+    )
+
+
+@cached_stage("segmentation")
+@st.cache_resource(show_spinner=False, max_entries=MAX_ENTRIES)
+def stage_segmentation(source: tuple, k: int):
+    mark_cache_miss()
+    return get_or_compute(
+        "segmentation", (source, k),
+        lambda: segment_customers(stage_customer_features(source), k=k),
+    )
+
+
+@cached_stage("leakage_flags")
+@st.cache_resource(show_spinner=False, max_entries=MAX_ENTRIES)
+def stage_leakage_flags(source: tuple, percentile: float, min_peer_n: int):
+    mark_cache_miss()
+    return get_or_compute(
+        "leakage_flags", (source, percentile, min_peer_n, LEAKAGE_FLAG_COLUMNS),
+        lambda: get_backend().leakage_flags(
+            stage_data(source), percentile=percentile, min_peer_n=min_peer_n, columns=LEAKAGE_FLAG_COLUMNS
+        ),
+    )
+
+
+@cached_stage("leakage_by_customer")
+@st.cache_resource(show_spinner=False, max_entries=MAX_ENTRIES)
+def stage_leakage_by_customer(source: tuple, percentile: float, min_peer_n: int):
+    mark_cache_miss()
+    return get_or_compute(
+        "leakage_by_customer", (source, percentile, min_peer_n),
+        lambda: get_backend().leakage_summary_by_customer(stage_leakage_flags(source, percentile, min_peer_n), sort=False),
+    )
+
+
+@cached_stage("leakage_by_rep")
+@st.cache_resource(show_spinner=False, max_entries=MAX_ENTRIES)
+def stage_leakage_by_rep(source: tuple, percentile: float, min_peer_n: int):
+    mark_cache_miss()
+    return get_or_compute(
+        "leakage_by_rep", (source, percentile, min_peer_n),
+        lambda: get_backend().leakage_summary_by_rep(stage_leakage_flags(source, percentile, min_peer_n), sort=False),
+    )
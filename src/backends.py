@@ -0,0 +1,205 @@
+"""
+Aggregation backends for the groupby-heavy stages.
+
+A backend is a table of the stage functions below with the pandas signatures:
+
+    backend = get_backend()            # PRICING_BACKEND, default "pandas"
+    cube = backend.derive_elasticity_cube(df)
+
+  pandas   the reference implementation (model_elasticity, poc2_features, poc2_leakage)
+  polars   src.polars_backend: lazy queries, streaming engine, multi-threaded
+           (optional dependency: pip install "polars>=1.25")
+
+Both return the same frames (columns, dtypes, row order). Check that, and time
+both backends, with:
+
+    python -m src.backends check --sizes 1e4,1e5,1e6
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from src.model_elasticity import derive_elasticity_cube
+from src.poc2_features import build_customer_features
+from src.poc2_leakage import (
+    leakage_flags,
+    peer_benchmarks,
+    leakage_summary_by_customer,
+    leakage_summary_by_rep,
+)
+
+BACKENDS = ("pandas", "polars")
+
+_default = os.environ.get("PRICING_BACKEND", "pandas")
+
+
+class Backend(NamedTuple):
+    name: str
+    derive_elasticity_cube: Callable
+    build_customer_features: Callable
+    leakage_flags: Callable
+    peer_benchmarks: Callable
+    leakage_summary_by_customer: Callable
+    leakage_summary_by_rep: Callable
+
+
+PANDAS = Backend(
+    "pandas",
+    derive_elasticity_cube,
+    build_customer_features,
+    leakage_flags,
+    peer_benchmarks,
+    leakage_summary_by_customer,
+    leakage_summary_by_rep,
+)
+
+
+def _polars() -> Backend:
+    try:
+        from src import polars_backend as pb
+    except ImportError as e:
+        raise ImportError("The polars backend needs the optional 'polars' package (pip install \"polars>=1.25\")") from e
+    # collect_all(engine=...) first appeared in polars 1.25
+    if tuple(int(p) for p in pb.pl.__version__.split(".")[:2]) < pb.MIN_POLARS:
+        raise ImportError(f"The polars backend needs polars>=1.25 (found {pb.pl.__version__})")
+    return Backend(
+        "polars",
+        pb.derive_elasticity_cube,
+        pb.build_customer_features,
+        pb.leakage_flags,
+        peer_benchmarks,  # a drop_duplicates, nothing to aggregate
+        pb.leakage_summary_by_customer,
+        pb.leakage_summary_by_rep,
+    )
+
+
+def set_default_backend(name: str):
+    global _default
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    _default = name
+
+
+def default_backend() -> str:
+    return _default
+
+
+def get_backend(name: str | None = None) -> Backend:
+    name = name or _default
+    if name == "pandas":
+        return PANDAS
+    if name == "polars":
+        return _polars()
+    raise ValueError(f"Unknown backend '{name}' (expected one of {', '.join(BACKENDS)})")
+
+
+# -----------------------------
+# Cross-backend equivalence + timing
+# -----------------------------
+RTOL = 1e-9  # float sums/means may differ in summation order across backends
+RTOL_FLOAT32 = 1e-6  # float32 columns (compact layout) round at ~6e-8
+
+
+def assert_same_frame(got: pd.DataFrame, expected: pd.DataFrame, rtol: float = RTOL):
+    """Same columns, dtypes, index and values; floats compared with rtol for their width."""
+    pd.testing.assert_index_equal(got.columns, expected.columns)
+    pd.testing.assert_index_equal(got.index, expected.index)
+    for c in expected.columns:
+        tol = RTOL_FLOAT32 if expected[c].dtype == np.float32 else rtol
+        pd.testing.assert_series_equal(got[c], expected[c], check_exact=False, rtol=tol, atol=0)
+
+
+def _stage_calls(backend: Backend, df: pd.DataFrame, flagged: pd.DataFrame) -> dict:
+    return {
+        "derive_elasticity_cube": lambda: backend.derive_elasticity_cube(df),
+        "build_customer_features": lambda: backend.build_customer_features(df),
+        "leakage_flags": lambda: backend.leakage_flags(df),
+        "leakage_summary_by_customer": lambda: backend.leakage_summary_by_customer(flagged),
+        "leakage_summary_by_rep": lambda: backend.leakage_summary_by_rep(flagged),
+        "build_customer_features(approx_distinct)": lambda: backend.build_customer_features(df, approx_distinct=True),
+        "leakage_summary_by_rep(approx_distinct)": lambda: backend.leakage_summary_by_rep(flagged, approx_distinct=True),
+    }
+
+
+def with_null_key(df: pd.DataFrame, column: str, every: int = 97, start: int = 0) -> pd.DataFrame:
+    """Copy of `df` with a null `column` on every `every`-th row from `start`."""
+    out = df.copy()
+    values = out[column].astype(object)
+    values.iloc[start::every] = None
+    out[column] = values.astype(out[column].dtype)
+    return out
+
+
+def with_null_peer_keys(df: pd.DataFrame, every: int = 97) -> pd.DataFrame:
+    """Copy of `df` with a null region on every `every`-th row (rows without a peer group)."""
+    return with_null_key(df, "region", every)
+
+
+def check_equivalence(df: pd.DataFrame, other: str = "polars", rtol: float = RTOL, stages=None) -> list[dict]:
+    """Runs every stage (or `stages`) on both backends; raises AssertionError on the first difference."""
+    flagged = PANDAS.leakage_flags(df)
+    ref = _stage_calls(PANDAS, df, flagged)
+    alt = _stage_calls(get_backend(other), df, flagged)
+    rows = []
+    for stage in stages or ref:
+        t0 = time.perf_counter()
+        expected = ref[stage]()
+        t1 = time.perf_counter()
+        got = alt[stage]()
+        t2 = time.perf_counter()
+        try:
+            assert_same_frame(got, expected, rtol)
+        except AssertionError as e:
+            raise AssertionError(f"{other} != pandas for {stage} ({len(df):,} rows): {e}") from None
+        rows.append({
+            "stage": stage,
+            "rows": len(df),
+            "pandas_s": round(t1 - t0, 4),
+            f"{other}_s": round(t2 - t1, 4),
+            "speedup": round((t1 - t0) / max(t2 - t1, 1e-9), 2),
+        })
+    return rows
+
+
+def main(argv=None) -> int:
+    from src.synth_data import make_synthetic_transactions
+    from src.memory import compact_transactions
+
+    p = argparse.ArgumentParser(prog="python -m src.backends")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("check", help="Assert identical outputs across backends and report speedups")
+    c.add_argument("--backend", default="polars", choices=[b for b in BACKENDS if b != "pandas"])
+    c.add_argument("--sizes", default="1e4,1e5,1e6", help="Synthetic row counts")
+    c.add_argument("--customers", type=int, default=500)
+    c.add_argument("--compact", action="store_true", help="Also check the categorical / float32 layout (src.memory)")
+    args = p.parse_args(argv)
+
+    rows = []
+    for n in [int(float(x)) for x in args.sizes.split(",") if x]:
+        df = make_synthetic_transactions(n, seed=7, n_customers=args.customers)
+        layouts = [("object", df)] + ([("compact", compact_transactions(df.copy()))] if args.compact else [])
+        for layout, data in layouts:
+            for r in check_equivalence(data, args.backend):
+                rows.append({"layout": layout, **r})
+            print(f"{n:>12,} rows ({layout}): outputs identical", flush=True)
+        nulls = with_null_peer_keys(df)
+        flagged = PANDAS.leakage_flags(nulls)
+        no_peer = nulls["region"].isna().to_numpy()
+        assert not flagged["leakage_flag"].to_numpy()[no_peer].any() and (flagged["peer_n"].to_numpy()[no_peer] == 0).all()
+        for r in check_equivalence(nulls, args.backend, stages=["leakage_flags"]):
+            rows.append({"layout": "null peer keys", **r})
+        print(f"{n:>12,} rows (null peer keys): outputs identical, {no_peer.sum():,} rows unflagged", flush=True)
+
+    print()
+    print(pd.DataFrame(rows).to_string(index=False))
+    print(f"\nthreads available: {len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
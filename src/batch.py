@@ -0,0 +1,361 @@
+"""
+Headless batch pipeline (no Streamlit) for nightly repricing runs.
+
+    python -m src.batch --out-dir out/2026-10-19 --n-rows 80000 --seed 42
+    python -m src.batch --out-dir out/2026-10-19 --input extracts/transactions.parquet
+
+Runs the same functions with the same defaults as the pages:
+
+  data ─┬─ elasticity cube ── price lift impact          (Price Raise Engine)
+        ├─ customer features ── segmentation             (Discount Leakage Engine)
+        └─ leakage flags ── customer / rep summaries     (Discount Leakage Engine)
+
+The three branches run in parallel worker processes. Every output is written as
+Parquet, plus the segmentation model artifact and run_manifest.json with the
+parameters and per-stage wall time, output rows and peak RSS (per stage on Linux).
+--low-memory runs the whole pipeline in the compact mode described in src.memory.
+--engine duckdb runs the aggregations out of core over a Parquet --input
+(src.duckdb_engine): nothing is loaded into the parent and leakage flags are
+written by DuckDB directly. --shards N splits the leakage stages by region and
+the customer stages by customer_id over N processes (src.sharding). --cache-dir
+serves repeated runs over the same data and parameters from the shared on-disk
+result cache (src.result_cache), and --store-dir maps the transactions from the
+column store (src.column_store) in the parent and every branch worker.
+--approx-distinct estimates the customer and rep distinct counts with HyperLogLog
+sketches (src.sketches) on the memory engine. With --instrument
+the manifest also carries the nested src/ spans (src.instrument), and
+--log-json streams the same records as JSON lines while the run progresses.
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from src import column_store, instrument, result_cache
+from src.memory import compact_transactions, float_dtype, peak_rss_mb, reset_peak_rss, rss_mb, set_low_memory
+from src.synth_data import make_synthetic_transactions
+from src.ingest import DEFAULT_CHUNK_ROWS, load_transactions
+from src.backends import BACKENDS, get_backend, set_default_backend
+from src.poc2_leakage import DEFAULT_MIN_PEER_N, DEFAULT_PERCENTILE
+from src.uplift import compute_price_lift_impact, normalize_reward_weights
+from src.poc2_segmentation import (
+    fit_segmentation_model,
+    assign_segments,
+    save_segmentation_model,
+    load_segmentation_model,
+)
+
+
+def _timed(timings: list, stage: str, fn, *args, **kwargs):
+    # peak_rss_mb is this stage's high-water mark where the OS allows resetting it
+    # (Linux), otherwise the process peak so far
+    base = rss_mb()
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    timings.append({
+        "stage": stage,
+        "seconds": round(time.perf_counter() - t0, 4),
+        "rows_out": len(out) if isinstance(out, pd.DataFrame) else None,
+        "base_rss_mb": round(base, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "pid": os.getpid(),
+    })
+    return out
+
+
+def _write(df: pd.DataFrame, out_dir: str, name: str, timings: list) -> str:
+    path = os.path.join(out_dir, f"{name}.parquet")
+    _timed(timings, f"write:{name}", df.to_parquet, path, index=False)
+    return path
+
+
+# Stages taking approx_distinct (src.sketches)
+APPROX_DISTINCT_STAGES = ("build_customer_features", "leakage_summary_by_rep")
+
+
+def _stage(args: argparse.Namespace, df: pd.DataFrame | None, name: str):
+    """(function, data argument) for a stage on the configured engine."""
+    if args.engine == "duckdb":
+        from src import duckdb_engine
+
+        return getattr(duckdb_engine, name), args.input
+    approx = {"approx_distinct": True} if args.approx_distinct and name in APPROX_DISTINCT_STAGES else {}
+    if args.shards > 1 and name in ("build_customer_features", "leakage_summary_by_customer"):
+        from src import sharding
+
+        fn = getattr(sharding, {"build_customer_features": "sharded_customer_features"}.get(name, "sharded_leakage_by_customer"))
+        return functools.partial(fn, workers=args.shards, **approx), df
+    return functools.partial(result_cache.cached(getattr(get_backend(), name), name), **approx), df
+
+
+def _price_raise_branch(df: pd.DataFrame | None, args: argparse.Namespace) -> list:
+    timings = []
+    fn, data = _stage(args, df, "derive_elasticity_cube")
+    cube = _timed(timings, "derive_elasticity_cube", fn, data)
+    _write(cube, args.out_dir, "elasticity_cube", timings)
+
+    w_el, w_mg, w_rev = normalize_reward_weights(args.w_elasticity, args.w_margin, args.w_rev_uplift)
+    sim = _timed(
+        timings, "compute_price_lift_impact", result_cache.cached(compute_price_lift_impact),
+        cube,
+        price_increase_pct=args.price_increase,
+        w_elasticity=w_el,
+        w_margin=w_mg,
+        w_rev_uplift=w_rev,
+        w_vol_risk=args.w_vol_risk,
+        t1=args.t1,
+        t2=args.t2,
+    )
+    _write(sim, args.out_dir, "price_lift_impact", timings)
+    return timings
+
+
+def _segmentation_branch(df: pd.DataFrame | None, args: argparse.Namespace) -> list:
+    timings = []
+    fn, data = _stage(args, df, "build_customer_features")
+    cust = _timed(timings, "build_customer_features", fn, data)
+    _write(cust, args.out_dir, "customer_features", timings)
+
+    prev = load_segmentation_model(args.prev_model) if args.prev_model else None
+    model = _timed(timings, "fit_segmentation_model", fit_segmentation_model, cust, k=args.k, prev_model=prev)
+    save_segmentation_model(model, os.path.join(args.out_dir, "segmentation_model.npz"))
+
+    # Same output as segment_customers, but keeps the fitted model for the artifact
+    def _segment():
+        seg = cust.copy()
+        seg["cluster"] = assign_segments(model, seg)
+        seg["cluster_label"] = seg["cluster"].apply(lambda c: f"Cluster {c}")
+        return seg
+
+    seg = _timed(timings, "segment_customers", _segment)
+    _write(seg, args.out_dir, "customer_segments", timings)
+    return timings
+
+
+def _leakage_branch_duckdb(args: argparse.Namespace) -> list:
+    from src import duckdb_engine
+
+    timings = []
+    params = {"percentile": args.percentile, "min_peer_n": args.min_peer_n}
+    out_path = os.path.join(args.out_dir, "leakage_flags.parquet")
+    _timed(timings, "leakage_flags", duckdb_engine.leakage_flags, args.input, out_path=out_path, **params)
+
+    peers = _timed(timings, "peer_benchmarks", duckdb_engine.peer_benchmarks, args.input, percentile=args.percentile)
+    _write(peers, args.out_dir, "peer_benchmarks", timings)
+
+    cust_leak = _timed(timings, "leakage_summary_by_customer", duckdb_engine.leakage_summary_by_customer, args.input, **params)
+    _write(cust_leak, args.out_dir, "leakage_by_customer", timings)
+
+    rep_leak = _timed(timings, "leakage_summary_by_rep", duckdb_engine.leakage_summary_by_rep, args.input, **params)
+    _write(rep_leak, args.out_dir, "leakage_by_rep", timings)
+    return timings
+
+
+def _leakage_branch(df: pd.DataFrame | None, args: argparse.Namespace) -> list:
+    if args.engine == "duckdb":
+        return _leakage_branch_duckdb(args)
+    timings = []
+    rep_leak = None
+    if args.shards > 1:
+        # Flags per region shard; the rep leaderboard is merged from the shards' partials
+        from src.sharding import sharded_leakage
+
+        flagged, rep_leak = _timed(
+            timings, "leakage_flags", sharded_leakage,
+            df, percentile=args.percentile, min_peer_n=args.min_peer_n, workers=args.shards,
+            approx_distinct=args.approx_distinct,
+        )
+    else:
+        fn, data = _stage(args, df, "leakage_flags")
+        flagged = _timed(timings, "leakage_flags", fn, data, percentile=args.percentile, min_peer_n=args.min_peer_n)
+    _write(flagged, args.out_dir, "leakage_flags", timings)
+
+    fn, _ = _stage(args, df, "peer_benchmarks")
+    peers = _timed(timings, "peer_benchmarks", fn, flagged)
+    _write(peers, args.out_dir, "peer_benchmarks", timings)
+
+    fn, _ = _stage(args, df, "leakage_summary_by_customer")
+    cust_leak = _timed(timings, "leakage_summary_by_customer", fn, flagged)
+    _write(cust_leak, args.out_dir, "leakage_by_customer", timings)
+
+    if rep_leak is None:
+        fn, _ = _stage(args, df, "leakage_summary_by_rep")
+        rep_leak = _timed(timings, "leakage_summary_by_rep", fn, flagged)
+    _write(rep_leak, args.out_dir, "leakage_by_rep", timings)
+    return timings
+
+
+BRANCHES = [_price_raise_branch, _segmentation_branch, _leakage_branch]
+
+
+def _configure_process(args: argparse.Namespace):
+    """Runs in the parent and in every worker (spawned workers inherit nothing)."""
+    set_low_memory(args.low_memory)
+    set_default_backend(args.backend)
+    result_cache.configure(args.cache_dir, args.cache_max_mb)
+    if not args.instrument:
+        return
+    instrument.enable(trace_memory=args.trace_memory)
+    if args.log_json:
+        instrument.log_to(args.log_json)
+
+
+def _run_branch(branch, df: pd.DataFrame | str | None, args: argparse.Namespace) -> tuple[list, list]:
+    _configure_process(args)
+    if isinstance(df, str):
+        df = column_store.open_store(df)
+    spans = instrument.start_collecting(args.instrument, trace_memory=args.trace_memory)
+    return branch(df, args), spans or []
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m src.batch", description="Run the pricing pipeline end to end without the UI.")
+    p.add_argument("--out-dir", required=True, help="Directory for Parquet outputs + run_manifest.json")
+
+    g = p.add_argument_group("data")
+    g.add_argument("--input", default=None, help="CSV/Parquet transaction extract (default: synthetic data)")
+    g.add_argument("--rejects", default=None, help="Side file for rejected rows (default: <out-dir>/rejects.csv)")
+    g.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    g.add_argument("--n-rows", type=int, default=80000, help="Synthetic rows (ignored with --input)")
+    g.add_argument("--seed", type=int, default=42, help="Synthetic seed (ignored with --input)")
+    g.add_argument("--write-transactions", action="store_true", help="Also write the input transactions")
+    g.add_argument(
+        "--store-dir", default=os.environ.get("PRICING_STORE_DIR") or None,
+        help="Memory-mapped column store shared with the pages and branch workers (src.column_store); also PRICING_STORE_DIR",
+    )
+
+    g = p.add_argument_group("price raise (Price Raise Engine defaults)")
+    g.add_argument("--price-increase", type=float, default=2.0, help="Simulated price increase in %%")
+    g.add_argument("--w-elasticity", type=float, default=0.35)
+    g.add_argument("--w-margin", type=float, default=0.30)
+    g.add_argument("--w-rev-uplift", type=float, default=0.25)
+    g.add_argument("--w-vol-risk", type=float, default=0.10)
+    g.add_argument("--t1", type=float, default=0.65)
+    g.add_argument("--t2", type=float, default=0.45)
+
+    g = p.add_argument_group("segmentation + leakage (Discount Leakage Engine defaults)")
+    g.add_argument("--k", type=int, default=5)
+    g.add_argument("--prev-model", default=None, help="Previous segmentation_model.npz, keeps cluster labels stable")
+    g.add_argument("--percentile", type=float, default=DEFAULT_PERCENTILE)
+    g.add_argument("--min-peer-n", type=int, default=DEFAULT_MIN_PEER_N)
+
+    p.add_argument("--workers", type=int, default=len(BRANCHES), help="Parallel branch workers (1 = run serially)")
+    p.add_argument(
+        "--shards", type=int, default=1,
+        help="Worker processes per leakage / customer-feature stage (src.sharding; pandas backend)",
+    )
+    p.add_argument(
+        "--backend", choices=BACKENDS, default=os.environ.get("PRICING_BACKEND", "pandas"),
+        help="Aggregation backend (src.backends); also PRICING_BACKEND",
+    )
+    p.add_argument(
+        "--engine", choices=("memory", "duckdb"), default="memory",
+        help="memory: load the data, then run the backend; duckdb: out of core over a Parquet --input",
+    )
+    p.add_argument(
+        "--approx-distinct", action="store_true",
+        help="HyperLogLog estimates for customer / rep distinct counts (src.sketches)",
+    )
+    p.add_argument(
+        "--low-memory", action="store_true",
+        default=os.environ.get("PRICING_LOW_MEMORY", "") not in ("", "0"),
+        help="Compact dtypes + float32 outputs (src.memory); also PRICING_LOW_MEMORY=1",
+    )
+
+    g = p.add_argument_group("result cache")
+    g.add_argument(
+        "--cache-dir", default=os.environ.get("PRICING_CACHE_DIR") or None,
+        help="Shared on-disk result cache (src.result_cache); also PRICING_CACHE_DIR",
+    )
+    g.add_argument("--cache-max-mb", type=float, default=float(os.environ.get("PRICING_CACHE_MAX_MB", result_cache.DEFAULT_MAX_MB)))
+
+    g = p.add_argument_group("instrumentation")
+    g.add_argument("--instrument", action="store_true", help="Record nested src/ spans into the manifest")
+    g.add_argument("--trace-memory", action="store_true", help="Also record peak allocation per span (tracemalloc, slower)")
+    g.add_argument("--log-json", default=None, help="Append span records as JSON lines to this file (needs --instrument)")
+    return p
+
+
+def _load(args: argparse.Namespace) -> pd.DataFrame:
+    if args.input:
+        rejects = args.rejects or os.path.join(args.out_dir, "rejects.csv")
+        return load_transactions(args.input, chunk_rows=args.chunk_rows, reject_path=rejects, float_dtype=float_dtype())
+    df = make_synthetic_transactions(n_rows=args.n_rows, seed=args.seed)
+    return compact_transactions(df) if args.low_memory else df
+
+
+def _source(args: argparse.Namespace) -> tuple:
+    # The src.shared_data source keys, so the pages and batch runs share one store
+    if args.input:
+        path = os.path.abspath(args.input)
+        return ("file", path, os.path.getmtime(path))
+    return ("synthetic", args.n_rows, args.seed)
+
+
+def run(args: argparse.Namespace) -> dict:
+    if args.engine == "duckdb" and not (args.input and not args.input.lower().endswith(".csv")):
+        raise ValueError("--engine duckdb needs a Parquet --input (file, directory or glob)")
+    if args.shards > 1 and (args.engine != "memory" or args.backend != "pandas"):
+        raise ValueError("--shards needs --engine memory and --backend pandas")
+    if args.approx_distinct and args.engine != "memory":
+        raise ValueError("--approx-distinct needs --engine memory")
+    os.makedirs(args.out_dir, exist_ok=True)
+    t0 = time.perf_counter()
+
+    _configure_process(args)
+    spans = instrument.start_collecting(args.instrument, trace_memory=args.trace_memory)
+
+    timings = []
+    if args.engine == "duckdb":
+        df = None  # every stage scans args.input itself
+    elif args.store_dir:
+        column_store.configure(args.store_dir)
+        df = _timed(timings, "load_transactions", column_store.get_or_build, _source(args), lambda: _load(args))
+    else:
+        df = _timed(timings, "load_transactions", _load, args)
+    if args.write_transactions and df is not None:
+        _write(df, args.out_dir, "transactions", timings)
+
+    if args.workers <= 1:
+        results = [_run_branch(branch, df, args) for branch in BRANCHES]
+    else:
+        # Store-backed: workers map the store by path instead of unpickling their own copy
+        data = (column_store.store_of(df) if df is not None else None) or df
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(BRANCHES))) as pool:
+            futures = [pool.submit(_run_branch, branch, data, args) for branch in BRANCHES]
+            results = [f.result() for f in futures]
+    for branch_timings, branch_spans in results:
+        timings += branch_timings
+        if spans is not None:
+            spans += branch_spans
+
+    manifest = {
+        "params": {k: v for k, v in vars(args).items() if k != "out_dir"},
+        "ingest": df.attrs.get("ingest_report") if df is not None else None,
+        "total_seconds": round(time.perf_counter() - t0, 4),
+        "stages": timings,
+        "spans": spans,
+        "outputs": sorted(f for f in os.listdir(args.out_dir) if f.endswith((".parquet", ".npz"))),
+    }
+    with open(os.path.join(args.out_dir, "run_manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    manifest = run(args)
+    for t in manifest["stages"]:
+        print(f"{t['stage']:<36} {t['seconds']:>9.3f}s  rows={t['rows_out']!s:>9}  peak_rss={t['peak_rss_mb']:>8.1f}MB")
+    print(f"total {manifest['total_seconds']:.3f}s -> {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
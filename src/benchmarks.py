@@ -0,0 +1,339 @@
+"""
+Scale benchmarks for every pipeline stage, with a regression check.
+
+    python -m src.benchmarks run --sizes 1e4,1e5,1e6 --skus 300,3000 --customers 500,50000 \
+        --out bench_results/current.json
+    python -m src.benchmarks compare bench_results/baseline.json bench_results/current.json --threshold 0.25
+    python -m src.benchmarks precision --rows 1e6
+
+Each (stage, rows, skus, customers) case runs in a fresh spawned process: the
+stage input is built first (untimed), then the stage is timed `--repeat` times
+(best wall time kept) while a sampler thread tracks peak RSS. Results are stored
+as JSON with environment metadata. `compare` exits non-zero when any case is
+slower than baseline by more than the threshold. `precision` runs the batch
+pipeline in default and low-memory mode (src.memory), checks every output against
+FLOAT32_RTOL and prints peak RSS per stage for both.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.memory import FLOAT32_RTOL, rss_mb
+from src.synth_data import make_synthetic_transactions
+from src.model_elasticity import derive_elasticity_cube
+from src.uplift import compute_price_lift_impact
+from src.poc2_features import build_customer_features
+from src.poc2_segmentation import SEGMENT_FEATURES, segment_customers
+from src.poc2_leakage import (
+    leakage_flags,
+    leakage_summary_by_customer,
+    leakage_summary_by_rep,
+)
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+MIN_SECONDS = 0.05  # below this, timing noise dominates the regression check
+
+
+def _synthetic_cube(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "avg_price": rng.lognormal(3.1, 0.5, n),
+        "avg_units": rng.lognormal(3.5, 0.6, n),
+        "avg_margin": rng.uniform(0.2, 0.45, n),
+        "elasticity": np.clip(rng.normal(-1.6, 0.5, n), -4.0, -0.05),
+    })
+
+
+def _synthetic_customer_features(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    d = pd.DataFrame({c: rng.lognormal(0, 1, n) for c in SEGMENT_FEATURES})
+    d.insert(0, "customer_id", np.arange(n))
+    return d
+
+
+def _txns(case):
+    return make_synthetic_transactions(case["rows"], seed=42, n_skus=case["skus"], n_customers=case["customers"])
+
+
+# stage -> (setup(case) -> input, run(input))
+STAGES = {
+    "derive_elasticity_cube": (_txns, derive_elasticity_cube),
+    "compute_price_lift_impact": (lambda c: _synthetic_cube(c["rows"]), lambda cube: compute_price_lift_impact(cube, 2.0)),
+    "leakage_flags": (_txns, leakage_flags),
+    "leakage_summary_by_customer": (lambda c: leakage_flags(_txns(c)), leakage_summary_by_customer),
+    "leakage_summary_by_rep": (lambda c: leakage_flags(_txns(c)), leakage_summary_by_rep),
+    "build_customer_features": (_txns, build_customer_features),
+    "segment_customers": (lambda c: _synthetic_customer_features(c["rows"]), segment_customers),
+}
+
+
+def _run_case(case: dict, repeat: int, conn):
+    setup, fn = STAGES[case["stage"]]
+    data = setup(case)
+    base = rss_mb()
+
+    peak = [base]
+    stop = threading.Event()
+
+    def _sample():
+        while not stop.is_set():
+            peak[0] = max(peak[0], rss_mb())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=_sample, daemon=True)
+    sampler.start()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(data)
+        times.append(time.perf_counter() - t0)
+        del out
+    stop.set()
+    sampler.join()
+
+    conn.send({
+        "seconds": min(times),
+        "seconds_all": times,
+        "input_rows": len(data),
+        "base_rss_mb": round(base, 1),
+        "peak_rss_mb": round(peak[0], 1),
+        "stage_rss_mb": round(peak[0] - base, 1),
+        "status": "ok",
+    })
+
+
+def run_case(case: dict, repeat: int = 3, timeout: float = 1800.0) -> dict:
+    ctx = mp.get_context("spawn")
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_run_case, args=(case, repeat, send))
+    proc.start()
+    send.close()  # so a crashed child shows up as EOF instead of waiting out the timeout
+    result = {"status": "timeout"}
+    if recv.poll(timeout):
+        try:
+            result = recv.recv()
+        except EOFError:
+            proc.join()
+            result = {"status": f"crashed (exit {proc.exitcode})"}
+    proc.terminate()
+    proc.join()
+    return {**case, **result}
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(stages, sizes, skus, customers, repeat: int, timeout: float) -> dict:
+    results = []
+    for stage in stages:
+        for n in sizes:
+            for n_skus in skus:
+                for n_cust in customers:
+                    case = {"stage": stage, "rows": int(n), "skus": int(n_skus), "customers": int(n_cust)}
+                    r = run_case(case, repeat=repeat, timeout=timeout)
+                    results.append(r)
+                    secs = f"{r['seconds']:.3f}s" if r["status"] == "ok" else r["status"]
+                    print(f"{stage:<30} rows={n:>10,} skus={n_skus:>6,} customers={n_cust:>8,}  {secs:>10}  "
+                          f"peak_rss={r.get('peak_rss_mb', float('nan')):>8.1f}MB", flush=True)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def _case_key(r: dict) -> tuple:
+    return (r["stage"], r["rows"], r["skus"], r["customers"])
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_seconds: float = MIN_SECONDS) -> list[dict]:
+    """Rows for every case present in both runs; `regression` marks slowdowns beyond threshold."""
+    base = {_case_key(r): r for r in baseline["results"] if r["status"] == "ok"}
+    rows = []
+    for r in current["results"]:
+        b = base.get(_case_key(r))
+        if b is None or r["status"] != "ok":
+            continue
+        ratio = r["seconds"] / max(b["seconds"], 1e-9)
+        rows.append({
+            "stage": r["stage"], "rows": r["rows"], "skus": r["skus"], "customers": r["customers"],
+            "base_s": b["seconds"], "current_s": r["seconds"], "ratio": round(ratio, 3),
+            "base_rss_mb": b["peak_rss_mb"], "current_rss_mb": r["peak_rss_mb"],
+            "regression": ratio > 1 + threshold and r["seconds"] >= min_seconds,
+        })
+    return rows
+
+
+# output -> key columns used to align rows across the two runs (None = row order)
+PRECISION_OUTPUTS = {
+    "elasticity_cube": ["sku", "segment", "region"],
+    "price_lift_impact": ["sku", "segment", "region"],
+    "customer_features": ["customer_id"],
+    "customer_segments": ["customer_id"],
+    "leakage_flags": None,
+    "peer_benchmarks": ["sku", "segment", "region"],
+    "leakage_by_customer": ["customer_id"],
+    "leakage_by_rep": ["sales_rep_id"],
+}
+
+# Distinct-value counts may drop where float32 merges near-equal continuous synthetic
+# prices (cent-rounded real prices stay distinct); they only gate the elasticity fits,
+# whose outputs are checked on their own.
+PRECISION_COUNT_COLUMNS = {"unique_prices"}
+
+
+def _batch_run(out_dir: str, rows: int, low_memory: bool) -> dict:
+    cmd = [sys.executable, "-m", "src.batch", "--out-dir", out_dir, "--n-rows", str(rows)]
+    if low_memory:
+        cmd.append("--low-memory")
+    env = {k: v for k, v in os.environ.items() if k != "PRICING_LOW_MEMORY"}
+    subprocess.run(cmd, check=True, env=env, stdout=subprocess.DEVNULL)
+    with open(os.path.join(out_dir, "run_manifest.json")) as f:
+        return json.load(f)
+
+
+def compare_outputs(full_dir: str, low_dir: str, rtol: float = FLOAT32_RTOL) -> list[dict]:
+    """
+    One row per output column. Floats: max |low - full| scaled by the column's max |full|
+    (plus rows where only one side is NaN). Everything else (flags, tiers, clusters,
+    keys): count of mismatching rows.
+    """
+    rows = []
+    for name, keys in PRECISION_OUTPUTS.items():
+        full = pd.read_parquet(os.path.join(full_dir, f"{name}.parquet"))
+        low = pd.read_parquet(os.path.join(low_dir, f"{name}.parquet"))
+        if keys:
+            full = full.sort_values(keys, key=lambda c: c.astype(str), kind="stable").reset_index(drop=True)
+            low = low.sort_values(keys, key=lambda c: c.astype(str), kind="stable").reset_index(drop=True)
+        if len(full) != len(low):
+            rows.append({"output": name, "column": "<rows>", "max_scaled_err": None, "mismatches": abs(len(full) - len(low)), "ok": False})
+            continue
+        for c in full.columns:
+            a, b = full[c], low[c]
+            if pd.api.types.is_float_dtype(a):
+                a64, b64 = a.to_numpy(np.float64), b.to_numpy(np.float64)
+                nan = np.isnan(a64)
+                bad = int((nan != np.isnan(b64)).sum())
+                a64, b64 = a64[~nan], b64[~nan]
+                scale = max(float(np.abs(a64).max()), 1e-12) if len(a64) else 1.0
+                err = float(np.abs(a64 - b64).max()) / scale if len(a64) else 0.0
+                rows.append({"output": name, "column": c, "max_scaled_err": err, "mismatches": bad, "ok": err <= rtol and bad == 0})
+            else:
+                bad = int((a.astype(str).to_numpy() != b.astype(str).to_numpy()).sum())
+                rows.append({"output": name, "column": c, "max_scaled_err": None, "mismatches": bad, "ok": bad == 0 or c in PRECISION_COUNT_COLUMNS})
+    return rows
+
+
+def precision_check(rows: int, rtol: float = FLOAT32_RTOL) -> tuple[pd.DataFrame, pd.DataFrame]:
+    with tempfile.TemporaryDirectory() as tmp:
+        full_dir, low_dir = os.path.join(tmp, "full"), os.path.join(tmp, "low")
+        full = _batch_run(full_dir, rows, low_memory=False)
+        low = _batch_run(low_dir, rows, low_memory=True)
+        diffs = pd.DataFrame(compare_outputs(full_dir, low_dir, rtol))
+
+    rss = (
+        pd.DataFrame(full["stages"])[["stage", "seconds", "peak_rss_mb"]]
+        .merge(pd.DataFrame(low["stages"])[["stage", "seconds", "peak_rss_mb"]], on="stage", suffixes=("_full", "_low"))
+    )
+    return diffs, rss
+
+
+def _parse_sizes(s: str) -> list[int]:
+    return [int(float(x)) for x in s.split(",") if x]
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.benchmarks")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="Run the benchmark grid and write JSON results")
+    r.add_argument("--stages", default="all", help=f"Comma list or 'all' ({', '.join(STAGES)})")
+    r.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="Row counts, e.g. 1e4,1e5,1e6,1e7")
+    r.add_argument("--skus", default="300", help="SKU cardinalities, e.g. 300,3000")
+    r.add_argument("--customers", default="500", help="Customer cardinalities, e.g. 500,50000")
+    r.add_argument("--repeat", type=int, default=3)
+    r.add_argument("--timeout", type=float, default=1800.0, help="Per-case timeout in seconds")
+    r.add_argument("--out", default=None, help="Results JSON (default: bench_results/<timestamp>.json)")
+
+    c = sub.add_parser("compare", help="Flag slowdowns of CURRENT against BASELINE")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, 0.25 = +25%%")
+    c.add_argument("--min-seconds", type=float, default=MIN_SECONDS)
+
+    pr = sub.add_parser("precision", help="Check low-memory mode outputs against float64 and compare peak RSS per stage")
+    pr.add_argument("--rows", type=float, default=1e6)
+    pr.add_argument("--rtol", type=float, default=FLOAT32_RTOL)
+
+    args = p.parse_args(argv)
+
+    if args.cmd == "precision":
+        diffs, rss = precision_check(int(args.rows), args.rtol)
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(diffs.to_string(index=False))
+            print()
+            print(rss.to_string(index=False))
+        bad = diffs[~diffs["ok"]]
+        if len(bad):
+            print(f"\n{len(bad)} output column(s) outside tolerance (rtol={args.rtol:g}) or mismatching")
+            return 1
+        print(f"\nAll outputs within rtol={args.rtol:g}")
+        return 0
+
+    if args.cmd == "run":
+        stages = list(STAGES) if args.stages == "all" else args.stages.split(",")
+        unknown = [s for s in stages if s not in STAGES]
+        if unknown:
+            p.error(f"unknown stage(s): {', '.join(unknown)}")
+        report = run_suite(
+            stages, _parse_sizes(args.sizes), _parse_sizes(args.skus), _parse_sizes(args.customers),
+            repeat=args.repeat, timeout=args.timeout,
+        )
+        out = args.out or os.path.join("bench_results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"results -> {out}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold, args.min_seconds)
+    if not rows:
+        print("No comparable cases between the two runs.")
+        return 0
+    print(pd.DataFrame(rows).to_string(index=False))
+    regressions = [r for r in rows if r["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond +{args.threshold:.0%}")
+        return 1
+    print(f"\nNo regressions beyond +{args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Plotly builders with an automatic large-data mode.
+
+Below LARGE_DATA_ROWS the charts are the same px figures the pages always drew.
+Above it, histograms are binned server-side with NumPy, scatters switch to
+WebGL with stratified downsampling (or a binned density heatmap for very large
+inputs), and hover data is trimmed to the identifying columns.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+LARGE_DATA_ROWS = 10000     # switch to large-data mode above this many rows
+SCATTER_MAX_POINTS = 10000  # points actually sent for a downsampled scatter
+DENSITY_ROWS = 250000       # above this, scatters become a 2D density heatmap
+HOVER_COLS_LARGE = 2        # hover columns kept in large-data mode
+
+
+def stratified_sample(df: pd.DataFrame, by: str | None, n: int, seed: int = 0) -> pd.DataFrame:
+    """Proportional sample of ~n rows, keeping each `by` group's share."""
+    if len(df) <= n:
+        return df
+    if by is None:
+        return df.sample(n, random_state=seed)
+    frac = n / len(df)
+    return df.groupby(by, group_keys=False, observed=True).sample(frac=frac, random_state=seed)
+
+
+def histogram(df: pd.DataFrame, x: str, title: str, nbins: int | None = None, max_rows: int = LARGE_DATA_ROWS):
+    if len(df) <= max_rows:
+        return px.histogram(df, x=x, nbins=nbins, title=title)
+
+    s = df[x]
+    if not pd.api.types.is_numeric_dtype(s):
+        counts = s.value_counts(sort=False)
+        return px.bar(x=counts.index.astype(str), y=counts.values, labels={"x": x, "y": "count"}, title=title)
+
+    v = s.to_numpy(dtype=np.float64)
+    v = v[np.isfinite(v)]
+    counts, edges = np.histogram(v, bins=nbins or 40)
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges)))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title="count", bargap=0)
+    return fig
+
+
+def scatter(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    title: str,
+    color: str | None = None,
+    hover_data: list[str] | None = None,
+    max_rows: int = LARGE_DATA_ROWS,
+):
+    if len(df) <= max_rows:
+        return px.scatter(df, x=x, y=y, color=color, hover_data=hover_data, title=title)
+
+    if len(df) > DENSITY_ROWS:
+        xv = df[x].to_numpy(dtype=np.float64)
+        yv = df[y].to_numpy(dtype=np.float64)
+        ok = np.isfinite(xv) & np.isfinite(yv)
+        counts, xe, ye = np.histogram2d(xv[ok], yv[ok], bins=100)
+        fig = go.Figure(go.Heatmap(
+            x=(xe[:-1] + xe[1:]) / 2,
+            y=(ye[:-1] + ye[1:]) / 2,
+            z=counts.T,
+            colorscale="Viridis",
+            colorbar={"title": "rows"},
+        ))
+        fig.update_layout(title=f"{title} (density, {len(df):,} rows)", xaxis_title=x, yaxis_title=y)
+        return fig
+
+    sample = stratified_sample(df, color, SCATTER_MAX_POINTS)
+    hover = (hover_data or [])[:HOVER_COLS_LARGE]
+    return px.scatter(
+        sample,
+        x=x,
+        y=y,
+        color=color,
+        hover_data=hover,
+        render_mode="webgl",
+        title=f"{title} (sample of {len(sample):,} / {len(df):,})",
+    )
+
+
+def show_chart(build, name: str, stats: list | None = None):
+    """Builds and renders a figure, recording timing + the figure for the debug panel."""
+    t0 = time.perf_counter()
+    fig = build()
+    st.plotly_chart(fig, use_container_width=True)
+    if stats is not None:
+        stats.append({"chart": name, "render_ms": (time.perf_counter() - t0) * 1000, "fig": fig})
+    return fig
+
+
+def chart_stats_frame(stats: list) -> pd.DataFrame:
+    """Payload size (serialized figure JSON) and render time per chart."""
+    rows = []
+    for s in stats:
+        fig = s["fig"]
+        rows.append({
+            "chart": s["chart"],
+            "trace_type": ", ".join(sorted({t.type for t in fig.data})),
+            "points_sent": int(sum(len(t.x) if getattr(t, "x", None) is not None else 0 for t in fig.data)),
+            "payload_kb": len(fig.to_json()) / 1024,
+            "render_ms": s["render_ms"],
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,283 @@
+"""
+Read-only, memory-mapped columnar store for the transaction dataset.
+
+Every Streamlit replica and worker process on one server that opens the same
+store maps the same files: column data lives once in the OS page cache instead
+of once per process, and opening a store reads no column data up front.
+
+One store per data source, under PRICING_STORE_DIR (or configure()):
+
+  <dir>/<digest>/meta.json         row count, column names, dtypes, categories
+  <dir>/<digest>/<i>.npy           numeric / datetime column i
+  <dir>/<digest>/<i>.codes.npy     categorical column i (codes; categories in meta)
+
+Key columns are stored categorical (object columns are encoded on write), the
+layout src.memory.compact_transactions and src.ingest already produce. Opened
+frames are built with copy=False from np.load(mmap_mode="r") arrays, so every
+column is a zero-copy, read-only view of the mapped file: a stage that tried to
+modify the base frame in place raises instead of silently diverging. Derived
+frames that only need some columns take src.memory.column_view rather than
+df[cols], which copies.
+
+A store is written to a temp directory and renamed into place under an flock,
+so concurrent first loads build it once and readers never see a partial store.
+Every synthetic slider setting and every new upload mtime is a new source, so
+after each build the least recently opened stores are removed until the
+directory is under PRICING_STORE_MAX_MB (default 4096). Processes that still
+map a removed store keep reading it; the next open rebuilds it.
+
+    python -m src.column_store build --input extract.parquet
+    python -m src.column_store check --rows 5e5 --processes 4
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from src.memory import column_view, low_memory, private_rss_mb, rss_mb
+
+FORMAT_VERSION = 1
+STORE_MAX_MB = float(os.environ.get("PRICING_STORE_MAX_MB", 4096))
+STORED_ATTRS = ("ingest_report",)
+
+_dir = os.environ.get("PRICING_STORE_DIR", "")
+
+
+def configure(store_dir: str | None):
+    """Enables the store in `store_dir` (None / "" disables it)."""
+    global _dir
+    _dir = store_dir or ""
+
+
+def enabled() -> bool:
+    return bool(_dir)
+
+
+def store_path(source: tuple) -> str:
+    """Store directory for a data source (the low-memory layout is a separate store)."""
+    key = f"{FORMAT_VERSION}|{source!r}|{low_memory()}"
+    return os.path.join(_dir, hashlib.blake2b(key.encode(), digest_size=16).hexdigest())
+
+
+def store_of(df: pd.DataFrame) -> str | None:
+    """Path of the store backing `df`, if it was opened from one."""
+    return df.attrs.get("column_store")
+
+
+# -----------------------------
+# Write / open
+# -----------------------------
+def write_store(df: pd.DataFrame, path: str) -> str:
+    """Writes `df` (RangeIndex) as a store at `path`; an existing store there is kept."""
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        columns = []
+        for i, (name, s) in enumerate(df.items()):
+            if s.dtype == object:
+                s = s.astype("category")
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                np.save(os.path.join(tmp, f"{i}.codes.npy"), s.cat.codes.to_numpy())
+                cats = s.cat.categories
+                columns.append({
+                    "name": name, "kind": "category", "ordered": bool(s.cat.ordered),
+                    "categories": cats.tolist(), "categories_dtype": str(cats.dtype),
+                })
+            elif s.dtype.kind in "biufcmM":
+                np.save(os.path.join(tmp, f"{i}.npy"), s.to_numpy())
+                columns.append({"name": name, "kind": "array", "dtype": str(s.dtype)})
+            else:
+                raise ValueError(f"Column {name!r} of dtype {s.dtype} cannot be stored")
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            # The ingest report travels with the data, so pages can still show rejects
+            attrs = {k: df.attrs[k] for k in STORED_ATTRS if k in df.attrs}
+            json.dump({"format": FORMAT_VERSION, "n_rows": len(df), "columns": columns, "attrs": attrs}, f)
+        try:
+            os.rename(tmp, path)
+        except OSError:  # another process finished the same store first
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                raise
+    finally:
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+    return path
+
+
+def open_store(path: str) -> pd.DataFrame:
+    """Zero-copy, read-only frame over the mapped column files."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    data = {}
+    for i, col in enumerate(meta["columns"]):  # np.asarray: plain ndarray views, the map stays their base
+        if col["kind"] == "category":
+            codes = np.asarray(np.load(os.path.join(path, f"{i}.codes.npy"), mmap_mode="r"))
+            cats = pd.Index(col["categories"], dtype=col["categories_dtype"])
+            data[col["name"]] = pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(cats, col["ordered"]))
+        else:
+            data[col["name"]] = np.asarray(np.load(os.path.join(path, f"{i}.npy"), mmap_mode="r"))
+    df = pd.DataFrame(data, index=pd.RangeIndex(meta["n_rows"]), copy=False)
+    df.attrs.update(meta.get("attrs", {}))
+    df.attrs["column_store"] = path
+    return df
+
+
+def get_or_build(source: tuple, load: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """The store for `source`, built from `load()` by the first process that needs it."""
+    path = store_path(source)
+    meta = os.path.join(path, "meta.json")
+    if not os.path.exists(meta):
+        os.makedirs(_dir, exist_ok=True)
+        with open(os.path.join(_dir, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(meta):
+                    write_store(load().reset_index(drop=True), path)
+                    evict_stores(STORE_MAX_MB, keep=[path])
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    try:
+        os.utime(meta)  # last opened, for evict_stores
+        return open_store(path)
+    except FileNotFoundError:  # evicted by another process's build in between
+        return get_or_build(source, load)
+
+
+def _size_mb(path: str) -> float:
+    return sum(e.stat().st_size for e in os.scandir(path) if e.is_file()) / 1e6
+
+
+def evict_stores(max_mb: float = STORE_MAX_MB, keep: list[str] = ()) -> int:
+    """
+    Removes the least recently opened stores until the directory is under `max_mb`.
+    `keep` and builds in progress (no meta.json yet) stay. Call under the store lock.
+    """
+    keep = {os.path.abspath(p) for p in keep}
+    stores, total = [], 0.0
+    for name in os.listdir(_dir):
+        path = os.path.abspath(os.path.join(_dir, name))
+        if not os.path.isdir(path):
+            continue
+        size = _size_mb(path)
+        total += size
+        meta = os.path.join(path, "meta.json")
+        if path in keep or not os.path.exists(meta):
+            keep.add(path)
+        else:
+            stores.append((os.path.getmtime(meta), size, path))
+    for _, size, path in sorted(stores):  # least recently opened first
+        if total <= max_mb:
+            keep.add(path)
+        else:
+            total -= size
+    return remove_stores(keep=list(keep))
+
+
+def remove_stores(keep: list[str] = ()) -> int:
+    """Deletes every store under the configured directory except `keep`."""
+    keep = {os.path.abspath(p) for p in keep}
+    removed = 0
+    for name in os.listdir(_dir):
+        path = os.path.join(_dir, name)
+        if os.path.isdir(path) and os.path.abspath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)  # open maps stay valid
+            removed += 1
+    return removed
+
+
+# -----------------------------
+# CLI: build / clear / check
+# -----------------------------
+def _worker_memory(path: str, shared: bool, barrier) -> dict:
+    """Holds the dataset (mapped, or an own in-memory copy), reports memory once all peers hold theirs."""
+    before = private_rss_mb()
+    df = open_store(path) if shared else open_store(path).copy()
+    for c in df.columns:  # fault every page in
+        s = df[c]
+        (s.cat.codes if isinstance(s.dtype, pd.CategoricalDtype) else s).to_numpy().sum()
+    barrier.wait()
+    out = {"private_mb": private_rss_mb() - before, "rss_mb": rss_mb()}
+    barrier.wait()
+    return out
+
+
+def check(rows: int, processes: int) -> pd.DataFrame:
+    """Stored vs in-memory stage outputs, then per-process memory with and without the store."""
+    import multiprocessing as mp
+
+    from src.backends import PANDAS, _stage_calls, assert_same_frame
+    from src.synth_data import make_synthetic_transactions
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        df = make_synthetic_transactions(rows, seed=7)
+        path = write_store(df, os.path.join(tmp, "store"))
+        stored = open_store(path)
+        expected = df.astype({c: "category" for c in df.columns if df[c].dtype == object})
+        pd.testing.assert_frame_equal(stored, expected)
+        arrays = [stored[c].to_numpy() for c in stored if not isinstance(stored[c].dtype, pd.CategoricalDtype)]
+        assert not any(a.flags.writeable for a in arrays)
+
+        ref = _stage_calls(PANDAS, expected, PANDAS.leakage_flags(expected))
+        got = _stage_calls(PANDAS, stored, PANDAS.leakage_flags(stored))
+        for stage in ref:
+            assert_same_frame(got[stage](), ref[stage]())
+        view = column_view(stored, ["net_price", "units"])
+        assert np.shares_memory(view["net_price"].to_numpy(), stored["net_price"].to_numpy())
+        results.append({"check": f"stored == in-memory for {len(ref)} stages, column_view is zero-copy"})
+
+        ctx = mp.get_context("fork")
+        for label, shared in [("own frame per process", False), ("shared column store", True)]:
+            t0 = time.perf_counter()
+            with ctx.Manager() as manager, ctx.Pool(processes) as pool:
+                barrier = manager.Barrier(processes)
+                mem = pool.starmap(_worker_memory, [(path, shared, barrier)] * processes)
+            private = [m["private_mb"] for m in mem]
+            results.append({
+                "check": f"{processes} processes, {label}",
+                "private_mb_per_process": round(float(np.mean(private)), 1),
+                "private_mb_total": round(float(np.sum(private)), 1),
+                "seconds": round(time.perf_counter() - t0, 2),
+            })
+    return pd.DataFrame(results)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.column_store")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("build", help="Build the store for a data source ahead of the first page load")
+    c.add_argument("--input", default=None, help="CSV/Parquet extract (default: the synthetic page dataset)")
+    c.add_argument("--dir", default=_dir, required=not _dir, help="Store directory (default: PRICING_STORE_DIR)")
+    c = sub.add_parser("clear", help="Remove every store in the directory")
+    c.add_argument("--dir", default=_dir, required=not _dir, help="Store directory (default: PRICING_STORE_DIR)")
+    c = sub.add_parser("check", help="Stored vs in-memory outputs and per-process memory")
+    c.add_argument("--rows", default="5e5")
+    c.add_argument("--processes", type=int, default=4)
+    args = p.parse_args(argv)
+
+    if args.cmd == "check":
+        print(check(int(float(args.rows)), args.processes).to_string(index=False))
+        return 0
+    configure(args.dir)
+    if args.cmd == "clear":
+        print(f"removed {remove_stores()} stores from {args.dir}")
+        return 0
+    from src.shared_data import default_source, file_source, load_source
+
+    source = file_source(args.input) if args.input else default_source()
+    df = get_or_build(source, lambda: load_source(source))
+    print(f"{store_of(df)}: {len(df)} rows, {len(df.columns)} columns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+"""
+Sparse within-category cross-price elasticities, fitted per segment.
+
+derive_elasticity_cube estimates own-price elasticity only. This module adds
+substitution between SKUs of the same category: with a positive cross
+elasticity e[i, j], a raise on SKU j moves volume onto SKU i.
+
+The transactions carry no time axis, so the variation comes from customers: each
+customer (within a segment) is a market with its own mix of prices across SKUs.
+
+  log units[m, i] = a[i] + e[i, i] log price[m, i] + sum_j e[i, j] log price[m, j]
+
+Log prices and log units are averaged per (customer, SKU) and demeaned per SKU
+(the a[i] fixed effects). A neighbour the customer did not buy enters at its
+mean price (0 after demeaning). A SKU's category is its most frequent category
+in the transactions.
+
+Neighbours j of i are screened within i's category. They need at least
+`min_pair_n` shared customers, and at most `max_neighbors` are kept, ranked by
+the correlation of i's log units with j's log price. The regressions of all of
+a segment's SKUs then form one block-diagonal sparse least-squares system,
+solved with scipy.sparse.linalg.lsqr. Its `damp` is the ridge penalty that
+shrinks weakly supported effects toward 0. The own-price column is scaled up so
+it is barely penalized; the own elasticity itself still comes from the cube.
+
+fit_cross_elasticity returns one row per (segment, sku, other_sku) effect. It is
+a DataFrame, so it goes through the result cache like the cube. cross_operator
+turns it into one sparse (cube rows x cube rows) matrix. The cross-driven
+volume shift of every cube row for a per-row price change is then one mat-vec,
+which compute_price_lift_impact(cross=...) applies.
+
+    python -m src.cross_elasticity fit --out cross.csv
+    python -m src.cross_elasticity check --skus 3000
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import lsqr
+
+from src.instrument import instrumented
+
+MAX_NEIGHBORS = 10
+MIN_PAIR_N = 20
+DAMP = 2.0
+OWN_SCALE = 10.0  # own-price column multiplier: its ridge penalty is 1 / OWN_SCALE**2 of the cross terms'
+CROSS_CLIP = 1.0  # plausible band for a single cross elasticity
+
+CROSS_COLUMNS = ["segment", "sku", "other_sku", "cross_elasticity", "pair_n"]
+
+
+# -----------------------------
+# Fit
+# -----------------------------
+def _sku_categories(sku_codes: np.ndarray, cat_codes: np.ndarray, n_skus: int, n_cats: int) -> np.ndarray:
+    """Most frequent category code per SKU code."""
+    counts = np.bincount(sku_codes * n_cats + cat_codes, minlength=n_skus * n_cats).reshape(n_skus, n_cats)
+    return counts.argmax(axis=1)
+
+
+def _screen(lp: sp.csc_matrix, lu: sp.csc_matrix, max_neighbors: int, min_pair_n: int) -> list[np.ndarray]:
+    """Neighbour column indices per column of one category's (customer x SKU) panels."""
+    present = lp.copy()
+    present.data = np.ones_like(present.data)
+    n = (present.T @ present).tocoo()
+    sxy = (lu.T @ lp).tocsr()
+    sxx = (present.T @ lp.multiply(lp)).tocsr()
+    syy = (lu.multiply(lu).T @ present).tocsr()
+
+    keep = (n.row != n.col) & (n.data >= min_pair_n)
+    rows, cols = n.row[keep], n.col[keep]
+    if not len(rows):
+        return [cols] * lp.shape[1]
+    denom = np.sqrt(np.asarray(sxx[rows, cols]).ravel() * np.asarray(syy[rows, cols]).ravel())
+    corr = np.abs(np.asarray(sxy[rows, cols]).ravel()) / np.where(denom > 0, denom, np.inf)
+
+    order = np.lexsort((-corr, rows))
+    rows, cols = rows[order], cols[order]
+    starts = np.searchsorted(rows, np.arange(lp.shape[1] + 1))
+    return [cols[starts[i]:min(starts[i + 1], starts[i] + max_neighbors)] for i in range(lp.shape[1])]
+
+
+def _fit_segment(seg: pd.DataFrame, n_skus: int, sku_cat: np.ndarray, max_neighbors: int, min_pair_n: int, damp: float):
+    """(sku, other_sku, cross_elasticity, pair_n) code arrays for one segment's transactions."""
+    m_codes, _ = pd.factorize(seg["customer_id"])
+    cell = pd.DataFrame({
+        "m": m_codes,
+        "i": seg["sku_code"].to_numpy(),
+        "lp": np.log(seg["net_price"].to_numpy(dtype=np.float64)),
+        "lu": np.log(seg["units"].to_numpy(dtype=np.float64)),
+    }).groupby(["m", "i"], sort=False).mean().reset_index()
+    cell[["lp", "lu"]] -= cell.groupby("i")[["lp", "lu"]].transform("mean")
+
+    blocks, targets, params = [], [], []
+    for cat in np.unique(sku_cat[cell["i"].to_numpy()]):
+        c = cell[sku_cat[cell["i"].to_numpy()] == cat]
+        skus = np.unique(c["i"].to_numpy())
+        col = np.searchsorted(skus, c["i"].to_numpy())
+        shape = (int(m_codes.max()) + 1, len(skus))
+        lp = sp.csc_matrix((c["lp"].to_numpy(), (c["m"].to_numpy(), col)), shape=shape)
+        lu = sp.csc_matrix((c["lu"].to_numpy(), (c["m"].to_numpy(), col)), shape=shape)
+        lp_rows = lp.tocsr()
+        for k, nbrs in enumerate(_screen(lp, lu, max_neighbors, min_pair_n)):
+            if not len(nbrs):
+                continue
+            markets = lp.indices[lp.indptr[k]:lp.indptr[k + 1]]
+            cols = np.concatenate([[k], nbrs])
+            scale = np.ones(len(cols))
+            scale[0] = OWN_SCALE
+            blocks.append(lp_rows[markets][:, cols] @ sp.diags(scale))
+            targets.append(lu[markets, k].toarray().ravel())
+            params.append((skus[k], skus[nbrs], markets, lp[markets][:, nbrs]))
+    if not blocks:
+        return (np.empty(0, np.int64),) * 2 + (np.empty(0), np.empty(0, np.int64))
+
+    coef = lsqr(sp.block_diag(blocks, format="csr"), np.concatenate(targets), damp=damp, atol=1e-8, btol=1e-8)[0]
+    out_i, out_j, out_e, out_n = [], [], [], []
+    pos = 0
+    for i, nbrs, markets, shared in params:
+        out_i.append(np.full(len(nbrs), i))
+        out_j.append(nbrs)
+        out_e.append(coef[pos + 1:pos + 1 + len(nbrs)])
+        out_n.append(shared.getnnz(axis=0))
+        pos += 1 + len(nbrs)
+    return np.concatenate(out_i), np.concatenate(out_j), np.concatenate(out_e), np.concatenate(out_n)
+
+
+@instrumented
+def fit_cross_elasticity(
+    df: pd.DataFrame,
+    max_neighbors: int = MAX_NEIGHBORS,
+    min_pair_n: int = MIN_PAIR_N,
+    damp: float = DAMP,
+) -> pd.DataFrame:
+    """
+    Within-category cross elasticities per segment (module docstring), one row per
+    (segment, sku, other_sku): volume change % of `sku` per 1% change in the price
+    of `other_sku`, plus the number of customers buying both.
+    """
+    df = df.loc[(df["units"] > 0) & (df["net_price"] > 0), ["customer_id", "sku", "segment", "category", "net_price", "units"]]
+    sku_codes, skus = pd.factorize(df["sku"], sort=True)
+    cat_codes, cats = pd.factorize(df["category"], sort=True)
+    sku_cat = _sku_categories(sku_codes, cat_codes, len(skus), len(cats))
+    df = df.assign(sku_code=sku_codes)
+
+    parts = []
+    for segment, seg in df.groupby("segment", observed=True, sort=True):
+        i, j, e, n = _fit_segment(seg, len(skus), sku_cat, max_neighbors, min_pair_n, damp)
+        parts.append(pd.DataFrame({
+            "segment": segment,
+            "sku": np.asarray(skus)[i],
+            "other_sku": np.asarray(skus)[j],
+            "cross_elasticity": np.clip(e, -CROSS_CLIP, CROSS_CLIP),
+            "pair_n": n.astype(np.int64),
+        }))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=CROSS_COLUMNS)
+
+
+# -----------------------------
+# Operator over cube rows
+# -----------------------------
+def cross_operator(cross: pd.DataFrame, cube: pd.DataFrame) -> sp.csr_matrix:
+    """
+    Sparse (cube rows x cube rows) matrix M with M[r, r'] = e[sku(r), sku(r')] for
+    rows of the same segment and region. For a per-row fractional price change
+    `dp`, M @ dp is every row's cross-driven fractional volume change.
+    """
+    rows = pd.DataFrame({
+        "row": np.arange(len(cube)),
+        "sku": cube["sku"].astype(str).to_numpy(),
+        "segment": cube["segment"].astype(str).to_numpy(),
+        "region": cube["region"].astype(str).to_numpy(),
+    })
+    cross = cross.astype({"segment": str, "sku": str, "other_sku": str})
+    pairs = (
+        rows.merge(cross[["segment", "sku", "other_sku", "cross_elasticity"]], on=["segment", "sku"])
+        .merge(
+            rows.rename(columns={"row": "other_row", "sku": "other_sku"}),
+            on=["segment", "region", "other_sku"],
+        )
+    )
+    return sp.csr_matrix(
+        (pairs["cross_elasticity"].to_numpy(dtype=np.float64), (pairs["row"].to_numpy(), pairs["other_row"].to_numpy())),
+        shape=(len(cube), len(cube)),
+    )
+
+
+# -----------------------------
+# CLI: fit / check
+# -----------------------------
+def _planted_transactions(n_skus: int, n_customers: int, n_cats: int, seed: int = 7):
+    """Customer baskets with known sparse within-category cross effects; returns (txns, truth)."""
+    rng = np.random.default_rng(seed)
+    sku_cat = np.arange(n_skus) % n_cats
+    by_cat = [np.flatnonzero(sku_cat == c) for c in range(n_cats)]
+    truth = []
+    for i in range(n_skus):
+        peers = by_cat[sku_cat[i]]
+        for j in rng.choice(peers[peers != i], 3, replace=False):
+            truth.append((i, j, rng.uniform(0.2, 0.6)))
+    truth = pd.DataFrame(truth, columns=["i", "j", "e"])
+    E = sp.csr_matrix((truth["e"], (truth["i"], truth["j"])), shape=(n_skus, n_skus))
+
+    frames = []
+    segments = np.array(["DSO", "Clinic", "Small Practice", "Hospital"])
+    for m in range(n_customers):
+        cats = rng.choice(n_cats, 2, replace=False)
+        basket = np.concatenate([by_cat[c][rng.random(len(by_cat[c])) < 0.5] for c in cats])
+        lp = np.zeros(n_skus)
+        lp[basket] = rng.normal(0, 0.3, len(basket))
+        lu = 3.0 - 1.5 * lp[basket] + E[basket] @ lp + rng.normal(0, 0.1, len(basket))
+        frames.append(pd.DataFrame({
+            "customer_id": f"CUST_{m}",
+            "segment": segments[m % len(segments)],
+            "sku": [f"SKU_{i}" for i in basket],
+            "category": [f"CAT_{c}" for c in sku_cat[basket]],
+            "net_price": 20.0 * np.exp(lp[basket]),
+            "units": np.maximum(np.rint(np.exp(lu)), 1),
+        }))
+    truth["sku"] = [f"SKU_{i}" for i in truth["i"]]
+    truth["other_sku"] = [f"SKU_{j}" for j in truth["j"]]
+    return pd.concat(frames, ignore_index=True), truth[["sku", "other_sku", "e"]]
+
+
+def check(n_skus: int, n_customers: int) -> pd.DataFrame:
+    """Recovery of planted effects, shrinkage on the page dataset, and plan evaluation time."""
+    from src.synth_data import make_synthetic_transactions
+    from src.uplift import compute_price_lift_impact
+
+    results = []
+    txns, truth = _planted_transactions(n_skus, n_customers, n_cats=max(n_skus // 300, 2))
+    t0 = time.perf_counter()
+    cross = fit_cross_elasticity(txns)
+    fit_s = time.perf_counter() - t0
+    got = truth.merge(cross, on=["sku", "other_sku"], how="left")
+    found = got["cross_elasticity"].notna()
+    spurious = cross.merge(truth, on=["sku", "other_sku"], how="left")["e"].isna()
+    results.append({
+        "check": f"planted: {n_skus} SKUs, {len(txns):,} rows",
+        "effects": len(cross),
+        "true_found": round(float(found.mean()), 3),
+        "corr_with_truth": round(float(np.corrcoef(got.loc[found, "e"], got.loc[found, "cross_elasticity"])[0, 1]), 3),
+        "mean_abs_spurious": round(float(cross.loc[spurious.to_numpy(), "cross_elasticity"].abs().mean()), 3),
+        "seconds": round(fit_s, 2),
+    })
+
+    null = fit_cross_elasticity(make_synthetic_transactions(200_000, seed=42))
+    results.append({
+        "check": "page dataset (no cross effects)",
+        "effects": len(null),
+        "mean_abs_spurious": round(float(null["cross_elasticity"].abs().mean()), 3) if len(null) else 0.0,
+    })
+
+    rng = np.random.default_rng(0)
+    skus = np.unique(txns["sku"])
+    cube = pd.MultiIndex.from_product(
+        [skus, np.unique(txns["segment"]), ["Northeast", "South", "Midwest", "West"]], names=["sku", "segment", "region"],
+    ).to_frame(index=False)
+    cube["category"] = cube["sku"].map(txns.drop_duplicates("sku").set_index("sku")["category"])
+    cube["avg_price"] = rng.lognormal(3.1, 0.5, len(cube))
+    cube["avg_units"] = rng.lognormal(3.5, 0.6, len(cube))
+    cube["avg_margin"] = rng.uniform(0.2, 0.45, len(cube))
+    cube["elasticity"] = np.clip(rng.normal(-1.6, 0.5, len(cube)), -4.0, -0.05)
+    t0 = time.perf_counter()
+    M = cross_operator(cross, cube)
+    op_s = time.perf_counter() - t0
+    plan = dict(price_increase_pct=3.0, raise_categories=("CAT_0",))
+    own = compute_price_lift_impact(cube, **plan)
+    times = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        with_cross = compute_price_lift_impact(cube, **plan, cross=M)
+        times.append(time.perf_counter() - t0)
+    dp = np.where(cube["category"].to_numpy() == "CAT_0", 0.03, 0.0)
+    t0 = time.perf_counter()
+    shift = M @ dp
+    matvec_ms = (time.perf_counter() - t0) * 1e3
+    expected = cube["avg_units"].to_numpy() * (1 + cube["elasticity"].to_numpy() * dp + shift)
+    np.testing.assert_allclose(with_cross["new_units"].to_numpy(), expected, rtol=1e-5)
+    moved = (with_cross["new_units"].to_numpy() != own["new_units"].to_numpy()).sum()
+    results.append({
+        "check": f"plan: +3% on CAT_0, {len(cube):,} cube rows",
+        "effects": M.nnz,
+        "operator_mb": round((M.data.nbytes + M.indices.nbytes + M.indptr.nbytes) / 1e6, 1),
+        "dense_mb": round(len(cube) ** 2 * 8 / 1e6, 1),
+        "operator_s": round(op_s, 2),
+        "matvec_ms": round(matvec_ms, 2),
+        "plan_ms": round(float(np.median(times)) * 1e3, 1),
+        "rows_moved": int(moved),
+    })
+    return pd.DataFrame(results)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.cross_elasticity")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("fit", help="Fit the cross elasticities and write them as CSV")
+    c.add_argument("--input", default=None, help="CSV/Parquet extract (default: the synthetic page dataset)")
+    c.add_argument("--out", required=True)
+    c.add_argument("--max-neighbors", type=int, default=MAX_NEIGHBORS)
+    c.add_argument("--min-pair-n", type=int, default=MIN_PAIR_N)
+    c.add_argument("--damp", type=float, default=DAMP)
+    c = sub.add_parser("check", help="Planted-effect recovery and plan evaluation time")
+    c.add_argument("--skus", type=int, default=3000)
+    c.add_argument("--customers", type=int, default=2000)
+    args = p.parse_args(argv)
+
+    if args.cmd == "check":
+        print(check(args.skus, args.customers).to_string(index=False))
+        return 0
+    from src.shared_data import default_source, file_source, load_source
+
+    df = load_source(file_source(args.input) if args.input else default_source())
+    cross = fit_cross_elasticity(df, args.max_neighbors, args.min_pair_n, args.damp)
+    cross.to_csv(args.out, index=False)
+    print(f"wrote {args.out} ({len(cross):,} effects)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
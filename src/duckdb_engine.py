@@ -0,0 +1,502 @@
+"""
+Embedded DuckDB engine: the elasticity and leakage stages straight over Parquet
+(optional dependency: pip install duckdb).
+
+For transaction history that does not fit in RAM. Everything runs in-process
+(no server) against a Parquet file, a directory of Parquet files or a glob;
+DuckDB streams the files, runs multi-threaded and spills to `temp_dir` once it
+reaches `memory_limit`. Only the (small) results come back as pandas frames,
+with the same columns, dtypes and row order as the pandas functions:
+
+  derive_elasticity_cube        summary + per-cell regression sufficient statistics
+  build_customer_features       customer rollup
+  leakage_flags                 peer quantiles + flags (or COPY to Parquet via out_path)
+  peer_benchmarks               one row per peer group
+  leakage_summary_by_customer / leakage_summary_by_rep
+
+"First" values follow file + row order, like pandas over the concatenated files.
+Null keys follow pandas too: they form no group (no peer group, no customer or
+rep row), and leakage_flags keeps their rows unflagged with peer_n 0.
+The input is expected to be validated already (e.g. transactions written by
+`python -m src.batch --write-transactions`); rejects are not handled here.
+
+    python -m src.duckdb_engine check --sizes 1e6 --files 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+from src.memory import float_dtype, peak_rss_mb, reset_peak_rss, rss_mb
+
+DEFAULT_MEMORY_LIMIT = os.environ.get("PRICING_DUCKDB_MEMORY", "2GB")
+DEFAULT_TEMP_DIR = os.environ.get("PRICING_DUCKDB_TEMP", os.path.join(tempfile.gettempdir(), "pricing_duckdb"))
+
+KEYS = ["sku", "segment", "region"]
+
+# level -> (group columns, min_rows, min_unique_prices), as in model_elasticity
+ELASTICITY_LEVELS = {
+    "e_sku_seg_reg": (["sku", "segment", "region"], 60, 6),
+    "e_sku_seg": (["sku", "segment"], 150, 8),
+    "e_sku": (["sku"], 300, 10),
+    "e_seg_reg": (["segment", "region"], 800, 10),
+    "e_global": ([], 3000, 15),
+}
+
+
+def connect(memory_limit: str = DEFAULT_MEMORY_LIMIT, temp_dir: str = DEFAULT_TEMP_DIR, threads: int | None = None):
+    os.makedirs(temp_dir, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = '{memory_limit}'")
+    con.execute(f"SET temp_directory = {_quote(temp_dir)}")
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    return con
+
+
+def _quote(s: str) -> str:
+    return "'" + str(s).replace("'", "''") + "'"
+
+
+def _scan(path: str) -> str:
+    """read_parquet over a file, a directory (recursively) or a glob, with row order columns."""
+    if os.path.isdir(path):
+        path = os.path.join(path, "**", "*.parquet")
+    return f"read_parquet({_quote(path)}, filename = true, file_row_number = true)"
+
+
+def _txn(path: str) -> str:
+    # _ord orders rows like pandas over the concatenated files; per-row math matches leakage_flags
+    return f"""
+        SELECT
+            * EXCLUDE (filename, file_row_number),
+            {{'f': filename, 'r': file_row_number}} AS _ord,
+            (list_price - net_price) / (list_price + 1e-9) AS discount_pct,
+            (net_price - unit_cost) / (net_price + 1e-9) AS gm_pct_txn,
+            net_price * units AS revenue,
+            (net_price - unit_cost) * units AS gm
+        FROM {_scan(path)}
+    """
+
+
+@contextmanager
+def _connection(con=None):
+    """The caller's connection, or one opened for this call and closed after it."""
+    if con is not None:
+        yield con
+        return
+    con = connect()
+    try:
+        yield con
+    finally:
+        con.close()
+
+
+def _run(con, sql: str, params: list | None = None) -> pd.DataFrame:
+    with _connection(con) as con:
+        return con.execute(sql, params or []).df()
+
+
+def _not_null(cols: list[str]) -> str:
+    return " AND ".join(f"{c} IS NOT NULL" for c in cols)
+
+
+# -----------------------------
+# Elasticity
+# -----------------------------
+@instrumented(name="duckdb.elasticity_stats")
+def elasticity_stats(path: str, con=None) -> pd.DataFrame:
+    """
+    Per-cell sufficient statistics of the log-log fit for every fallback level
+    (GROUPING SETS, one scan): n, n_prices (distinct), mean_x, mean_y, sxx, sxy
+    with x = ln(net_price), y = ln(units) over rows with units > 0 and net_price > 0.
+    Slope = sxy / sxx. `level` names the ELASTICITY_LEVELS entry.
+    """
+    sets = ", ".join("(" + ", ".join(cols) + ")" for cols, _, _ in ELASTICITY_LEVELS.values())
+    gid = "grouping(sku, segment, region)"
+    df = _run(con, f"""
+        SELECT
+            sku, segment, region, {gid} AS gid,
+            regr_count(ln(units), ln(net_price)) AS n,
+            count(DISTINCT net_price) AS n_prices,
+            regr_avgx(ln(units), ln(net_price)) AS mean_x,
+            regr_avgy(ln(units), ln(net_price)) AS mean_y,
+            regr_sxx(ln(units), ln(net_price)) AS sxx,
+            regr_sxy(ln(units), ln(net_price)) AS sxy
+        FROM {_scan(path)}
+        WHERE units > 0 AND net_price > 0
+        GROUP BY GROUPING SETS ({sets})
+    """)
+    # grouping() bit i is set when the i-th of (sku, segment, region) is aggregated away
+    level_of_gid = {
+        sum(1 << (2 - i) for i, k in enumerate(KEYS) if k not in cols): level
+        for level, (cols, _, _) in ELASTICITY_LEVELS.items()
+    }
+    df.insert(0, "level", df.pop("gid").map(level_of_gid))
+    return df
+
+
+def _slopes(stats: pd.DataFrame, level: str) -> pd.DataFrame:
+    cols, min_rows, min_unique = ELASTICITY_LEVELS[level]
+    s = stats[stats["level"] == level]
+    s = s[s[cols].notna().all(axis=1)]  # null keys form no group, as in pandas
+    ok = (s["n"] >= min_rows) & (s["n_prices"] >= min_unique)
+    slope = (s["sxy"] / s["sxx"]).where(ok)
+    return s[cols].assign(**{level: slope.astype("float64")})
+
+
+@instrumented(name="duckdb.derive_elasticity_cube")
+def derive_elasticity_cube(path: str, con=None) -> pd.DataFrame:
+    """Same frame as model_elasticity.derive_elasticity_cube over the whole dataset."""
+    with _connection(con) as con:
+        summary = _run(con, f"""
+            SELECT
+                sku, segment, region,
+                avg(net_price) AS avg_price,
+                avg(units) AS avg_units,
+                avg((net_price - unit_cost) / net_price) AS avg_margin,
+                arg_min(category, _ord) AS category,
+                count(*) AS n,
+                count(DISTINCT net_price) AS unique_prices
+            FROM ({_txn(path)})
+            WHERE {_not_null(KEYS)}
+            GROUP BY sku, segment, region
+            ORDER BY sku, segment, region
+        """)
+        stats = elasticity_stats(path, con)
+
+    glob = _slopes(stats, "e_global")["e_global"]
+    e_global = float(glob.iloc[0]) if len(glob) and pd.notna(glob.iloc[0]) else -1.0  # sane default
+
+    out = summary
+    for level in ("e_sku_seg_reg", "e_sku_seg", "e_sku", "e_seg_reg"):
+        out = out.merge(_slopes(stats, level), on=ELASTICITY_LEVELS[level][0], how="left")
+
+    # Final elasticity with fallbacks, clipped to the plausible band
+    out["elasticity"] = (
+        out["e_sku_seg_reg"]
+        .fillna(out["e_sku_seg"])
+        .fillna(out["e_sku"])
+        .fillna(out["e_seg_reg"])
+        .fillna(e_global)
+        .clip(-4.0, -0.05)
+    )
+    return out
+
+
+# -----------------------------
+# Customer features
+# -----------------------------
+@instrumented(name="duckdb.build_customer_features")
+def build_customer_features(path: str, con=None) -> pd.DataFrame:
+    return _run(con, f"""
+        SELECT
+            customer_id,
+            arg_min(segment, _ord) AS segment,
+            arg_min(region, _ord) AS region,
+            count(*) AS orders,
+            count(DISTINCT sku) AS sku_count,
+            count(DISTINCT category) AS category_count,
+            sum(units)::BIGINT AS total_units,
+            sum(revenue) AS total_revenue,
+            sum(gm) AS total_gm,
+            avg(discount_pct) AS avg_discount,
+            quantile_cont(discount_pct, 0.90) AS p90_discount,
+            avg(contract_flag) AS contract_share,
+            total_gm / (total_revenue + 1e-9) AS gm_pct,
+            total_revenue / (orders + 1e-9) AS aov,
+            total_units / (orders + 1e-9) AS units_per_order,
+            sku_count / (orders + 1e-9) AS sku_per_order_proxy
+        FROM ({_txn(path)})
+        WHERE customer_id IS NOT NULL
+        GROUP BY customer_id
+        ORDER BY customer_id
+    """)
+
+
+# -----------------------------
+# Leakage
+# -----------------------------
+def _flagged(path: str, percentile: float, min_peer_n: int) -> str:
+    percentile, min_peer_n = float(percentile), int(min_peer_n)
+    return f"""
+        WITH txn AS ({_txn(path)}),
+        peer AS (
+            SELECT
+                sku, segment, region,
+                avg(discount_pct) AS peer_avg_disc,
+                quantile_cont(discount_pct, {percentile}) AS peer_q_disc,
+                avg(gm_pct_txn) AS peer_avg_gm,
+                count(*) AS peer_n
+            FROM txn
+            WHERE {_not_null(KEYS)}
+            GROUP BY sku, segment, region
+        )
+        SELECT
+            t.* EXCLUDE (discount_pct, gm_pct_txn, revenue, gm),
+            t.discount_pct, t.gm_pct_txn, t.revenue, t.gm,
+            p.peer_avg_disc, p.peer_q_disc, p.peer_avg_gm, coalesce(p.peer_n, 0) AS peer_n,
+            coalesce(p.peer_n >= {min_peer_n} AND t.discount_pct > p.peer_q_disc, false) AS leakage_flag,
+            -- NULL (NaN) without a peer group, as np.clip gives in pandas
+            CASE WHEN p.peer_q_disc IS NOT NULL THEN greatest(t.discount_pct - p.peer_q_disc, 0) END AS excess_disc_pct,
+            excess_disc_pct * t.list_price * t.units AS leakage_dollars_est
+        FROM txn t
+        -- rows with a null peer key match no group: kept, never flagged
+        LEFT JOIN peer p USING (sku, segment, region)
+    """
+
+
+@instrumented(name="duckdb.leakage_flags")
+def leakage_flags(
+    path: str,
+    percentile: float = 0.90,
+    min_peer_n: int = 30,
+    columns: list[str] | None = None,
+    filters: dict | None = None,
+    out_path: str | None = None,
+    con=None,
+) -> pd.DataFrame | str:
+    """
+    Same frame as poc2_leakage.leakage_flags. `filters` ({column: value}, ANDed)
+    keeps only matching rows, e.g. one customer's drill-down. With `out_path` the
+    result is written to Parquet by DuckDB (never materialized, rows unordered)
+    and the path returned.
+    """
+    select = ", ".join(f'"{c}"' for c in columns) if columns else "* EXCLUDE (_ord)"
+    where, params = "", []
+    if filters:
+        where = "WHERE " + " AND ".join(f'"{c}" = ?' for c in filters)
+        params = list(filters.values())
+    sql = f"SELECT {select} FROM ({_flagged(path, percentile, min_peer_n)}) {where}"
+    if out_path:
+        # No global sort: the file keeps DuckDB's (parallel) output order
+        with _connection(con) as con:
+            con.execute(f"COPY ({sql}) TO {_quote(out_path)} (FORMAT PARQUET)", params)
+        return out_path
+    sql += " ORDER BY _ord"
+
+    out = _run(con, sql, params)
+    dtype = float_dtype()
+    for c in out.columns:
+        if out[c].dtype == np.float64 and dtype != "float64":
+            out[c] = out[c].astype(dtype)
+    return out
+
+
+@instrumented(name="duckdb.peer_benchmarks")
+def peer_benchmarks(path: str, percentile: float = 0.90, con=None) -> pd.DataFrame:
+    """Same frame as poc2_leakage.peer_benchmarks (groups in order of first appearance)."""
+    # GROUP BY, like drop_duplicates, treats null keys as equal
+    return _run(con, f"""
+        SELECT
+            sku, segment, region,
+            any_value(peer_avg_disc) AS peer_avg_disc,
+            any_value(peer_q_disc) AS peer_q_disc,
+            any_value(peer_avg_gm) AS peer_avg_gm,
+            any_value(peer_n) AS peer_n
+        FROM ({_flagged(path, percentile, 0)})
+        GROUP BY sku, segment, region
+        ORDER BY min(_ord)
+    """)
+
+
+@instrumented(name="duckdb.leakage_summary_by_customer")
+def leakage_summary_by_customer(
+    path: str, percentile: float = 0.90, min_peer_n: int = 30, sort: bool = True, con=None
+) -> pd.DataFrame:
+    cust = _run(con, f"""
+        SELECT
+            customer_id,
+            arg_min(segment, _ord) AS segment,
+            arg_min(region, _ord) AS region,
+            count_if(leakage_flag)::BIGINT AS leakage_txns,
+            sum(leakage_dollars_est) AS leakage_est_dollars,
+            avg(discount_pct) AS avg_discount,
+            quantile_cont(discount_pct, 0.90) AS p90_discount,
+            sum(revenue) AS revenue,
+            sum(gm) AS gm,
+            sum(gm) / (sum(revenue) + 1e-9) AS gm_pct
+        FROM ({_flagged(path, percentile, min_peer_n)})
+        WHERE customer_id IS NOT NULL
+        GROUP BY customer_id
+        ORDER BY customer_id
+    """)
+    return cust.sort_values("leakage_est_dollars", ascending=False) if sort else cust
+
+
+@instrumented(name="duckdb.leakage_summary_by_rep")
+def leakage_summary_by_rep(
+    path: str, percentile: float = 0.90, min_peer_n: int = 30, sort: bool = True, con=None
+) -> pd.DataFrame:
+    # leakage_rate counts every row, also those with a null rep (no rep row)
+    rep = _run(con, f"""
+        SELECT * FROM (
+            SELECT
+                sales_rep_id,
+                count_if(leakage_flag)::BIGINT AS leakage_txns,
+                sum(leakage_dollars_est) AS leakage_est_dollars,
+                avg(discount_pct) AS avg_discount,
+                sum(revenue) AS revenue,
+                sum(gm) AS gm,
+                count(DISTINCT customer_id) AS customers,
+                count(DISTINCT sku) AS skus,
+                sum(gm) / (sum(revenue) + 1e-9) AS gm_pct,
+                count_if(leakage_flag) / (sum(count(*)) OVER () + 1e-9) AS leakage_rate
+            FROM ({_flagged(path, percentile, min_peer_n)})
+            GROUP BY sales_rep_id
+        )
+        WHERE sales_rep_id IS NOT NULL
+        ORDER BY sales_rep_id
+    """)
+    return rep.sort_values("leakage_est_dollars", ascending=False) if sort else rep
+
+
+# -----------------------------
+# Check + benchmark against the pandas path
+# -----------------------------
+def _write_dataset(out_dir: str, rows: int, files: int, seed: int = 7, null_keys: bool = False) -> pd.DataFrame:
+    from src.backends import with_null_key, with_null_peer_keys
+    from src.synth_data import make_synthetic_transactions
+
+    df = make_synthetic_transactions(rows, seed=seed)
+    if null_keys:
+        df = with_null_peer_keys(df)
+        for i, c in enumerate(("customer_id", "sales_rep_id", "sku")):
+            df = with_null_key(df, c, every=89, start=11 * (i + 1))
+    os.makedirs(out_dir, exist_ok=True)
+    for i, part in enumerate(np.array_split(np.arange(rows), files)):
+        df.iloc[part].to_parquet(os.path.join(out_dir, f"part-{i:04d}.parquet"), index=False)
+    return df
+
+
+def _stages(path: str, con) -> dict:
+    """stage -> (pandas over the files, duckdb over the files)."""
+    from src.model_elasticity import derive_elasticity_cube as pd_cube
+    from src.poc2_features import build_customer_features as pd_features
+    from src import poc2_leakage as pl_
+
+    def _pandas_flags():
+        return pl_.leakage_flags(pd.read_parquet(path))
+
+    return {
+        "derive_elasticity_cube": (
+            lambda: pd_cube(pd.read_parquet(path)),
+            lambda: derive_elasticity_cube(path, con=con),
+        ),
+        "build_customer_features": (
+            lambda: pd_features(pd.read_parquet(path)),
+            lambda: build_customer_features(path, con=con),
+        ),
+        "leakage_flags": (_pandas_flags, lambda: leakage_flags(path, con=con)),
+        "peer_benchmarks": (
+            lambda: pl_.peer_benchmarks(_pandas_flags()),
+            lambda: peer_benchmarks(path, con=con),
+        ),
+        "leakage_summary_by_customer": (
+            lambda: pl_.leakage_summary_by_customer(_pandas_flags(), sort=False),
+            lambda: leakage_summary_by_customer(path, sort=False, con=con),
+        ),
+        "leakage_summary_by_rep": (
+            lambda: pl_.leakage_summary_by_rep(_pandas_flags(), sort=False),
+            lambda: leakage_summary_by_rep(path, sort=False, con=con),
+        ),
+    }
+
+
+def check_equivalence(path: str, con=None, stages=None):
+    """Asserts every stage (or `stages`) gives the pandas frame over the same files."""
+    from src.backends import assert_same_frame
+
+    with _connection(con) as con:
+        for stage, (pandas_fn, duck_fn) in _stages(path, con).items():
+            if stages and stage not in stages:
+                continue
+            try:
+                assert_same_frame(duck_fn(), pandas_fn())
+            except AssertionError as e:
+                raise AssertionError(f"duckdb != pandas for {stage} ({path}): {e}") from None
+
+
+def _measure(fn):
+    """(result, seconds, peak RSS growth over the current RSS in MB)."""
+    base = rss_mb()
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0, peak_rss_mb() - base
+
+
+def check(rows: int, files: int, memory_limit: str) -> pd.DataFrame:
+    from src.backends import assert_same_frame
+    from src import poc2_leakage as pl_
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, "data")
+        _write_dataset(data, rows, files)
+        con = connect(memory_limit=memory_limit)
+
+        results = []
+        for stage, (pandas_fn, duck_fn) in _stages(data, con).items():
+            expected, pandas_s, pandas_rss = _measure(pandas_fn)
+            got, duck_s, duck_rss = _measure(duck_fn)
+            try:
+                assert_same_frame(got, expected)
+            except AssertionError as e:
+                raise AssertionError(f"duckdb != pandas for {stage} ({rows:,} rows): {e}") from None
+            del expected, got
+            results.append({
+                "stage": stage, "rows": rows,
+                "pandas_s": round(pandas_s, 3), "duckdb_s": round(duck_s, 3),
+                "speedup": round(pandas_s / max(duck_s, 1e-9), 2),
+                "pandas_peak_rss_mb": round(pandas_rss, 1), "duckdb_peak_rss_mb": round(duck_rss, 1),
+            })
+
+        # Null peer / customer / rep / SKU keys: same rows and semantics as pandas
+        nulls = os.path.join(tmp, "nulls")
+        _write_dataset(nulls, rows, files, null_keys=True)
+        check_equivalence(nulls, con)
+
+        # Out-of-core: flags written straight to Parquet vs materialize + to_parquet
+        out = os.path.join(tmp, "flags")
+        os.makedirs(out)
+        _, pandas_s, pandas_rss = _measure(
+            lambda: pl_.leakage_flags(pd.read_parquet(data)).to_parquet(os.path.join(out, "pandas.parquet"))
+        )
+        _, duck_s, duck_rss = _measure(lambda: leakage_flags(data, out_path=os.path.join(out, "duckdb.parquet"), con=con))
+        results.append({
+            "stage": "leakage_flags -> parquet", "rows": rows,
+            "pandas_s": round(pandas_s, 3), "duckdb_s": round(duck_s, 3),
+            "speedup": round(pandas_s / max(duck_s, 1e-9), 2),
+            "pandas_peak_rss_mb": round(pandas_rss, 1), "duckdb_peak_rss_mb": round(duck_rss, 1),
+        })
+        con.close()
+    return pd.DataFrame(results)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.duckdb_engine")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("check", help="Compare outputs, time and peak RSS against the pandas path (pandas reads the files too)")
+    c.add_argument("--sizes", default="1e5,1e6", help="Synthetic row counts")
+    c.add_argument("--files", type=int, default=4, help="Parquet files per dataset")
+    c.add_argument("--memory-limit", default=DEFAULT_MEMORY_LIMIT)
+    args = p.parse_args(argv)
+
+    frames = []
+    for n in [int(float(x)) for x in args.sizes.split(",") if x]:
+        frames.append(check(n, args.files, args.memory_limit))
+        print(f"{n:>12,} rows: outputs identical (also with null keys)", flush=True)
+    print()
+    print(pd.concat(frames).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""
+Streaming export of full results (actions, flagged transactions, rollups) to CSV
+or Parquet.
+
+Rows are written in chunks of CHUNK_ROWS: each chunk is taken from the source
+frame by position (column projection first, so only the exported columns are
+touched), encoded, written and dropped before the next one, so no export builds
+its whole file in memory. `mask` filters rows and `sort_by` ranks them like the
+page tables (src.ranking order, ties in row order) from a positions array only.
+
+    export_chunks(df, "csv", columns=[...], mask=..., sort_by="revenue_delta")  -> bytes generator
+    write_export(df, path, ...)                                                  -> file, written atomically
+
+Pages write an export to EXPORT_DIR once per data source, parameters, options and
+code version (keyed file name, reused across sessions) and serve it with
+st.download_button from disk. The directory is bounded: after every write,
+files older than PRICING_EXPORT_MAX_AGE_HOURS (default 24) are removed, then
+the least recently used ones until it is under PRICING_EXPORT_MAX_MB (default
+2048). Streamlit 1.31 still reads the finished file into its media store for
+the download, so pages only do that after "Prepare"; for multi-million-row
+extracts use the CLI, which never holds more than one chunk:
+
+    python -m src.export leakage_flags --out flags.parquet --only-flagged --columns customer_id,sku,leakage_dollars_est
+    python -m src.export check --rows 1e6
+"""
+import argparse
+import fcntl
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.memory import column_view, peak_rss_mb, reset_peak_rss, rss_mb
+from src.ranking import top_k_positions
+from src.result_cache import code_version
+
+CHUNK_ROWS = 100_000
+FORMATS = {"csv": ("text/csv", ".csv"), "parquet": ("application/vnd.apache.parquet", ".parquet")}
+EXPORT_DIR = os.environ.get("PRICING_EXPORT_DIR") or os.path.join(tempfile.gettempdir(), "pricing-exports")
+EXPORT_MAX_MB = float(os.environ.get("PRICING_EXPORT_MAX_MB", 2048))
+EXPORT_MAX_AGE_S = float(os.environ.get("PRICING_EXPORT_MAX_AGE_HOURS", 24)) * 3600
+
+
+def export_positions(df: pd.DataFrame, mask=None, sort_by: str | None = None, ascending: bool = False) -> np.ndarray | None:
+    """Row positions to export in order (None: every row as is)."""
+    if sort_by is not None:
+        return top_k_positions(df[sort_by].to_numpy(), len(df), ascending=ascending, mask=mask)
+    if mask is not None:
+        return np.flatnonzero(mask)
+    return None
+
+
+def iter_chunks(
+    df: pd.DataFrame,
+    columns: list[str] | None = None,
+    mask=None,
+    sort_by: str | None = None,
+    ascending: bool = False,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[pd.DataFrame]:
+    """Frames of at most chunk_rows rows (at least one, possibly empty, so headers / schemas exist)."""
+    view = column_view(df, list(columns) if columns is not None else list(df.columns))
+    pos = export_positions(df, mask, sort_by, ascending)
+    n = len(df) if pos is None else len(pos)
+    for start in range(0, max(n, 1), chunk_rows):
+        rows = slice(start, start + chunk_rows) if pos is None else pos[start:start + chunk_rows]
+        yield view.iloc[rows].reset_index(drop=True)
+
+
+class _Spool(io.RawIOBase):
+    """Write-only sink handing back what was written since the last drain; tell() keeps counting."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+def _encode(chunks: Iterator[pd.DataFrame], fmt: str, sink) -> Iterator[None]:
+    """Writes chunks to the binary `sink` as CSV (header once) or Parquet (a row group each), yielding after each."""
+    if fmt == "csv":
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(sink, index=False, header=i == 0)
+            yield
+        return
+    if fmt != "parquet":
+        raise ValueError(f"Unknown export format {fmt!r} (expected one of {sorted(FORMATS)})")
+    writer = None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression="zstd")
+        writer.write_table(table.cast(writer.schema))
+        yield
+    writer.close()
+    yield
+
+
+def export_chunks(df: pd.DataFrame, fmt: str = "csv", chunk_rows: int = CHUNK_ROWS, **select) -> Iterator[bytes]:
+    """File content piece by piece, one piece per chunk. `select`: columns, mask, sort_by, ascending."""
+    spool = _Spool()
+    for _ in _encode(iter_chunks(df, chunk_rows=chunk_rows, **select), fmt, spool):
+        piece = spool.drain()
+        if piece:
+            yield piece
+
+
+def write_export(df: pd.DataFrame, path: str, fmt: str | None = None, chunk_rows: int = CHUNK_ROWS, **select) -> str:
+    """Streams an export to `path` (format from the extension unless given); readers never see a partial file."""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for _ in _encode(iter_chunks(df, chunk_rows=chunk_rows, **select), fmt, f):
+                pass
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return path
+
+
+def export_path(name: str, fmt: str, key_parts: tuple) -> str:
+    """Stable file under EXPORT_DIR for one dataset, format, key (data source, parameters, options) and code version."""
+    digest = hashlib.blake2b(repr((name, fmt, key_parts, code_version())).encode(), digest_size=12).hexdigest()
+    return os.path.join(EXPORT_DIR, f"{name}-{digest}{FORMATS[fmt][1]}")
+
+
+def evict_exports(max_mb: float = EXPORT_MAX_MB, max_age_s: float = EXPORT_MAX_AGE_S, keep: str | None = None) -> int:
+    """Removes exports older than `max_age_s`, then least recently used ones until under `max_mb`."""
+    if not os.path.isdir(EXPORT_DIR):
+        return 0
+    removed = 0
+    with open(os.path.join(EXPORT_DIR, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            files = []
+            for entry in os.scandir(EXPORT_DIR):
+                if entry.is_file() and entry.name != ".lock" and entry.path != keep:
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in files) + (os.path.getsize(keep) if keep and os.path.exists(keep) else 0)
+            now = time.time()
+            for mtime, size, path in sorted(files):
+                expired = now - mtime > max_age_s
+                if not expired and (total <= max_mb * 1e6 or os.path.basename(path).startswith(".tmp-")):
+                    continue  # a recent .tmp- file is another process's export in progress
+                try:
+                    os.unlink(path)  # an open download keeps its handle
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return removed
+
+
+def cached_export(df: pd.DataFrame, name: str, fmt: str, key_parts: tuple, **select) -> str:
+    """Path of the export, writing it only if this key has not been exported yet (hits count as use)."""
+    path = export_path(name, fmt, key_parts)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        write_export(df, path, fmt, **select)
+        evict_exports(keep=path)
+    return path
+
+
+# -----------------------------
+# Page UI
+# -----------------------------
+def export_panel(name: str, label: str, df: pd.DataFrame, key_parts: tuple, filters: dict | None = None, sort_by: str | None = None):
+    """
+    Format, column and filter controls plus Prepare -> Download for one dataset.
+    `filters`: label -> row mask offered as checkboxes (all ticked ones apply).
+    """
+    import streamlit as st
+
+    c1, c2 = st.columns([1, 3])
+    fmt = c1.radio("Format", list(FORMATS), horizontal=True, key=f"export_fmt_{name}")
+    columns = c2.multiselect("Columns", list(df.columns), default=list(df.columns), key=f"export_cols_{name}")
+    mask = None
+    for flabel, fmask in (filters or {}).items():
+        if st.checkbox(flabel, key=f"export_filter_{name}_{flabel}"):
+            mask = fmask if mask is None else mask & fmask
+    if not columns:
+        st.info("Pick at least one column to export.")
+        return
+    n = len(df) if mask is None else int(np.count_nonzero(mask))
+    rows_key = None if mask is None else hashlib.blake2b(np.packbits(mask).tobytes(), digest_size=12).hexdigest()
+    key = (*key_parts, tuple(columns), rows_key, sort_by)
+    if st.button(f"Prepare {label} ({n:,} rows)", key=f"export_prepare_{name}"):
+        t0 = time.perf_counter()
+        path = cached_export(df, name, fmt, key, columns=columns, mask=mask, sort_by=sort_by)
+        st.session_state[f"export_ready_{name}"] = (path, fmt)
+        st.caption(f"Wrote {os.path.getsize(path) / 1e6:.1f} MB in {time.perf_counter() - t0:.1f}s")
+    ready = st.session_state.get(f"export_ready_{name}")
+    if ready and ready == (export_path(name, fmt, key), fmt) and os.path.exists(ready[0]):
+        with open(ready[0], "rb") as f:
+            st.download_button(
+                f"Download {label}", f, file_name=f"{name}{FORMATS[fmt][1]}",
+                mime=FORMATS[fmt][0], key=f"export_download_{name}",
+            )
+
+
+# -----------------------------
+# CLI: export / check
+# -----------------------------
+DATASETS = ("actions", "leakage_flags", "leakage_by_customer", "leakage_by_rep")
+
+
+def _dataset(name: str, df: pd.DataFrame, args) -> tuple[pd.DataFrame, dict]:
+    from src.backends import get_backend
+    from src.uplift import compute_price_lift_impact
+
+    backend = get_backend()
+    if name == "actions":
+        sim = compute_price_lift_impact(backend.derive_elasticity_cube(df), price_increase_pct=args.price_increase)
+        return sim, {"sort_by": "revenue_delta"}
+    flagged = backend.leakage_flags(df, percentile=args.percentile, min_peer_n=args.min_peer_n)
+    if name == "leakage_flags":
+        mask = flagged["leakage_flag"].to_numpy() if args.only_flagged else None
+        return flagged, {"mask": mask, "sort_by": "leakage_dollars_est" if args.only_flagged else None}
+    summary = backend.leakage_summary_by_customer if name == "leakage_by_customer" else backend.leakage_summary_by_rep
+    return summary(flagged, sort=False), {"sort_by": "leakage_est_dollars"}
+
+
+def _measured(fn):
+    """(result, seconds, peak RSS growth in MB); RSS because Arrow allocates outside tracemalloc."""
+    reset_peak_rss()
+    base = rss_mb()
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0, peak_rss_mb() - base
+
+
+def check(rows: int, chunk_rows: int) -> pd.DataFrame:
+    """
+    Chunked vs one-shot output (identical CSV bytes, equal Parquet tables), the
+    generator vs the file writer (identical bytes), and peak RSS growth of each.
+    """
+    from src.poc2_leakage import leakage_flags
+    from src.synth_data import make_synthetic_transactions
+
+    flagged = leakage_flags(make_synthetic_transactions(rows, seed=7))
+    mask = flagged["leakage_flag"].to_numpy()
+    cols = ["customer_id", "sales_rep_id", "sku", "net_price", "discount_pct", "leakage_dollars_est"]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for what, select, expected in [
+            ("all rows", {}, flagged),
+            ("flagged, projected, ranked", {"columns": cols, "mask": mask, "sort_by": "leakage_dollars_est"},
+             flagged.iloc[top_k_positions(flagged["leakage_dollars_est"].to_numpy(), len(flagged), mask=mask)][cols]),
+        ]:
+            expected = expected.reset_index(drop=True)
+            for fmt in FORMATS:
+                path = os.path.join(tmp, f"out{FORMATS[fmt][1]}")
+                _, seconds, peak = _measured(lambda: write_export(flagged, path, fmt, chunk_rows=chunk_rows, **select))
+                with open(path, "rb") as f:
+                    assert b"".join(export_chunks(flagged, fmt, chunk_rows=chunk_rows, **select)) == f.read(), what
+                ref = os.path.join(tmp, f"ref{FORMATS[fmt][1]}")
+                if fmt == "csv":
+                    _, ref_s, ref_peak = _measured(lambda: expected.to_csv(ref, index=False))
+                    with open(path, "rb") as a, open(ref, "rb") as b:
+                        assert a.read() == b.read(), what
+                else:
+                    _, ref_s, ref_peak = _measured(lambda: expected.to_parquet(ref, index=False, compression="zstd"))
+                    got = pq.read_table(path).to_pandas()
+                    pd.testing.assert_frame_equal(got, expected, check_categorical=False)
+                results.append({
+                    "export": what, "format": fmt, "rows": len(expected), "mb": round(os.path.getsize(path) / 1e6, 1),
+                    "chunked_s": round(seconds, 2), "chunked_peak_mb": round(peak, 1),
+                    "one_shot_s": round(ref_s, 2), "one_shot_peak_mb": round(ref_peak, 1),
+                })
+    return pd.DataFrame(results)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.export")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    for name in DATASETS:
+        c = sub.add_parser(name, help=f"Export the full {name.replace('_', ' ')}")
+        c.add_argument("--out", required=True, help="Output .csv / .parquet")
+        c.add_argument("--input", default=None, help="CSV/Parquet transactions (default: synthetic)")
+        c.add_argument("--n-rows", type=int, default=80000)
+        c.add_argument("--seed", type=int, default=42)
+        c.add_argument("--columns", default=None, help="Comma-separated projection")
+        c.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+        c.add_argument("--price-increase", type=float, default=2.0)
+        c.add_argument("--percentile", type=float, default=0.90)
+        c.add_argument("--min-peer-n", type=int, default=30)
+        c.add_argument("--only-flagged", action="store_true", help="leakage_flags: flagged rows only, ranked by $")
+    c = sub.add_parser("check", help="Chunked vs one-shot output and peak allocation")
+    c.add_argument("--rows", default="1e6")
+    c.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = p.parse_args(argv)
+
+    if args.cmd == "check":
+        print(check(int(float(args.rows)), args.chunk_rows).to_string(index=False))
+        return 0
+    if args.input:
+        from src.ingest import load_transactions
+
+        df = load_transactions(args.input)
+    else:
+        from src.synth_data import make_synthetic_transactions
+
+        df = make_synthetic_transactions(args.n_rows, seed=args.seed)
+    data, select = _dataset(args.cmd, df, args)
+    columns = args.columns.split(",") if args.columns else None
+    write_export(data, args.out, chunk_rows=args.chunk_rows, columns=columns, **select)
+    print(f"wrote {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
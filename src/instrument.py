@@ -0,0 +1,220 @@
+"""
+Lightweight stage instrumentation: wall time, rows in/out, peak allocation
+(tracemalloc, opt-in) and cache hit/miss per src/ function call.
+
+Recording is on when either
+  - a collector is active in the current context (pages: start_collecting()), or
+  - it is enabled process-wide (enable(); batch CLI --instrument; PRICING_INSTRUMENT=1).
+Every record is appended to the active collector and emitted as one JSON line on
+the "pricing.instrument" logger (appended to a file with log_to(), or
+PRICING_INSTRUMENT_LOG=<path> for a Streamlit server). When off, a wrapped call costs one flag check
+and one ContextVar lookup.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("pricing.instrument")
+
+_enabled = os.environ.get("PRICING_INSTRUMENT", "") not in ("", "0")
+_trace_memory = os.environ.get("PRICING_INSTRUMENT_MEMORY", "") not in ("", "0")
+_collector: contextvars.ContextVar = contextvars.ContextVar("pricing_instrument_collector", default=None)
+_spans: contextvars.ContextVar = contextvars.ContextVar("pricing_instrument_spans", default=())
+_trace_ctx: contextvars.ContextVar = contextvars.ContextVar("pricing_instrument_trace", default=False)
+
+
+def enable(trace_memory: bool = False):
+    global _enabled, _trace_memory
+    _enabled, _trace_memory = True, trace_memory
+
+
+def disable():
+    global _enabled, _trace_memory
+    _enabled, _trace_memory = False, False
+
+
+def log_to(path: str):
+    """Appends every record as a JSON line to `path` (once per process)."""
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(path, mode="a")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+if os.environ.get("PRICING_INSTRUMENT_LOG"):
+    log_to(os.environ["PRICING_INSTRUMENT_LOG"])
+
+
+def is_enabled() -> bool:
+    return _enabled or _collector.get() is not None
+
+
+def start_collecting(enabled: bool = True, trace_memory: bool = False) -> list | None:
+    """
+    Routes records in this context (e.g. one page run) into a fresh list; returns
+    None when disabled. tracemalloc is process-wide and slows every thread, so it
+    is stopped again as soon as a context stops asking for it (debug use only).
+    """
+    records = [] if enabled else None
+    _collector.set(records)
+    _trace_ctx.set(bool(enabled and trace_memory))
+    if not (enabled and trace_memory) and not _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return records
+
+
+def _tracing() -> bool:
+    return _trace_memory or _trace_ctx.get()
+
+
+def _rows(obj) -> int | None:
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(obj)
+    return None
+
+
+def _emit(record: dict):
+    records = _collector.get()
+    if records is not None:
+        records.append(record)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, default=str))
+
+
+class _Span:
+    __slots__ = ("name", "cache", "rows_in", "rows_out", "t0", "started", "mem_start", "mem_carried")
+
+    def __init__(self, name: str, rows_in: int | None = None):
+        self.name = name
+        self.cache = None
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.mem_start = None
+        self.mem_carried = 0
+
+
+def _enter(span: _Span):
+    stack = _spans.get()
+    if _tracing():
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if stack:
+            # Keep the parent's running peak before resetting for the child
+            parent = stack[-1]
+            parent.mem_carried = max(parent.mem_carried, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        span.mem_start = tracemalloc.get_traced_memory()[0]
+    _spans.set(stack + (span,))
+    span.started = time.time()
+    span.t0 = time.perf_counter()
+
+
+def _exit(span: _Span, error: BaseException | None = None):
+    seconds = time.perf_counter() - span.t0
+    stack = _spans.get()
+    _spans.set(stack[:-1])
+
+    peak_mb = None
+    if span.mem_start is not None and tracemalloc.is_tracing():
+        peak = max(tracemalloc.get_traced_memory()[1], span.mem_carried)
+        peak_mb = round(max(peak - span.mem_start, 0) / 1e6, 3)
+        if len(stack) > 1:
+            parent = stack[-2]
+            parent.mem_carried = max(parent.mem_carried, peak)
+
+    record = {
+        "stage": span.name,
+        "seconds": round(seconds, 6),
+        "rows_in": span.rows_in,
+        "rows_out": span.rows_out,
+        "peak_alloc_mb": peak_mb,
+        "cache": span.cache,
+        "depth": len(stack) - 1,
+        "pid": os.getpid(),
+        "started": span.started,
+    }
+    if error is not None:
+        record["error"] = repr(error)
+    _emit(record)
+
+
+def instrumented(fn=None, *, name: str | None = None):
+    """Decorator for src/ stage functions. Rows in = first DataFrame argument."""
+    def decorate(f):
+        stage = name or f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not (_enabled or _collector.get() is not None):
+                return f(*args, **kwargs)
+            span = _Span(stage, next((_rows(a) for a in args if _rows(a) is not None), None))
+            _enter(span)
+            try:
+                out = f(*args, **kwargs)
+            except BaseException as e:
+                _exit(span, e)
+                raise
+            span.rows_out = _rows(out)
+            _exit(span)
+            return out
+
+        return wrapper
+
+    return decorate(fn) if fn is not None else decorate
+
+
+def cached_stage(name: str):
+    """
+    Wraps a cache-decorated stage so each call records cache hit/miss.
+    The cached body must call mark_cache_miss() (it only runs on a miss).
+    """
+    def decorate(cached_fn):
+        @functools.wraps(cached_fn)
+        def wrapper(*args, **kwargs):
+            if not (_enabled or _collector.get() is not None):
+                return cached_fn(*args, **kwargs)
+            span = _Span(name)
+            span.cache = "hit"
+            _enter(span)
+            try:
+                out = cached_fn(*args, **kwargs)
+            except BaseException as e:
+                _exit(span, e)
+                raise
+            span.rows_out = _rows(out)
+            _exit(span)
+            return out
+
+        return wrapper
+
+    return decorate
+
+
+def mark_cache(status: str):
+    """Sets the cache status of the innermost span ("miss", or "disk" for src.result_cache hits)."""
+    stack = _spans.get()
+    if stack:
+        stack[-1].cache = status
+
+
+def mark_cache_miss():
+    mark_cache("miss")
+
+
+def records_frame(records: list | None) -> pd.DataFrame:
+    cols = ["stage", "cache", "seconds", "rows_in", "rows_out", "peak_alloc_mb", "depth"]
+    if not records:
+        return pd.DataFrame(columns=cols)
+    df = pd.DataFrame(records).sort_values("started", kind="stable")
+    df["stage"] = ["  " * d + s for s, d in zip(df["stage"], df["depth"])]
+    return df[cols]
@@ -0,0 +1,107 @@
+"""
+Memory budget helpers: the pipeline-wide low-memory mode and RSS probes.
+
+Low-memory mode is on with PRICING_LOW_MEMORY=1 (pages, scoring API) or
+`python -m src.batch --low-memory`. When on:
+  - transactions are held compactly: prices float32, units int32,
+    contract_flag int8, key columns categorical (the layout src.ingest produces)
+  - float outputs of compute_price_lift_impact and leakage_flags are stored as
+    float32; their arithmetic, peer quantiles and tier / flag thresholds still
+    run in float64, and regressions always fit in float64
+Independent of the mode, stages drop scratch columns as soon as they are
+consumed and take `columns=` to return only what the caller needs; outputs that
+carry input columns reference them through column_view instead of copying.
+
+`python -m src.benchmarks precision` re-checks both modes against each other
+(FLOAT32_RTOL on every float output) and prints peak RSS per stage.
+"""
+import os
+import resource
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Max relative error allowed between low-memory and float64 outputs
+FLOAT32_RTOL = 1e-4
+
+_low_memory = os.environ.get("PRICING_LOW_MEMORY", "") not in ("", "0")
+
+
+def set_low_memory(on: bool):
+    global _low_memory
+    _low_memory = bool(on)
+
+
+def low_memory() -> bool:
+    return _low_memory
+
+
+def float_dtype() -> str:
+    return "float32" if _low_memory else "float64"
+
+
+def compact_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcasts a transaction frame in place to the src.ingest layout (keys categorical)."""
+    for c in ("customer_id", "sales_rep_id", "sku", "segment", "region", "category"):
+        if c in df and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype("category")
+    for c in ("list_price", "net_price", "unit_cost", "margin_pct"):
+        if c in df:
+            df[c] = df[c].astype(np.float32)
+    if "units" in df:
+        df["units"] = df["units"].astype(np.int32)
+    if "contract_flag" in df:
+        df["contract_flag"] = df["contract_flag"].astype(np.int8)
+    return df
+
+
+def column_view(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """`df[columns]` without copying: the result references df's column arrays (read-only by convention)."""
+    return pd.DataFrame({c: df[c] for c in columns}, index=df.index, copy=False)
+
+
+# -----------------------------
+# RSS probes (Linux /proc, with getrusage fallback)
+# -----------------------------
+def rss_mb() -> float:
+    """Current resident set size."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return peak_rss_mb()
+
+
+def private_rss_mb() -> float:
+    """Resident memory not shared with other processes (page cache of mapped files excluded)."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            kb = sum(int(line.split()[1]) for line in f if line.startswith(("Private_Clean:", "Private_Dirty:")))
+        return kb * 1024 / 1e6
+    except OSError:
+        return rss_mb()
+
+
+def reset_peak_rss() -> bool:
+    """Resets the process high-water mark (Linux >= 4.0) so the next peak is per stage."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS since start (or since the last successful reset_peak_rss)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024 / 1e6
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == "darwin" else rss * 1024 / 1e6
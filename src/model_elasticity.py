@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 from sklearn.linear_model import LinearRegression
 
+from src.instrument import instrumented
+
 def _loglog_elasticity(g: pd.DataFrame, min_rows: int, min_unique_prices: int) -> float | None:
     g = g[(g["units"] > 0) & (g["net_price"] > 0)].copy()
     if len(g) < min_rows:
@@ -9,25 +11,28 @@ def _loglog_elasticity(g: pd.DataFrame, min_rows: int, min_unique_prices: int) -
     if g["net_price"].nunique() < min_unique_prices:
         return None
 
-    X = np.log(g[["net_price"]].values)
-    y = np.log(g["units"].values)
+    # Always fit in float64, whatever the frame's float dtype
+    X = np.log(g[["net_price"]].to_numpy(dtype=np.float64))
+    y = np.log(g["units"].to_numpy(dtype=np.float64))
 
     # Fit log-log demand curve
     lr = LinearRegression()
     lr.fit(X, y)
     return float(lr.coef_[0])
 
+@instrumented
 def derive_elasticity_cube(df: pd.DataFrame) -> pd.DataFrame:
     """
     Returns cube with elasticity at SKU×segment×region using raw transactions,
     with fallbacks for sparse groups.
     """
-    df = df.copy()
+    # Only the columns used below (no full copy of the transaction frame)
+    df = df[["sku", "segment", "region", "category", "net_price", "units", "unit_cost"]].copy()
     df["margin_pct"] = (df["net_price"] - df["unit_cost"]) / df["net_price"]
 
     # Summary stats at the target grain
     keys = ["sku", "segment", "region"]
-    summary = df.groupby(keys).agg(
+    summary = df.groupby(keys, observed=True).agg(
         avg_price=("net_price", "mean"),
         avg_units=("units", "mean"),
         avg_margin=("margin_pct", "mean"),
@@ -38,31 +43,31 @@ def derive_elasticity_cube(df: pd.DataFrame) -> pd.DataFrame:
 
     # 1) SKU×segment×region elasticity
     esr = []
-    for k, g in df.groupby(keys):
+    for k, g in df.groupby(keys, observed=True):
         e = _loglog_elasticity(g, min_rows=60, min_unique_prices=6)
         esr.append((*k, e))
-    esr = pd.DataFrame(esr, columns=["sku", "segment", "region", "e_sku_seg_reg"])
+    esr = pd.DataFrame(esr, columns=["sku", "segment", "region", "e_sku_seg_reg"]).astype({"e_sku_seg_reg": "float64"})
 
     # 2) SKU×segment fallback
     ess = []
-    for (sku, seg), g in df.groupby(["sku", "segment"]):
+    for (sku, seg), g in df.groupby(["sku", "segment"], observed=True):
         e = _loglog_elasticity(g, min_rows=150, min_unique_prices=8)
         ess.append((sku, seg, e))
-    ess = pd.DataFrame(ess, columns=["sku", "segment", "e_sku_seg"])
+    ess = pd.DataFrame(ess, columns=["sku", "segment", "e_sku_seg"]).astype({"e_sku_seg": "float64"})
 
     # 3) SKU-only fallback
     esk = []
-    for sku, g in df.groupby(["sku"]):
+    for (sku,), g in df.groupby(["sku"], observed=True):
         e = _loglog_elasticity(g, min_rows=300, min_unique_prices=10)
         esk.append((sku, e))
-    esk = pd.DataFrame(esk, columns=["sku", "e_sku"])
+    esk = pd.DataFrame(esk, columns=["sku", "e_sku"]).astype({"e_sku": "float64"})
 
     # 4) segment×region fallback
     esr2 = []
-    for (seg, reg), g in df.groupby(["segment", "region"]):
+    for (seg, reg), g in df.groupby(["segment", "region"], observed=True):
         e = _loglog_elasticity(g, min_rows=800, min_unique_prices=10)
         esr2.append((seg, reg, e))
-    esr2 = pd.DataFrame(esr2, columns=["segment", "region", "e_seg_reg"])
+    esr2 = pd.DataFrame(esr2, columns=["segment", "region", "e_seg_reg"]).astype({"e_seg_reg": "float64"})
 
     # 5) global fallback
     e_global = _loglog_elasticity(df, min_rows=3000, min_unique_prices=15)
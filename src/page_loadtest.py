@@ -0,0 +1,369 @@
+"""
+Concurrent-analyst load test for the Streamlit engine pages. Runs entirely locally.
+
+Starts the app headless (`streamlit run Pricing_Intelligence_Platform.py` on a
+free port) and opens one websocket session per simulated analyst, speaking
+Streamlit's own protocol (tornado + streamlit.proto, both shipped with
+Streamlit). AppTest is not used: its runs share one Runtime singleton, so two
+of them cannot overlap in a process. A real server also measures what analysts
+get: sessions on server threads sharing one st.cache_resource.
+
+Each session opens one engine page and replays a scripted mix (PAGES) with
+think time: slider drags, parameter sweeps (next grid step on every action),
+selectbox drill-downs and table paging. Reported:
+  - rerun latency percentiles per page and action (rerun sent -> script finished)
+  - cache hit rate per stage, from the server's instrument records
+    (PRICING_INSTRUMENT=1, PRICING_INSTRUMENT_LOG)
+  - server RSS over time, sampled from /proc/<pid>
+
+    python -m src.page_loadtest --users 20 --seconds 60
+    python -m src.page_loadtest --users 20 --seconds 60 --env PRICING_STORE_DIR=.store --out report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = "Pricing_Intelligence_Platform.py"
+WIDGETS = ("slider", "selectbox", "number_input", "checkbox", "multiselect")
+
+# page name -> [(action, weight, widget label or label prefix, how)]
+#   how: "random" grid value / option, "sweep" next grid value (wraps around)
+PAGES = {
+    "Price_Raise_Engine": [
+        ("price_sweep", 2, "Simulate Price Increase (%)", "sweep"),
+        ("weight", 2, ("Elasticity (reward)", "Margin (reward)", "Revenue uplift (reward)", "Volume risk (penalty)"), "random"),
+        ("tier_threshold", 1, ("Tier 1 threshold (Safe Raise)", "Tier 2 threshold (Test Raise)"), "random"),
+        ("drill_down", 4, "Select SKU / Segment / Region", "random"),
+        ("page", 2, "Page (", "random"),
+    ],
+    "Discount_Leakage_Engine": [
+        ("clusters", 1, "Number of clusters (K)", "random"),
+        ("percentile_sweep", 2, "Leakage percentile threshold", "sweep"),
+        ("min_peer_n", 1, "Minimum peer transactions", "random"),
+        ("customer_drill_down", 3, "Select customer", "random"),
+        ("rep_drill_down", 3, "Select rep", "random"),
+        ("page", 2, "Page (", "random"),
+    ],
+}
+
+
+# -----------------------------
+# One analyst's websocket session
+# -----------------------------
+def _grid(w) -> np.ndarray:
+    step = w.step or 1
+    return np.round(w.min + step * np.arange(int(round((w.max - w.min) / step)) + 1), 10)
+
+
+class PageSession:
+    """A browser tab on one page: keeps its widget values and reruns like the frontend."""
+
+    def __init__(self, url: str, page: str, rng: random.Random):
+        self.url = url
+        self.page = page
+        self.rng = rng
+        self.ws = None
+        self.widgets = {}  # label -> (kind, proto) as rendered by the last run
+        self.states = {}  # widget id -> WidgetState sent on every rerun
+        self.values = {}  # label -> current value (for sweeps)
+
+    async def connect(self):
+        ws_url = "ws" + self.url.rstrip("/").removeprefix("http") + "/_stcore/stream"
+        self.ws = await websocket_connect(ws_url, max_message_size=1 << 30)
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    async def rerun(self) -> dict:
+        msg = BackMsg()
+        msg.rerun_script.page_name = self.page
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        t0 = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+
+        widgets, exceptions = {}, 0
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                raise ConnectionError("server closed the session")
+            fwd = ForwardMsg()
+            fwd.ParseFromString(raw)
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                el = fwd.delta.new_element
+                etype = el.WhichOneof("type")
+                if etype in WIDGETS:
+                    w = getattr(el, etype)
+                    widgets[w.label] = (etype, w)
+                elif etype == "exception":
+                    exceptions += 1
+            elif kind == "script_finished":
+                status = ForwardMsg.ScriptFinishedStatus.Name(fwd.script_finished)
+                break
+        seconds = time.perf_counter() - t0
+
+        # Like the frontend: only widgets rendered by this run keep their state
+        ids = {w.id for _, w in widgets.values()}
+        self.states = {i: s for i, s in self.states.items() if i in ids}
+        self.widgets = widgets
+        return {"seconds": seconds, "status": status, "exceptions": exceptions}
+
+    def _find(self, label) -> tuple[str, str] | None:
+        labels = label if isinstance(label, tuple) else (label,)
+        found = [name for name in self.widgets if any(name == l or (l.endswith("(") and name.startswith(l)) for l in labels)]
+        return self.rng.choice(found) if found else None
+
+    def act(self, label, how: str) -> bool:
+        """Changes one widget's value; False if the widget is not on the page right now."""
+        name = self._find(label)
+        if name is None:
+            return False
+        kind, w = self.widgets[name]
+        state = WidgetState(id=w.id)
+        if kind == "selectbox":
+            if not len(w.options):
+                return False
+            state.int_value = self.rng.randrange(len(w.options))
+        elif kind in ("slider", "number_input"):
+            grid = _grid(w) if kind == "slider" or w.has_max else w.min + np.arange(3) * (w.step or 1)
+            if how == "sweep":
+                cur = self.values.get(name, w.default[0] if kind == "slider" else w.default)
+                value = grid[(int(np.abs(grid - cur).argmin()) + 1) % len(grid)]
+            else:
+                value = self.rng.choice(list(grid))
+            self.values[name] = float(value)
+            if kind == "slider":
+                state.double_array_value.data.append(float(value))
+            elif w.data_type == type(w).INT:
+                state.int_value = int(value)
+            else:
+                state.double_value = float(value)
+        else:
+            return False
+        self.states[w.id] = state
+        return True
+
+
+async def _analyst(url: str, page: str, seed: int, start: float, deadline: float, think: float, results: list):
+    rng = random.Random(seed)
+    actions = PAGES[page]
+    session = PageSession(url, page, rng)
+    await asyncio.sleep(max(start - time.perf_counter(), 0))
+    try:
+        await session.connect()
+        results.append({"page": page, "action": "open", **await session.rerun(), "t": time.perf_counter()})
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(rng.expovariate(1 / think) if think > 0 else 0)
+            action, _, label, how = rng.choices(actions, weights=[a[1] for a in actions])[0]
+            if not session.act(label, how):
+                continue
+            results.append({"page": page, "action": action, **await session.rerun(), "t": time.perf_counter()})
+    except Exception as e:  # a dropped session is a result, not a harness failure
+        results.append({"page": page, "action": "error", "seconds": np.nan, "status": repr(e), "exceptions": 0, "t": time.perf_counter()})
+    finally:
+        session.close()
+
+
+# -----------------------------
+# Server, memory sampling, run
+# -----------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, env: dict, log_path: str) -> subprocess.Popen:
+    """Headless app server with instrumentation on; returns once it answers /_stcore/health."""
+    cmd = [
+        sys.executable, "-m", "streamlit", "run", APP,
+        "--server.headless", "true", "--server.port", str(port), "--server.address", "127.0.0.1",
+        "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false",
+    ]
+    proc_env = {**os.environ, "PYTHONPATH": ROOT, "PRICING_INSTRUMENT": "1", "PRICING_INSTRUMENT_LOG": log_path, **env}
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=proc_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(600):
+        if proc.poll() is not None:
+            raise RuntimeError(f"streamlit exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("streamlit did not come up within 60s")
+
+
+def _rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024 / 1e6
+    except OSError:
+        pass
+    return None
+
+
+async def _sample_memory(pid: int | None, t0: float, interval: float, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        if pid is not None:
+            rss = _rss_mb(pid)
+            samples.append({"t": round(time.perf_counter() - t0, 2), "rss_mb": None if rss is None else round(rss, 1)})
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(
+    url: str, users: int, seconds: float, think: float, ramp: float, page_share: float,
+    server_pid: int | None = None, sample_interval: float = 0.5, seed: int = 0,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Rerun records and memory samples for `users` concurrent sessions."""
+    rng = random.Random(seed)
+    results, samples = [], []
+    t0 = time.perf_counter()
+    deadline = t0 + ramp + seconds
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_memory(server_pid, t0, sample_interval, samples, stop))
+    pages = list(PAGES)
+    await asyncio.gather(*[
+        _analyst(
+            url, pages[0] if rng.random() < page_share else pages[1], seed * 1000 + i,
+            t0 + ramp * i / max(users, 1), deadline, think, results,
+        )
+        for i in range(users)
+    ])
+    stop.set()
+    await sampler
+    runs = pd.DataFrame(results, columns=["page", "action", "seconds", "status", "exceptions", "t"])
+    runs["t"] = (runs["t"] - t0).round(2)
+    return runs, pd.DataFrame(samples, columns=["t", "rss_mb"])
+
+
+# -----------------------------
+# Report
+# -----------------------------
+def latency_table(runs: pd.DataFrame) -> pd.DataFrame:
+    ok = runs[runs["action"] != "error"]
+
+    def pct(g: pd.DataFrame) -> pd.Series:
+        ms = g["seconds"].to_numpy() * 1000
+        return pd.Series({
+            "reruns": len(ms),
+            "p50_ms": np.percentile(ms, 50), "p95_ms": np.percentile(ms, 95),
+            "p99_ms": np.percentile(ms, 99), "max_ms": ms.max(),
+            "errors": int((g["exceptions"] > 0).sum() + (g["status"] != "FINISHED_SUCCESSFULLY").sum()),
+        })
+
+    if not len(ok):
+        return pd.DataFrame()
+    by_action = ok.groupby(["page", "action"]).apply(pct, include_groups=False).reset_index()
+    total = pct(ok).to_frame().T.assign(page="all", action="all")
+    out = pd.concat([by_action, total], ignore_index=True)
+    out[["reruns", "errors"]] = out[["reruns", "errors"]].astype(int)
+    return out.round(1)
+
+
+def cache_table(log_path: str, since: float = 0.0) -> pd.DataFrame:
+    """Per cached stage: calls and hit rate (a result_cache "disk" hit counts as a hit)."""
+    records = []
+    if os.path.exists(log_path):
+        with open(log_path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec.get("cache") and rec.get("started", 0) >= since:
+                    records.append(rec)
+    cols = ["stage", "calls", "hit", "disk", "miss", "hit_rate", "miss_mean_s"]
+    if not records:
+        return pd.DataFrame(columns=cols)
+    df = pd.DataFrame(records)
+    counts = pd.crosstab(df["stage"], df["cache"]).reindex(columns=["hit", "disk", "miss"], fill_value=0)
+    counts["calls"] = counts.sum(axis=1)
+    counts["hit_rate"] = ((counts["hit"] + counts["disk"]) / counts["calls"]).round(3)
+    counts["miss_mean_s"] = df[df["cache"] == "miss"].groupby("stage")["seconds"].mean().round(3)
+    return counts.reset_index()[cols]
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.page_loadtest")
+    p.add_argument("--users", type=int, default=20, help="Concurrent analyst sessions")
+    p.add_argument("--seconds", type=float, default=60.0, help="Test length after the ramp-up")
+    p.add_argument("--ramp", type=float, default=10.0, help="Sessions start evenly over this many seconds")
+    p.add_argument("--think", type=float, default=2.0, help="Mean think time between actions (exponential)")
+    p.add_argument("--price-share", type=float, default=0.5, help="Share of sessions on the Price Raise Engine")
+    p.add_argument("--url", default=None, help="Drive a running server instead (no cache / memory stats)")
+    p.add_argument("--env", action="append", default=[], help="KEY=VALUE for the started server, e.g. PRICING_STORE_DIR=.store")
+    p.add_argument("--sample-interval", type=float, default=0.5, help="Server RSS sampling period (s)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default=None, help="Also write the report (and every rerun) as JSON")
+    args = p.parse_args(argv)
+
+    proc, log_path = None, None
+    url = args.url
+    try:
+        if url is None:
+            log_path = tempfile.NamedTemporaryFile(prefix="page_loadtest-", suffix=".jsonl", delete=False).name
+            port = _free_port()
+            proc = start_server(port, dict(kv.split("=", 1) for kv in args.env), log_path)
+            url = f"http://127.0.0.1:{port}"
+        started = time.time()
+        runs, memory = asyncio.run(run_load(
+            url, args.users, args.seconds, args.think, args.ramp, args.price_share,
+            server_pid=proc.pid if proc else None, sample_interval=args.sample_interval, seed=args.seed,
+        ))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    latency = latency_table(runs)
+    cache = cache_table(log_path, since=started) if log_path else pd.DataFrame()
+    print(f"{args.users} sessions, {len(runs)} reruns in {args.ramp + args.seconds:.0f}s\n")
+    print(latency.to_string(index=False), "\n")
+    if len(cache):
+        print(cache.to_string(index=False), "\n")
+    if len(memory):
+        step = max(len(memory) // 20, 1)
+        print(memory.iloc[::step].to_string(index=False))
+        print(f"\nserver RSS: start {memory['rss_mb'].iloc[0]:.0f} MB, peak {memory['rss_mb'].max():.0f} MB, end {memory['rss_mb'].iloc[-1]:.0f} MB")
+    if log_path:
+        os.unlink(log_path)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({
+                "params": vars(args),
+                "latency": latency.to_dict("records"),
+                "cache": cache.to_dict("records"),
+                "memory": memory.to_dict("records"),
+                "reruns": runs.to_dict("records"),
+            }, f, indent=2, default=str)
+    errors = int(latency["errors"].iloc[-1]) if len(latency) else 0
+    return 0 if errors == 0 and not (runs["action"] == "error").any() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
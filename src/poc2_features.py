@@ -1,23 +1,35 @@
 import numpy as np
 import pandas as pd
 
-def build_customer_features(df: pd.DataFrame) -> pd.DataFrame:
+from src.instrument import instrumented
+from src.sketches import ROLLUPS, approx_nunique
+
+@instrumented
+def build_customer_features(df: pd.DataFrame, approx_distinct: bool = False) -> pd.DataFrame:
     """
     Customer-level features used for segmentation and leakage benchmarking.
     Expects df columns:
       customer_id, segment, region, category, list_price, net_price, unit_cost, units, contract_flag
+    approx_distinct=True estimates sku_count / category_count with HyperLogLog
+    sketches (src.sketches) instead of exact nunique.
     """
-    d = df.copy()
-    d["revenue"] = d["net_price"] * d["units"]
-    d["gm"] = (d["net_price"] - d["unit_cost"]) * d["units"]
-    d["discount_pct"] = (d["list_price"] - d["net_price"]) / (d["list_price"] + 1e-9)
+    # Only the columns used below (no full copy of the transaction frame)
+    d = df[["customer_id", "segment", "region", "sku", "category", "units", "contract_flag"]].copy()
+    # float64 per-row math even when the frame is held in float32 (src.memory)
+    net_price, unit_cost, list_price = (df[c].astype(np.float64, copy=False) for c in ("net_price", "unit_cost", "list_price"))
+    d["revenue"] = net_price * d["units"]
+    d["gm"] = (net_price - unit_cost) * d["units"]
+    d["discount_pct"] = (list_price - net_price) / (list_price + 1e-9)
 
-    cust = d.groupby(["customer_id"]).agg(
+    distinct = {
+        "sku_count": ("sku", "nunique"),
+        "category_count": ("category", "nunique"),
+    }
+    cust = d.groupby(["customer_id"], observed=True).agg(
         segment=("segment", "first"),
         region=("region", "first"),
         orders=("customer_id", "size"),
-        sku_count=("sku", "nunique"),
-        category_count=("category", "nunique"),
+        **({} if approx_distinct else distinct),
         total_units=("units", "sum"),
         total_revenue=("revenue", "sum"),
         total_gm=("gm", "sum"),
@@ -25,6 +37,10 @@ def build_customer_features(df: pd.DataFrame) -> pd.DataFrame:
         p90_discount=("discount_pct", lambda x: float(np.quantile(x, 0.90))),
         contract_share=("contract_flag", "mean"),
     ).reset_index()
+    if approx_distinct:
+        for pos, (name, (col, _)) in enumerate(distinct.items(), start=cust.columns.get_loc("orders") + 1):
+            counts = approx_nunique(d, "customer_id", col, ROLLUPS[f"customer_{name}"][2])
+            cust.insert(pos, name, counts.reindex(cust["customer_id"]).to_numpy())
 
     cust["gm_pct"] = cust["total_gm"] / (cust["total_revenue"] + 1e-9)
     cust["aov"] = cust["total_revenue"] / (cust["orders"] + 1e-9)  # avg order value
@@ -1,7 +1,24 @@
 import numpy as np
 import pandas as pd
 
-def leakage_flags(df: pd.DataFrame, percentile: float = 0.90, min_peer_n: int = 30) -> pd.DataFrame:
+from src.instrument import instrumented
+from src.memory import column_view, float_dtype
+from src.sketches import ROLLUPS, approx_nunique
+
+PEER_KEYS = ["sku", "segment", "region"]
+
+# Leakage defaults shared by the pages, the batch CLI and the scoring API
+DEFAULT_PERCENTILE = 0.90
+DEFAULT_MIN_PEER_N = 30
+
+
+@instrumented
+def leakage_flags(
+    df: pd.DataFrame,
+    percentile: float = DEFAULT_PERCENTILE,
+    min_peer_n: int = DEFAULT_MIN_PEER_N,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
     """
     Transaction-level leakage flags using peer benchmark:
       Peer group = SKU × segment × region
@@ -9,39 +26,74 @@ def leakage_flags(df: pd.DataFrame, percentile: float = 0.90, min_peer_n: int =
 
     Requires columns:
       sku, customer_id, sales_rep_id, segment, region, list_price, net_price, unit_cost, units
+
+    Returns the input columns plus discount_pct, gm_pct_txn, revenue, gm, the peer_*
+    stats, leakage_flag, excess_disc_pct and leakage_dollars_est, or only `columns`.
+    Per-row math and the peer stats run in float64 on scratch arrays; stored float
+    columns use the pipeline float dtype (src.memory).
     """
-    d = df.copy()
-    d["discount_pct"] = (d["list_price"] - d["net_price"]) / (d["list_price"] + 1e-9)
-    d["gm_pct_txn"] = (d["net_price"] - d["unit_cost"]) / (d["net_price"] + 1e-9)
-    d["revenue"] = d["net_price"] * d["units"]
-    d["gm"] = (d["net_price"] - d["unit_cost"]) * d["units"]
+    list_price = df["list_price"].to_numpy(dtype=np.float64)
+    net_price = df["net_price"].to_numpy(dtype=np.float64)
+    unit_cost = df["unit_cost"].to_numpy(dtype=np.float64)
+    units = df["units"].to_numpy(dtype=np.float64)
+
+    new = {}
+    new["discount_pct"] = (list_price - net_price) / (list_price + 1e-9)
+    new["gm_pct_txn"] = (net_price - unit_cost) / (net_price + 1e-9)
+    new["revenue"] = net_price * units
+    new["gm"] = (net_price - unit_cost) * units
 
     def q_func(x):
         return float(np.quantile(x, percentile))
 
-    peer = d.groupby(["sku", "segment", "region"]).agg(
+    # Peer stats per group, broadcast back by group code (no merge copy of every column).
+    # A row with a null peer key has no group (code -1): it indexes the appended
+    # fill value, so it gets NaN stats and peer_n 0 and is never flagged.
+    group = df.groupby(PEER_KEYS, observed=True, sort=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    peer = pd.DataFrame({"g": group, "discount_pct": new["discount_pct"], "gm_pct_txn": new["gm_pct_txn"]})
+    peer = peer[group >= 0].groupby("g").agg(
         peer_avg_disc=("discount_pct", "mean"),
         peer_q_disc=("discount_pct", q_func),
         peer_avg_gm=("gm_pct_txn", "mean"),
         peer_n=("discount_pct", "size"),
-    ).reset_index()
-
-    out = d.merge(peer, on=["sku", "segment", "region"], how="left")
+    )
+    for c in peer.columns:
+        new[c] = np.append(peer[c].to_numpy(), 0 if c == "peer_n" else np.nan)[group]
+    del peer
 
-    out["leakage_flag"] = (out["peer_n"] >= min_peer_n) & (out["discount_pct"] > out["peer_q_disc"])
+    new["leakage_flag"] = (new["peer_n"] >= min_peer_n) & (new["discount_pct"] > new["peer_q_disc"])
 
     # Excess discount % over peer threshold
-    out["excess_disc_pct"] = (out["discount_pct"] - out["peer_q_disc"]).clip(lower=0)
+    new["excess_disc_pct"] = np.clip(new["discount_pct"] - new["peer_q_disc"], 0, None)
 
     # Estimated $ impact (simple proxy): excess % * list * units
-    out["leakage_dollars_est"] = out["excess_disc_pct"] * out["list_price"] * out["units"]
+    new["leakage_dollars_est"] = new["excess_disc_pct"] * list_price * units
+
+    keep = list(df.columns) + list(new) if columns is None else columns
+    # Input columns are referenced, not copied (a column store keeps them shared)
+    out = column_view(df, [c for c in keep if c in df.columns and c not in new])
+    out.index = pd.RangeIndex(len(out))
+    dtype = float_dtype()
+    for c in keep:
+        if c in new:
+            v = new[c]
+            out[c] = v.astype(dtype, copy=False) if v.dtype.kind == "f" else v
+    return column_view(out, [c for c in keep if c in out.columns])
 
-    return out
+
+@instrumented
+def peer_benchmarks(txn_flagged: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per peer group (SKU × segment × region) from leakage_flags output:
+      peer_avg_disc, peer_q_disc, peer_avg_gm, peer_n
+    """
+    cols = PEER_KEYS + ["peer_avg_disc", "peer_q_disc", "peer_avg_gm", "peer_n"]
+    return txn_flagged[cols].drop_duplicates(PEER_KEYS).reset_index(drop=True)
 
 
-def leakage_summary_by_customer(txn_flagged: pd.DataFrame) -> pd.DataFrame:
-    d = txn_flagged.copy()
-    cust = d.groupby("customer_id").agg(
+@instrumented
+def leakage_summary_by_customer(txn_flagged: pd.DataFrame, sort: bool = True) -> pd.DataFrame:
+    cust = txn_flagged.groupby("customer_id", observed=True).agg(
         segment=("segment", "first"),
         region=("region", "first"),
         leakage_txns=("leakage_flag", "sum"),
@@ -52,20 +104,29 @@ def leakage_summary_by_customer(txn_flagged: pd.DataFrame) -> pd.DataFrame:
         gm=("gm", "sum"),
     ).reset_index()
     cust["gm_pct"] = cust["gm"] / (cust["revenue"] + 1e-9)
-    return cust.sort_values("leakage_est_dollars", ascending=False)
+    # sort=False leaves ranking to the caller (see src.ranking.top_k)
+    return cust.sort_values("leakage_est_dollars", ascending=False) if sort else cust
 
 
-def leakage_summary_by_rep(txn_flagged: pd.DataFrame) -> pd.DataFrame:
-    d = txn_flagged.copy()
-    rep = d.groupby("sales_rep_id").agg(
+@instrumented
+def leakage_summary_by_rep(txn_flagged: pd.DataFrame, sort: bool = True, approx_distinct: bool = False) -> pd.DataFrame:
+    """approx_distinct=True estimates customers / skus with HyperLogLog sketches (src.sketches)."""
+    distinct = {
+        "customers": ("customer_id", "nunique"),
+        "skus": ("sku", "nunique"),
+    }
+    rep = txn_flagged.groupby("sales_rep_id", observed=True).agg(
         leakage_txns=("leakage_flag", "sum"),
         leakage_est_dollars=("leakage_dollars_est", "sum"),
         avg_discount=("discount_pct", "mean"),
         revenue=("revenue", "sum"),
         gm=("gm", "sum"),
-        customers=("customer_id", "nunique"),
-        skus=("sku", "nunique"),
+        **({} if approx_distinct else distinct),
     ).reset_index()
+    if approx_distinct:
+        for name, (col, _) in distinct.items():
+            counts = approx_nunique(txn_flagged, "sales_rep_id", col, ROLLUPS[f"rep_{name}"][2])
+            rep[name] = counts.reindex(rep["sales_rep_id"]).to_numpy()
     rep["gm_pct"] = rep["gm"] / (rep["revenue"] + 1e-9)
-    rep["leakage_rate"] = rep["leakage_txns"] / (len(d) + 1e-9)  # simple, mostly for display
-    return rep.sort_values("leakage_est_dollars", ascending=False)
+    rep["leakage_rate"] = rep["leakage_txns"] / (len(txn_flagged) + 1e-9)  # simple, mostly for display
+    return rep.sort_values("leakage_est_dollars", ascending=False) if sort else rep
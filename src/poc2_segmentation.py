@@ -1,7 +1,13 @@
+import json
+
+import numpy as np
 import pandas as pd
+from scipy.optimize import linear_sum_assignment
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 
+from src.instrument import instrumented
+
 SEGMENT_FEATURES = [
     "orders", "sku_count", "category_count",
     "total_revenue", "gm_pct",
@@ -9,15 +15,125 @@ SEGMENT_FEATURES = [
     "contract_share", "aov", "units_per_order"
 ]
 
-def segment_customers(cust_df: pd.DataFrame, k: int = 5) -> pd.DataFrame:
-    d = cust_df.copy()
+# Bump when the on-disk layout of the segmentation artifact changes
+SEGMENTATION_SCHEMA_VERSION = 1
+
+
+def _match_labels(centers: np.ndarray, prev_model: dict | None) -> np.ndarray:
+    """
+    Stable label per centroid row. Without a previous model, clusters are
+    numbered by descending total_revenue centroid; with one, each new centroid
+    inherits the label of its closest previous centroid (Hungarian matching),
+    and any extra clusters get fresh labels.
+    """
+    k = len(centers)
+    if prev_model is None:
+        order = np.argsort(-centers[:, SEGMENT_FEATURES.index("total_revenue")], kind="stable")
+        labels = np.empty(k, dtype=np.int64)
+        labels[order] = np.arange(k)
+        return labels
 
-    X = d[SEGMENT_FEATURES].fillna(0)
+    # Compare in raw feature units, scaled by the new spread so features weigh equally
+    prev_centers = prev_model["centroids"] * prev_model["scale"] + prev_model["mean"]
+    spread = centers.std(axis=0) + 1e-9
+    cost = (((centers[:, None, :] - prev_centers[None, :, :]) / spread) ** 2).sum(axis=2)
+    rows, cols = linear_sum_assignment(cost)
+
+    labels = np.full(k, -1, dtype=np.int64)
+    labels[rows] = prev_model["labels"][cols]
+    next_label = int(prev_model["labels"].max()) + 1
+    for i in np.flatnonzero(labels < 0):
+        labels[i] = next_label
+        next_label += 1
+    return labels
+
+
+@instrumented
+def fit_segmentation_model(cust_df: pd.DataFrame, k: int = 5, prev_model: dict | None = None) -> dict:
+    """
+    Fits scaler + KMeans on customer features and returns a plain-array model:
+      version, features, mean, scale, centroids (scaled space), labels (stable id per centroid)
+    Pass the previous model to keep cluster labels stable across refits.
+    """
+    X = cust_df[SEGMENT_FEATURES].fillna(0)
     scaler = StandardScaler()
     Xs = scaler.fit_transform(X)
 
     km = KMeans(n_clusters=k, random_state=42, n_init="auto")
-    d["cluster"] = km.fit_predict(Xs)
+    km.fit(Xs)
+
+    centroids = km.cluster_centers_
+    raw_centers = centroids * scaler.scale_ + scaler.mean_
+    return {
+        "version": 1 if prev_model is None else int(prev_model["version"]) + 1,
+        "features": list(SEGMENT_FEATURES),
+        "mean": scaler.mean_.astype(np.float64),
+        "scale": scaler.scale_.astype(np.float64),
+        "centroids": centroids.astype(np.float64),
+        "labels": _match_labels(raw_centers, prev_model),
+    }
+
+
+@instrumented
+def assign_segments(model: dict, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+    """
+    Vectorized nearest-centroid assignment. Accepts a frame with the model's
+    feature columns (or an array in that column order) and returns stable labels.
+    """
+    if isinstance(features, pd.DataFrame):
+        X = features[model["features"]].fillna(0).to_numpy(dtype=np.float64)
+    else:
+        X = np.nan_to_num(np.asarray(features, dtype=np.float64))
+
+    Xs = (X - model["mean"]) / model["scale"]
+    C = model["centroids"]
+    # ||x - c||^2 = ||x||^2 - 2 x·c + ||c||^2 ; ||x||^2 is constant per row so it is dropped
+    dist = (C * C).sum(axis=1) - 2.0 * (Xs @ C.T)
+    return model["labels"][dist.argmin(axis=1)]
+
+
+def save_segmentation_model(model: dict, path: str) -> str:
+    meta = {
+        "schema": SEGMENTATION_SCHEMA_VERSION,
+        "version": int(model["version"]),
+        "features": model["features"],
+    }
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            meta=np.array(json.dumps(meta)),
+            mean=model["mean"],
+            scale=model["scale"],
+            centroids=model["centroids"],
+            labels=model["labels"],
+        )
+    return path
+
+
+def load_segmentation_model(path: str) -> dict:
+    with np.load(path, allow_pickle=False) as z:
+        meta = json.loads(str(z["meta"]))
+        if meta["schema"] != SEGMENTATION_SCHEMA_VERSION:
+            raise ValueError(
+                f"Unsupported segmentation artifact schema {meta['schema']} "
+                f"(expected {SEGMENTATION_SCHEMA_VERSION})"
+            )
+        return {
+            "version": meta["version"],
+            "features": meta["features"],
+            "mean": z["mean"],
+            "scale": z["scale"],
+            "centroids": z["centroids"],
+            "labels": z["labels"],
+        }
+
+
+@instrumented
+def segment_customers(cust_df: pd.DataFrame, k: int = 5, prev_model: dict | None = None) -> pd.DataFrame:
+    d = cust_df.copy()
+
+    model = fit_segmentation_model(d, k=k, prev_model=prev_model)
+    d["cluster"] = assign_segments(model, d)
 
     # add readable labels (simple)
     d["cluster_label"] = d["cluster"].apply(lambda c: f"Cluster {c}")
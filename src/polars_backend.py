@@ -0,0 +1,334 @@
+"""
+Polars lazy implementation of the aggregation stages (see src.backends).
+
+Same inputs and outputs as the pandas functions in model_elasticity,
+poc2_features and poc2_leakage. Key and label columns go in as integer codes
+(categorical codes, or sorted factorize codes for object columns) and are mapped
+back afterwards, so groups come out in exactly the order pandas' sorted groupby
+gives. Null keys (code -1) and NaN values follow pandas: null keys form no
+group and are skipped by first / n_unique, NaN is skipped by sum / mean.
+Each stage is one lazy query collected with the streaming engine; Polars
+optimizes the plan and runs it multi-threaded.
+
+Per-group log-log slopes are computed from centered sums inside the query,
+which matches sklearn's LinearRegression to floating-point rounding.
+"""
+import numpy as np
+import pandas as pd
+import polars as pl  # >= 1.25: collect/collect_all(engine="streaming")
+
+from src.instrument import instrumented
+from src.memory import float_dtype
+from src.poc2_leakage import PEER_KEYS
+from src.sketches import ROLLUPS, approx_nunique
+
+ENGINE = "streaming"
+MIN_POLARS = (1, 25)
+
+
+def _encode(s: pd.Series) -> tuple[np.ndarray, object]:
+    """Integer codes in pandas' groupby sort order + what is needed to decode them."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.cat.codes.to_numpy(), s.dtype
+    codes, uniques = pd.factorize(s, sort=True)
+    return codes, uniques
+
+
+def _decode(codes, how, plain: bool = False) -> pd.Categorical | np.ndarray:
+    codes = np.asarray(codes)
+    if isinstance(how, pd.CategoricalDtype):
+        if not plain:
+            return pd.Categorical.from_codes(codes, dtype=how)
+        how = how.categories
+    values = np.asarray(how, dtype=object)
+    if (codes < 0).any():  # null key (or a group with only null values)
+        return np.where(codes < 0, None, values.take(np.maximum(codes, 0)) if len(values) else None)
+    return values.take(codes)
+
+
+def _frame(df: pd.DataFrame, coded: list[str], numeric: dict[str, str]) -> tuple[pl.LazyFrame, dict]:
+    """LazyFrame over code columns + numeric columns cast to the given numpy dtype."""
+    cols, decoders = {}, {}
+    for c in coded:
+        cols[c], decoders[c] = _encode(df[c])
+    for c, dtype in numeric.items():
+        cols[c] = df[c].to_numpy(dtype=dtype)
+    lf = pl.DataFrame(cols).lazy()
+    # NaN -> null, so sums and means skip it as pandas does
+    floats = [c for c, dtype in numeric.items() if np.dtype(dtype).kind == "f"]
+    return (lf.with_columns(pl.col(floats).fill_nan(None)) if floats else lf), decoders
+
+
+def _valid(*keys: str) -> pl.Expr:
+    """Rows whose keys are all non-null (pandas' groupby drops the rest)."""
+    return pl.all_horizontal(pl.col(k) >= 0 for k in keys)
+
+
+def _first(c: str) -> pl.Expr:
+    # pandas' first skips nulls; -1 decodes to a null when a group has none
+    return pl.col(c).filter(pl.col(c) >= 0).first().fill_null(-1).alias(c)
+
+
+def _n_unique(c: str, name: str) -> pl.Expr:
+    return pl.col(c).filter(pl.col(c) >= 0).n_unique().alias(name)
+
+
+def _to_pandas(out: pl.DataFrame, decoders: dict, plain: tuple = ()) -> pd.DataFrame:
+    """`plain` columns decode to object values even when the input was categorical."""
+    res = {}
+    for c in out.columns:
+        v = out[c].to_numpy()
+        if c in decoders:
+            res[c] = _decode(v, decoders[c], plain=c in plain)
+        elif out[c].dtype in (pl.UInt32, pl.UInt64, pl.Int32):
+            res[c] = v.astype(np.int64)
+        else:
+            res[c] = v
+    return pd.DataFrame(res)
+
+
+# -----------------------------
+# Elasticity cube
+# -----------------------------
+def _slope(min_rows: int, min_unique_prices: int, name: str) -> list[pl.Expr]:
+    x, y = pl.col("lx"), pl.col("ly")
+    xc = x - x.mean()
+    slope = (xc * (y - y.mean())).sum() / (xc * xc).sum()
+    ok = (pl.len() >= min_rows) & (pl.col("net_price").n_unique() >= min_unique_prices)
+    return [pl.when(ok).then(slope).otherwise(None).cast(pl.Float64).alias(name)]
+
+
+@instrumented(name="polars.derive_elasticity_cube")
+def derive_elasticity_cube(df: pd.DataFrame) -> pd.DataFrame:
+    keys = ["sku", "segment", "region"]
+    price_dtype = df["net_price"].dtype
+    lf, dec = _frame(
+        df, keys + ["category"],
+        {"net_price": np.float64, "units": np.float64, "unit_cost": np.float64},
+    )
+    margin = (pl.col("net_price") - pl.col("unit_cost")) / pl.col("net_price")
+    if price_dtype == np.float32:
+        # pandas computes margin_pct on the float32 columns
+        margin = margin.cast(pl.Float32)
+
+    summary = (
+        lf.filter(_valid(*keys)).group_by(keys)
+        .agg(
+            pl.col("net_price").mean().alias("avg_price"),
+            pl.col("units").mean().alias("avg_units"),
+            margin.mean().cast(pl.Float64).alias("avg_margin"),
+            _first("category"),
+            pl.len().alias("n"),
+            pl.col("net_price").n_unique().alias("unique_prices"),
+        )
+        .sort(keys)
+    )
+
+    fit = lf.filter((pl.col("units") > 0) & (pl.col("net_price") > 0)).with_columns(
+        pl.col("net_price").log().alias("lx"), pl.col("units").log().alias("ly")
+    )
+    esr = fit.filter(_valid(*keys)).group_by(keys).agg(*_slope(60, 6, "e_sku_seg_reg"))
+    ess = fit.filter(_valid("sku", "segment")).group_by(["sku", "segment"]).agg(*_slope(150, 8, "e_sku_seg"))
+    esk = fit.filter(_valid("sku")).group_by(["sku"]).agg(*_slope(300, 10, "e_sku"))
+    esr2 = fit.filter(_valid("segment", "region")).group_by(["segment", "region"]).agg(*_slope(800, 10, "e_seg_reg"))
+    glob = fit.select(*_slope(3000, 15, "e_global"))
+
+    out = (
+        summary
+        .join(esr, on=keys, how="left", maintain_order="left")
+        .join(ess, on=["sku", "segment"], how="left", maintain_order="left")
+        .join(esk, on=["sku"], how="left", maintain_order="left")
+        .join(esr2, on=["segment", "region"], how="left", maintain_order="left")
+    )
+    out, glob = pl.collect_all([out, glob], engine=ENGINE)
+
+    e_global = glob["e_global"][0]
+    if e_global is None:
+        e_global = -1.0  # sane default
+    out = out.with_columns(
+        pl.coalesce("e_sku_seg_reg", "e_sku_seg", "e_sku", "e_seg_reg", pl.lit(e_global))
+        .clip(-4.0, -0.05)
+        .alias("elasticity")
+    )
+
+    # pandas' merges with the per-level frames turn categorical keys into plain values
+    res = _to_pandas(out, dec, plain=tuple(keys))
+    if price_dtype == np.float32:
+        res["avg_price"] = res["avg_price"].astype(np.float32)
+        res["avg_margin"] = res["avg_margin"].astype(np.float32)
+    return res
+
+
+# -----------------------------
+# Customer features
+# -----------------------------
+@instrumented(name="polars.build_customer_features")
+def build_customer_features(df: pd.DataFrame, approx_distinct: bool = False) -> pd.DataFrame:
+    lf, dec = _frame(
+        df, ["customer_id", "segment", "region", "sku", "category"],
+        {
+            "net_price": np.float64, "unit_cost": np.float64, "list_price": np.float64,
+            "units": np.int64, "contract_flag": np.float64,
+        },
+    )
+    lf = lf.with_columns(
+        (pl.col("net_price") * pl.col("units")).alias("revenue"),
+        ((pl.col("net_price") - pl.col("unit_cost")) * pl.col("units")).alias("gm"),
+        ((pl.col("list_price") - pl.col("net_price")) / (pl.col("list_price") + 1e-9)).alias("discount_pct"),
+    )
+    distinct = [] if approx_distinct else [_n_unique("sku", "sku_count"), _n_unique("category", "category_count")]
+    per_order = [] if approx_distinct else [(pl.col("sku_count") / (pl.col("orders") + 1e-9)).alias("sku_per_order_proxy")]
+    cust = (
+        lf.filter(_valid("customer_id")).group_by("customer_id")
+        .agg(
+            _first("segment"),
+            _first("region"),
+            pl.len().alias("orders"),
+            *distinct,
+            pl.col("units").sum().alias("total_units"),
+            pl.col("revenue").sum().alias("total_revenue"),
+            pl.col("gm").sum().alias("total_gm"),
+            pl.col("discount_pct").mean().alias("avg_discount"),
+            pl.col("discount_pct").quantile(0.90, interpolation="linear").alias("p90_discount"),
+            pl.col("contract_flag").mean().alias("contract_share"),
+        )
+        .sort("customer_id")
+        .with_columns(
+            (pl.col("total_gm") / (pl.col("total_revenue") + 1e-9)).alias("gm_pct"),
+            (pl.col("total_revenue") / (pl.col("orders") + 1e-9)).alias("aov"),
+            (pl.col("total_units") / (pl.col("orders") + 1e-9)).alias("units_per_order"),
+            *per_order,
+        )
+        .collect(engine=ENGINE)
+    )
+    res = _to_pandas(cust, dec)
+    # pandas keeps the units dtype for the per-customer sum
+    res["total_units"] = res["total_units"].astype(df["units"].dtype)
+    if approx_distinct:  # the same sketches as the pandas path, so the same estimates
+        distinct = (("sku_count", "sku"), ("category_count", "category"))
+        for pos, (name, col) in enumerate(distinct, start=res.columns.get_loc("orders") + 1):
+            counts = approx_nunique(df, "customer_id", col, ROLLUPS[f"customer_{name}"][2])
+            res.insert(pos, name, counts.reindex(res["customer_id"]).to_numpy())
+        res["sku_per_order_proxy"] = res["sku_count"] / (res["orders"] + 1e-9)
+    return res
+
+
+# -----------------------------
+# Leakage
+# -----------------------------
+@instrumented(name="polars.leakage_flags")
+def leakage_flags(
+    df: pd.DataFrame,
+    percentile: float = 0.90,
+    min_peer_n: int = 30,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    lf, _ = _frame(
+        df, PEER_KEYS,
+        {"list_price": np.float64, "net_price": np.float64, "unit_cost": np.float64, "units": np.float64},
+    )
+    lf = lf.with_columns(
+        ((pl.col("list_price") - pl.col("net_price")) / (pl.col("list_price") + 1e-9)).alias("discount_pct"),
+        ((pl.col("net_price") - pl.col("unit_cost")) / (pl.col("net_price") + 1e-9)).alias("gm_pct_txn"),
+        (pl.col("net_price") * pl.col("units")).alias("revenue"),
+        ((pl.col("net_price") - pl.col("unit_cost")) * pl.col("units")).alias("gm"),
+    )
+    # Null peer keys (code -1) form no peer group: the left join leaves them null stats
+    peer = lf.filter(_valid(*PEER_KEYS)).group_by(PEER_KEYS).agg(
+        pl.col("discount_pct").mean().alias("peer_avg_disc"),
+        pl.col("discount_pct").quantile(percentile, interpolation="linear").alias("peer_q_disc"),
+        pl.col("gm_pct_txn").mean().alias("peer_avg_gm"),
+        pl.len().cast(pl.Int64).alias("peer_n"),
+    )
+    excess = (pl.col("discount_pct") - pl.col("peer_q_disc")).clip(lower_bound=0)
+    new = (
+        lf.join(peer, on=PEER_KEYS, how="left", maintain_order="left")
+        .with_columns(pl.col("peer_n").fill_null(0))
+        .with_columns(
+            ((pl.col("peer_n") >= min_peer_n) & (pl.col("discount_pct") > pl.col("peer_q_disc"))).alias("leakage_flag"),
+            excess.alias("excess_disc_pct"),
+            (excess * pl.col("list_price") * pl.col("units")).alias("leakage_dollars_est"),
+        )
+        .drop(PEER_KEYS + ["list_price", "net_price", "unit_cost", "units"])
+        .collect(engine=ENGINE)
+    )
+
+    keep = list(df.columns) + new.columns if columns is None else columns
+    out = df[[c for c in keep if c in df.columns and c not in new.columns]].copy(deep=False)
+    out.index = pd.RangeIndex(len(out))
+    dtype = float_dtype()
+    for c in keep:
+        if c in new.columns:
+            v = new[c].to_numpy()
+            out[c] = v.astype(dtype, copy=False) if v.dtype.kind == "f" else v
+    return out[[c for c in keep if c in out.columns]]
+
+
+def _leakage_summary(txn_flagged: pd.DataFrame, by: str, aggs: list[str]) -> tuple[pl.DataFrame, dict]:
+    coded = [by] + [c for c in ("segment", "region", "customer_id", "sku") if c in aggs and c != by]
+    lf, dec = _frame(
+        txn_flagged, coded,
+        {
+            "leakage_flag": np.int64,
+            "leakage_dollars_est": np.float64,
+            "discount_pct": np.float64,
+            "revenue": np.float64,
+            "gm": np.float64,
+        },
+    )
+    exprs = {
+        "segment": _first("segment"),
+        "region": _first("region"),
+        "leakage_txns": pl.col("leakage_flag").sum().alias("leakage_txns"),
+        "leakage_est_dollars": pl.col("leakage_dollars_est").sum().alias("leakage_est_dollars"),
+        "avg_discount": pl.col("discount_pct").mean().alias("avg_discount"),
+        "p90_discount": pl.col("discount_pct").quantile(0.90, interpolation="linear").alias("p90_discount"),
+        "revenue": pl.col("revenue").sum(),
+        "gm": pl.col("gm").sum(),
+        "customer_id": _n_unique("customer_id", "customers"),
+        "sku": _n_unique("sku", "skus"),
+    }
+    out = (
+        lf.filter(_valid(by)).group_by(by)
+        .agg(*[exprs[a] for a in aggs])
+        .sort(by)
+        .with_columns((pl.col("gm") / (pl.col("revenue") + 1e-9)).alias("gm_pct"))
+        .collect(engine=ENGINE)
+    )
+    return out, dec
+
+
+def _summary_dtypes(res: pd.DataFrame, txn_flagged: pd.DataFrame) -> pd.DataFrame:
+    # pandas keeps float32 sums/means when the flagged frame is stored in float32
+    for c, src in (("leakage_est_dollars", "leakage_dollars_est"), ("avg_discount", "discount_pct"),
+                   ("p90_discount", None), ("revenue", "revenue"), ("gm", "gm")):
+        if c in res and src is not None and txn_flagged[src].dtype == np.float32:
+            res[c] = res[c].astype(np.float32)
+    if "gm_pct" in res and txn_flagged["gm"].dtype == np.float32:
+        res["gm_pct"] = (res["gm"] / (res["revenue"] + 1e-9))
+    return res
+
+
+@instrumented(name="polars.leakage_summary_by_customer")
+def leakage_summary_by_customer(txn_flagged: pd.DataFrame, sort: bool = True) -> pd.DataFrame:
+    out, dec = _leakage_summary(
+        txn_flagged, "customer_id",
+        ["segment", "region", "leakage_txns", "leakage_est_dollars", "avg_discount", "p90_discount", "revenue", "gm"],
+    )
+    cust = _summary_dtypes(_to_pandas(out, dec), txn_flagged)
+    return cust.sort_values("leakage_est_dollars", ascending=False) if sort else cust
+
+
+@instrumented(name="polars.leakage_summary_by_rep")
+def leakage_summary_by_rep(txn_flagged: pd.DataFrame, sort: bool = True, approx_distinct: bool = False) -> pd.DataFrame:
+    out, dec = _leakage_summary(
+        txn_flagged, "sales_rep_id",
+        ["leakage_txns", "leakage_est_dollars", "avg_discount", "revenue", "gm"] + ([] if approx_distinct else ["customer_id", "sku"]),
+    )
+    rep = _summary_dtypes(_to_pandas(out, dec), txn_flagged)
+    if approx_distinct:
+        for name, col in (("customers", "customer_id"), ("skus", "sku")):
+            counts = approx_nunique(txn_flagged, "sales_rep_id", col, ROLLUPS[f"rep_{name}"][2])
+            rep.insert(rep.columns.get_loc("gm_pct"), name, counts.reindex(rep["sales_rep_id"]).to_numpy())
+    rep["leakage_rate"] = rep["leakage_txns"] / (len(txn_flagged) + 1e-9)  # simple, mostly for display
+    return rep.sort_values("leakage_est_dollars", ascending=False) if sort else rep
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+
+def top_k_positions(
+    values,
+    k: int,
+    ascending: bool = False,
+    mask=None,
+) -> np.ndarray:
+    """
+    Integer positions of the top-k values in O(n) via argpartition, then only
+    the k winners are sorted. Ties keep original row order (stable), NaNs rank last.
+    `mask` restricts the candidates (e.g. an action filter) without copying rows.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    pos = np.flatnonzero(mask) if mask is not None else np.arange(len(v))
+    k = min(int(k), len(pos))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    key = v[pos] if ascending else -v[pos]
+    key = np.where(np.isnan(key), np.inf, key)
+
+    if k < len(key):
+        # k smallest keys; boundary ties are resolved by position below
+        part = np.argpartition(key, k - 1)[:k]
+        cutoff = key[part].max()
+        below = np.flatnonzero(key < cutoff)
+        ties = np.flatnonzero(key == cutoff)[: k - len(below)]
+        sel = np.concatenate([below, ties])
+    else:
+        sel = np.arange(len(key))
+
+    order = np.lexsort((sel, key[sel]))
+    return pos[sel[order]]
+
+
+def top_k(
+    df: pd.DataFrame,
+    by: str,
+    k: int,
+    ascending: bool = False,
+    mask=None,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """Top-k rows of df by one column; only the selected rows (and columns) are materialized."""
+    idx = top_k_positions(df[by].to_numpy(), k, ascending=ascending, mask=mask)
+    out = df.iloc[idx]
+    return out[columns] if columns is not None else out
+
+
+def rank_page(
+    df: pd.DataFrame,
+    by: str,
+    page: int,
+    page_size: int,
+    ascending: bool = False,
+    mask=None,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Rows ranked [page * page_size, (page + 1) * page_size) — "next page" browsing
+    costs O(n + p log p) for p = (page + 1) * page_size, never a full sort.
+    """
+    page = max(int(page), 0)
+    idx = top_k_positions(df[by].to_numpy(), (page + 1) * page_size, ascending=ascending, mask=mask)
+    out = df.iloc[idx[page * page_size:]]
+    return out[columns] if columns is not None else out
@@ -0,0 +1,338 @@
+"""
+Persistent, content-addressed result cache for the src/ stages, shared by every
+process and replica that points at the same directory.
+
+Off unless a directory is configured: PRICING_CACHE_DIR (pages, scoring API)
+or `python -m src.batch --cache-dir`. A key hashes
+  - the inputs: DataFrames / arrays by content (pd.util.hash_pandas_object,
+    memoized per object), everything else by repr (e.g. a page data source tuple)
+  - the parameters
+  - the code version: every src/*.py file plus the pandas / numpy / pyarrow
+    versions, the aggregation backend and the low-memory mode
+so a changed input, slider or deploy is a different entry rather than a stale hit.
+
+Values are DataFrames stored as uncompressed Arrow IPC files
+(<dir>/<stage>-<digest>.arrow) and read back through a memory map. Writers
+write a temp file and os.replace it into place, so readers never see a partial
+entry and concurrent writers of one key just race to an identical file.
+Eviction is LRU by file mtime (touched on every hit) down to
+PRICING_CACHE_MAX_MB, under an exclusive flock so processes evict in turn.
+
+    python -m src.result_cache stats --dir .cache/pricing
+    python -m src.result_cache check
+"""
+import argparse
+import fcntl
+import glob
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import time
+import weakref
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from src.instrument import mark_cache
+
+logger = logging.getLogger("pricing.result_cache")
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MAX_MB = 2048.0
+
+_dir = os.environ.get("PRICING_CACHE_DIR", "")
+_max_mb = float(os.environ.get("PRICING_CACHE_MAX_MB", DEFAULT_MAX_MB))
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+_fingerprints: dict[int, tuple] = {}  # id(obj) -> (weakref, digest); objects are read-only by convention
+_code_version: str | None = None
+
+
+def configure(cache_dir: str | None, max_mb: float = DEFAULT_MAX_MB):
+    """Enables the cache in `cache_dir` (None / "" disables it)."""
+    global _dir, _max_mb
+    _dir, _max_mb = cache_dir or "", float(max_mb)
+    if _dir:
+        os.makedirs(_dir, exist_ok=True)
+
+
+def enabled() -> bool:
+    return bool(_dir)
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+# -----------------------------
+# Keys
+# -----------------------------
+def code_version() -> str:
+    """Digest of the src/ sources and library versions; computed once per process."""
+    global _code_version
+    if _code_version is None:
+        h = hashlib.blake2b(digest_size=16)
+        for path in sorted(glob.glob(os.path.join(SRC_DIR, "*.py"))):
+            h.update(os.path.basename(path).encode())
+            with open(path, "rb") as f:
+                h.update(f.read())
+        h.update(f"{pd.__version__}|{np.__version__}|{pa.__version__}".encode())
+        _code_version = h.hexdigest()
+    return _code_version
+
+
+def fingerprint(obj) -> str:
+    """Content digest of a frame / series / array (memoized per object), else of its repr."""
+    if not isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return hashlib.blake2b(repr(obj).encode(), digest_size=16).hexdigest()
+    memo = _fingerprints.get(id(obj))
+    if memo is not None and memo[0]() is obj:
+        return memo[1]
+
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(obj, np.ndarray):
+        h.update(f"{obj.dtype}|{obj.shape}".encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        h.update(repr(obj.dtypes.to_dict() if isinstance(obj, pd.DataFrame) else obj.dtype).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    digest = h.hexdigest()
+    if len(_fingerprints) > 64:
+        _fingerprints.clear()
+    _fingerprints[id(obj)] = (weakref.ref(obj), digest)
+    return digest
+
+
+def make_key(stage: str, *parts) -> str:
+    from src.backends import default_backend
+    from src.memory import low_memory
+
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{stage}|{code_version()}|{default_backend()}|{low_memory()}".encode())
+    _update(h, parts)
+    return h.hexdigest()
+
+
+def _update(h, part):
+    if isinstance(part, dict):
+        part = sorted(part.items())
+    if isinstance(part, (tuple, list)):
+        h.update(b"(")
+        for p in part:
+            _update(h, p)
+        h.update(b")")
+    else:
+        h.update(fingerprint(part).encode())
+
+
+# -----------------------------
+# Storage
+# -----------------------------
+def _path(stage: str, key: str) -> str:
+    return os.path.join(_dir, f"{stage}-{key}.arrow")
+
+
+def get(stage: str, key: str) -> pd.DataFrame | None:
+    path = _path(stage, key)
+    try:
+        with pa.memory_map(path, "r") as source:
+            table = ipc.open_file(source).read_all()
+        os.utime(path)  # LRU clock
+    except (FileNotFoundError, pa.ArrowInvalid, OSError):
+        return None
+    return table.to_pandas()
+
+
+def put(stage: str, key: str, df: pd.DataFrame) -> bool:
+    """Stores `df`; returns False when it cannot be written as Arrow (left uncached)."""
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        logger.warning("result_cache: %s not cacheable: %s", stage, e)
+        return False
+
+    try:
+        os.makedirs(_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=_dir, prefix=".tmp-", suffix=".arrow")
+    except OSError as e:  # unwritable cache: serve uncached rather than fail the stage
+        logger.warning("result_cache: cannot write to %s: %s", _dir, e)
+        return False
+    try:
+        with os.fdopen(fd, "wb") as f, ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, _path(stage, key))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    _stats["writes"] += 1
+    evict(_max_mb)
+    return True
+
+
+def entries() -> pd.DataFrame:
+    rows = []
+    for path in glob.glob(os.path.join(_dir, "*.arrow")):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:  # evicted meanwhile
+            continue
+        name = os.path.basename(path)
+        if name.startswith(".tmp-"):
+            continue
+        rows.append({"stage": name.rsplit("-", 1)[0], "path": path, "mb": st.st_size / 1e6, "last_used": st.st_mtime})
+    return pd.DataFrame(rows, columns=["stage", "path", "mb", "last_used"])
+
+
+def evict(max_mb: float) -> int:
+    """Removes least recently used entries until the directory is under `max_mb`."""
+    with open(os.path.join(_dir, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            ent = entries().sort_values("last_used")
+            over = ent["mb"].sum() - max_mb
+            removed = 0
+            for path, mb in zip(ent["path"], ent["mb"]):
+                if over <= 0:
+                    break
+                try:
+                    os.unlink(path)  # open memory maps stay valid
+                except FileNotFoundError:
+                    pass
+                over -= mb
+                removed += 1
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    _stats["evicted"] += removed
+    return removed
+
+
+def clear() -> int:
+    return evict(0.0)
+
+
+# -----------------------------
+# Call-site helpers
+# -----------------------------
+def get_or_compute(stage: str, key_parts: tuple, compute: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """
+    Cached value of `compute()` for (stage, key_parts), computing and storing it on
+    a miss. `compute` only runs on a miss, so upstream inputs can be loaded lazily
+    inside it. A hit marks the enclosing instrument span cache="disk".
+    """
+    if not _dir:
+        return compute()
+    key = make_key(stage, *key_parts)
+    df = get(stage, key)
+    if df is not None:
+        _stats["hits"] += 1
+        mark_cache("disk")
+        return df
+    _stats["misses"] += 1
+    df = compute()
+    if isinstance(df, pd.DataFrame):
+        put(stage, key, df)
+    return df
+
+
+def cached(fn: Callable, stage: str | None = None) -> Callable:
+    """`fn` with its DataFrame result cached on (arguments by content, keyword parameters)."""
+    stage = stage or fn.__name__
+
+    def wrapper(*args, **kwargs):
+        return get_or_compute(stage, (args, kwargs), lambda: fn(*args, **kwargs))
+
+    wrapper.__name__ = getattr(fn, "__name__", stage)
+    return wrapper
+
+
+# -----------------------------
+# CLI: stats / clear / check
+# -----------------------------
+def _concurrent_put(cache_dir: str, rows: int) -> bool:
+    from src.model_elasticity import derive_elasticity_cube
+    from src.synth_data import make_synthetic_transactions
+
+    configure(cache_dir)
+    df = make_synthetic_transactions(rows, seed=7)
+    expected = derive_elasticity_cube(df)
+    got = cached(derive_elasticity_cube)(df)
+    pd.testing.assert_frame_equal(got, expected)
+    return True
+
+
+def check(rows: int = 20000, writers: int = 4) -> pd.DataFrame:
+    """Round trip, concurrent writers of one key, hit speed and LRU eviction."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    from src.model_elasticity import derive_elasticity_cube
+    from src.poc2_leakage import leakage_flags
+    from src.memory import compact_transactions
+    from src.synth_data import make_synthetic_transactions
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(tmp)
+        df = make_synthetic_transactions(rows, seed=7)
+        for layout, data in [("object", df), ("compact", compact_transactions(df.copy()))]:
+            for fn in (derive_elasticity_cube, leakage_flags):
+                f = cached(fn)
+                t0 = time.perf_counter()
+                miss = f(data)
+                t1 = time.perf_counter()
+                hit = f(data)
+                t2 = time.perf_counter()
+                pd.testing.assert_frame_equal(hit, miss)
+                results.append({
+                    "check": f"{fn.__name__} ({layout})", "miss_s": round(t1 - t0, 4),
+                    "hit_s": round(t2 - t1, 4), "mb": round(entries()["mb"].max(), 2),
+                })
+
+        other = tempfile.mkdtemp(dir=tmp)
+        with ProcessPoolExecutor(max_workers=writers) as pool:
+            assert all(pool.map(_concurrent_put, [other] * writers, [rows] * writers))
+        configure(other)
+        assert len(entries()) == 1, entries()
+        results.append({"check": f"{writers} concurrent writers, one key", "miss_s": None, "hit_s": None, "mb": round(entries()["mb"].sum(), 2)})
+
+        configure(tmp)
+        ent = entries().sort_values("last_used")
+        newest = ent["path"].iloc[-1]
+        evict(ent["mb"].iloc[-1] + 1e-6)
+        assert entries()["path"].tolist() == [newest], entries()
+        results.append({"check": "LRU eviction keeps the newest entry", "miss_s": None, "hit_s": None, "mb": round(entries()["mb"].sum(), 2)})
+        configure(None)
+    return pd.DataFrame(results)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.result_cache")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    for cmd in ("stats", "clear"):
+        c = sub.add_parser(cmd)
+        c.add_argument("--dir", default=_dir, required=not _dir, help="Cache directory (default: PRICING_CACHE_DIR)")
+    c = sub.add_parser("check", help="Round trip, concurrent writers and eviction in a temp directory")
+    c.add_argument("--rows", type=int, default=20000)
+    c.add_argument("--writers", type=int, default=4)
+    args = p.parse_args(argv)
+
+    if args.cmd == "check":
+        print(check(args.rows, args.writers).to_string(index=False))
+        return 0
+    configure(args.dir, _max_mb)
+    if args.cmd == "clear":
+        print(f"removed {clear()} entries from {args.dir}")
+        return 0
+    ent = entries()
+    by_stage = ent.groupby("stage").agg(entries=("path", "size"), mb=("mb", "sum"))
+    print(by_stage.to_string() if len(ent) else "(empty)")
+    print(f"\ntotal {ent['mb'].sum():.1f} MB of {_max_mb:.0f} MB in {args.dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Named raise-plan scenarios for side-by-side comparison on the Price Raise Engine.
+
+A scenario keeps only what the comparison needs, aligned to the elasticity cube
+rows of its data source: raise_score (float32), tier code (int8, index into
+uplift.TIERS) and revenue_delta (float32), about 9 bytes per cube row.
+Scenarios live in a bounded LRU per browser session (st.session_state); the
+comparison below works on those arrays alone, nothing is re-simulated.
+"""
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from src.ranking import top_k_positions
+from src.uplift import TIERS
+
+MAX_SCENARIOS = 8
+TIER_LABELS = np.array(TIERS, dtype=object)
+
+
+class Scenario(NamedTuple):
+    name: str
+    source: tuple
+    params: dict
+    raise_score: np.ndarray  # float32
+    tier: np.ndarray  # int8 code into TIERS
+    revenue_delta: np.ndarray  # float32
+
+    @property
+    def nbytes(self) -> int:
+        return self.raise_score.nbytes + self.tier.nbytes + self.revenue_delta.nbytes
+
+
+def tier_codes(raise_tier) -> np.ndarray:
+    """int8 codes (TIERS order) for a raise_tier column, object or categorical."""
+    codes = pd.Categorical(raise_tier, categories=TIERS).codes
+    return codes.astype(np.int8, copy=False)
+
+
+def make_scenario(name: str, source: tuple, params: dict, sim_df: pd.DataFrame) -> Scenario:
+    """Compact copy of a compute_price_lift_impact result (rows in cube order)."""
+    return Scenario(
+        name,
+        source,
+        dict(params),
+        sim_df["raise_score"].to_numpy(dtype=np.float32),
+        tier_codes(sim_df["raise_tier"]),
+        sim_df["revenue_delta"].to_numpy(dtype=np.float32),
+    )
+
+
+class ScenarioStore:
+    """
+    Bounded LRU of scenarios by name; save() and get() mark a scenario recently used.
+    Rendering reads with peek(), so a rerun never reorders names() (Streamlit
+    resets a widget whose options change).
+    """
+
+    def __init__(self, max_entries: int = MAX_SCENARIOS):
+        self.max_entries = int(max_entries)
+        self._items: OrderedDict[str, Scenario] = OrderedDict()
+
+    def save(self, scenario: Scenario) -> list[str]:
+        """Stores (or replaces) a scenario; returns the names evicted to stay in bounds."""
+        self._items[scenario.name] = scenario
+        self._items.move_to_end(scenario.name)
+        evicted = []
+        while len(self._items) > self.max_entries:
+            evicted.append(self._items.popitem(last=False)[0])
+        return evicted
+
+    def get(self, name: str) -> Scenario:
+        self._items.move_to_end(name)
+        return self._items[name]
+
+    def peek(self, name: str) -> Scenario:
+        """Like get(), without touching the LRU order."""
+        return self._items[name]
+
+    def remove(self, name: str):
+        self._items.pop(name, None)
+
+    def names(self, source: tuple | None = None) -> list[str]:
+        """Most recently used first; optionally only scenarios on one data source."""
+        return [n for n, s in reversed(self._items.items()) if source is None or s.source == source]
+
+    def nbytes(self) -> int:
+        return sum(s.nbytes for s in self._items.values())
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._items
+
+
+def session_store(session_state, max_entries: int = MAX_SCENARIOS) -> ScenarioStore:
+    if "scenario_store" not in session_state:
+        session_state["scenario_store"] = ScenarioStore(max_entries)
+    return session_state["scenario_store"]
+
+
+# -----------------------------
+# Comparison (cached arrays only)
+# -----------------------------
+def _check_aligned(scenarios: list[Scenario]):
+    base = scenarios[0]
+    for s in scenarios[1:]:
+        if s.source != base.source or len(s.tier) != len(base.tier):
+            raise ValueError(f"Scenario '{s.name}' was computed on different data than '{base.name}'")
+
+
+def compare_scenarios(scenarios: list[Scenario]) -> pd.DataFrame:
+    """One row per scenario: plan parameters, totals, tier counts and deltas vs the first."""
+    _check_aligned(scenarios)
+    base = scenarios[0]
+    base_total = float(base.revenue_delta.sum(dtype=np.float64))
+    rows = []
+    for s in scenarios:
+        counts = np.bincount(s.tier, minlength=len(TIERS))
+        total = float(s.revenue_delta.sum(dtype=np.float64))
+        rows.append({
+            "scenario": s.name,
+            **s.params,
+            "revenue_lift": total,
+            "revenue_lift_vs_base": total - base_total,
+            "mean_raise_score": float(s.raise_score.mean(dtype=np.float64)),
+            **{TIERS[i]: int(counts[i]) for i in range(len(TIERS))},
+            "tier_changes_vs_base": int((s.tier != base.tier).sum()),
+        })
+    return pd.DataFrame(rows)
+
+
+def tier_transitions(a: Scenario, b: Scenario) -> pd.DataFrame:
+    """Cube rows moving from each tier in `a` (rows) to each tier in `b` (columns)."""
+    _check_aligned([a, b])
+    n = len(TIERS)
+    counts = np.bincount(a.tier.astype(np.int64) * n + b.tier, minlength=n * n).reshape(n, n)
+    return pd.DataFrame(counts, index=pd.Index(TIERS, name=a.name), columns=pd.Index(TIERS, name=b.name))
+
+
+def scenario_movers(a: Scenario, b: Scenario, keys: pd.DataFrame, k: int = 20) -> pd.DataFrame:
+    """
+    Up to k cube rows that change most from `a` to `b`, with their keys: tier
+    moves first, then by absolute raise score change (scores are in [0, 1]).
+    """
+    _check_aligned([a, b])
+    score_delta = b.raise_score.astype(np.float64) - a.raise_score
+    change = 2.0 * (a.tier != b.tier) + np.abs(score_delta)
+    pos = top_k_positions(change, k, mask=change > 0)
+    out = keys.iloc[pos].reset_index(drop=True)
+    out[f"score ({a.name})"] = a.raise_score[pos]
+    out[f"score ({b.name})"] = b.raise_score[pos]
+    out["score_delta"] = score_delta[pos]
+    out[f"tier ({a.name})"] = TIER_LABELS[a.tier[pos]]
+    out[f"tier ({b.name})"] = TIER_LABELS[b.tier[pos]]
+    out["revenue_delta_change"] = b.revenue_delta[pos].astype(np.float64) - a.revenue_delta[pos]
+    return out
@@ -0,0 +1,302 @@
+"""
+Local ASGI scoring service for the quoting tool.
+
+Serves the batch artifacts (python -m src.batch --out-dir DIR) from in-memory
+hashed indexes:
+
+  GET  /elasticity?sku=&segment=&region=          elasticity for one cell
+  POST /elasticity/batch    {"sku": [...], "segment": [...], "region": [...]}
+  GET  /leakage?sku=&segment=&region=&discount_pct=   (or list_price= & net_price=)
+  POST /leakage/batch       same columns + discount_pct or list_price/net_price [, units]
+  GET  /health
+
+Batch endpoints take columnar JSON and are answered with one vectorized hash
+lookup (MultiIndex.get_indexer). The artifact directory is watched and the
+indexes are swapped atomically whenever a new run_manifest.json lands (the batch
+CLI writes it last).
+
+    pip install uvicorn
+    PRICING_ARTIFACT_DIR=out/latest python -m src.scoring_api --port 8000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs
+
+import numpy as np
+import pandas as pd
+
+from src.poc2_leakage import DEFAULT_MIN_PEER_N
+
+KEYS = ["sku", "segment", "region"]
+ARTIFACT_DIR = os.environ.get("PRICING_ARTIFACT_DIR", "artifacts")
+RELOAD_CHECK_SECONDS = 2.0
+
+
+def _floats(a: np.ndarray) -> list:
+    # NaN (unknown cell) -> JSON null
+    return np.where(np.isnan(a), None, a).tolist()
+
+
+def _finite(values, name: str) -> np.ndarray:
+    # NaN/inf inputs would reach the response as invalid JSON; answered with 400
+    a = np.asarray(values, dtype=np.float64)
+    if not np.isfinite(a).all():
+        raise ValueError(f"{name} must be finite")
+    return a
+
+
+class ScoringIndex:
+    """Elasticity cube + peer benchmarks keyed by (sku, segment, region)."""
+
+    def __init__(self, cube: pd.DataFrame, peers: pd.DataFrame, min_peer_n: int, stamp: float):
+        self.min_peer_n = int(min_peer_n)
+        self.stamp = stamp
+
+        self.cube_index = pd.MultiIndex.from_frame(cube[KEYS].astype(str))
+        self.cube_rows = {k: i for i, k in enumerate(self.cube_index)}
+        self.elasticity = cube["elasticity"].to_numpy(dtype=np.float64)
+        self.avg_price = cube["avg_price"].to_numpy(dtype=np.float64)
+        self.avg_margin = cube["avg_margin"].to_numpy(dtype=np.float64)
+
+        self.peer_index = pd.MultiIndex.from_frame(peers[KEYS].astype(str))
+        self.peer_rows = {k: i for i, k in enumerate(self.peer_index)}
+        self.peer_q_disc = peers["peer_q_disc"].to_numpy(dtype=np.float64)
+        self.peer_avg_disc = peers["peer_avg_disc"].to_numpy(dtype=np.float64)
+        self.peer_n = peers["peer_n"].to_numpy(dtype=np.int64)
+
+    def lookup(self, index: pd.MultiIndex, cols: dict) -> np.ndarray:
+        probe = pd.MultiIndex.from_arrays([np.asarray(cols[k], dtype=object).astype(str) for k in KEYS])
+        return index.get_indexer(probe)
+
+    def elasticity_batch(self, cols: dict) -> dict:
+        pos = self.lookup(self.cube_index, cols)
+        found = pos >= 0
+        safe = np.where(found, pos, 0)
+        return {
+            "found": found.tolist(),
+            "elasticity": _floats(np.where(found, self.elasticity[safe], np.nan)),
+            "avg_price": _floats(np.where(found, self.avg_price[safe], np.nan)),
+            "avg_margin": _floats(np.where(found, self.avg_margin[safe], np.nan)),
+        }
+
+    def leakage_one(self, q: dict, min_peer_n: int | None = None) -> dict:
+        # Scalar fast path: dict probe instead of building a MultiIndex
+        if "discount_pct" in q:
+            disc = float(_finite(q["discount_pct"], "discount_pct"))
+        else:
+            lp = float(_finite(q["list_price"], "list_price"))
+            disc = (lp - float(_finite(q["net_price"], "net_price"))) / (lp + 1e-9)
+        row = self.peer_rows.get((q["sku"], q["segment"], q["region"]))
+        if row is None:
+            return {"found": False, "leakage_flag": False, "discount_pct": disc, "peer_q_disc": None, "peer_n": 0, "excess_disc_pct": 0.0}
+        pq, n = float(self.peer_q_disc[row]), int(self.peer_n[row])
+        min_n = self.min_peer_n if min_peer_n is None else int(min_peer_n)
+        return {
+            "found": True,
+            "leakage_flag": bool(n >= min_n and disc > pq),
+            "discount_pct": disc,
+            "peer_q_disc": pq,
+            "peer_n": n,
+            "excess_disc_pct": max(disc - pq, 0.0),
+        }
+
+    def leakage_batch(self, cols: dict, min_peer_n: int | None = None) -> dict:
+        pos = self.lookup(self.peer_index, cols)
+        found = pos >= 0
+        safe = np.where(found, pos, 0)
+
+        if "discount_pct" in cols:
+            disc = _finite(cols["discount_pct"], "discount_pct")
+        else:
+            lp = _finite(cols["list_price"], "list_price")
+            disc = (lp - _finite(cols["net_price"], "net_price")) / (lp + 1e-9)
+
+        q = np.where(found, self.peer_q_disc[safe], np.nan)
+        n = np.where(found, self.peer_n[safe], 0)
+        min_n = self.min_peer_n if min_peer_n is None else int(min_peer_n)
+
+        # Same rule as leakage_flags
+        flag = (n >= min_n) & (disc > q)
+        excess = np.clip(np.nan_to_num(disc - q), 0, None)
+        out = {
+            "found": found.tolist(),
+            "leakage_flag": flag.tolist(),
+            "discount_pct": _floats(disc),
+            "peer_q_disc": _floats(q),
+            "peer_n": n.tolist(),
+            "excess_disc_pct": excess.tolist(),
+        }
+        if "list_price" in cols and "units" in cols:
+            out["leakage_dollars_est"] = (
+                excess * _finite(cols["list_price"], "list_price") * _finite(cols["units"], "units")
+            ).tolist()
+        return out
+
+
+def _manifest_path(artifact_dir: str) -> str:
+    return os.path.join(artifact_dir, "run_manifest.json")
+
+
+def load_index(artifact_dir: str) -> ScoringIndex:
+    cube = pd.read_parquet(os.path.join(artifact_dir, "elasticity_cube.parquet"), columns=KEYS + ["elasticity", "avg_price", "avg_margin"])
+    peers = pd.read_parquet(os.path.join(artifact_dir, "peer_benchmarks.parquet"))
+
+    min_peer_n, stamp = DEFAULT_MIN_PEER_N, 0.0
+    manifest = _manifest_path(artifact_dir)
+    if os.path.exists(manifest):
+        stamp = os.path.getmtime(manifest)
+        with open(manifest) as f:
+            min_peer_n = json.load(f).get("params", {}).get("min_peer_n", DEFAULT_MIN_PEER_N)
+    return ScoringIndex(cube, peers, min_peer_n, stamp)
+
+
+class ArtifactStore:
+    """Holds the live index; reload() swaps in a new one when the manifest changes."""
+
+    def __init__(self, artifact_dir: str):
+        self.artifact_dir = artifact_dir
+        self.index: ScoringIndex | None = None
+        self.loaded_at: float | None = None
+        self.last_error: str | None = None
+        self.watcher: asyncio.Task | None = None
+
+    def current_stamp(self) -> float | None:
+        path = _manifest_path(self.artifact_dir)
+        return os.path.getmtime(path) if os.path.exists(path) else None
+
+    def reload_if_changed(self) -> bool:
+        stamp = self.current_stamp()
+        if self.index is not None and (stamp is None or stamp == self.index.stamp):
+            return False
+        try:
+            index = load_index(self.artifact_dir)
+        except Exception as e:  # keep serving the previous index
+            self.last_error = str(e)
+            return False
+        self.index, self.loaded_at, self.last_error = index, time.time(), None
+        return True
+
+
+store = ArtifactStore(ARTIFACT_DIR)
+
+
+async def _watch(interval: float = RELOAD_CHECK_SECONDS):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        await loop.run_in_executor(None, store.reload_if_changed)
+
+
+async def _send_json(send, status: int, payload: dict):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_json(receive) -> dict:
+    chunks = []
+    while True:
+        msg = await receive()
+        chunks.append(msg.get("body", b""))
+        if not msg.get("more_body"):
+            break
+    return json.loads(b"".join(chunks) or b"{}")
+
+
+def _query(scope) -> dict:
+    return {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+
+
+async def _lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            store.reload_if_changed()
+            store.watcher = asyncio.get_running_loop().create_task(_watch())
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            if store.watcher is not None:
+                store.watcher.cancel()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+    if path == "/health":
+        idx = store.index
+        return await _send_json(send, 200, {
+            "ready": idx is not None,
+            "artifact_dir": store.artifact_dir,
+            "loaded_at": store.loaded_at,
+            "cube_cells": 0 if idx is None else len(idx.cube_index),
+            "peer_groups": 0 if idx is None else len(idx.peer_index),
+            "last_error": store.last_error,
+        })
+
+    if store.index is None:
+        store.reload_if_changed()
+    idx = store.index
+    if idx is None:
+        return await _send_json(send, 503, {"error": f"no artifacts loaded from {store.artifact_dir}", "detail": store.last_error})
+
+    try:
+        if path == "/elasticity" and method == "GET":
+            q = _query(scope)
+            row = idx.cube_rows.get((q["sku"], q["segment"], q["region"]))
+            if row is None:
+                return await _send_json(send, 200, {"found": False, "elasticity": None})
+            return await _send_json(send, 200, {
+                "found": True,
+                "elasticity": float(idx.elasticity[row]),
+                "avg_price": float(idx.avg_price[row]),
+                "avg_margin": float(idx.avg_margin[row]),
+            })
+        if path == "/elasticity/batch" and method == "POST":
+            return await _send_json(send, 200, idx.elasticity_batch(await _read_json(receive)))
+        if path == "/leakage" and method == "GET":
+            q = _query(scope)
+            return await _send_json(send, 200, idx.leakage_one(q, q.get("min_peer_n")))
+        if path == "/leakage/batch" and method == "POST":
+            body = await _read_json(receive)
+            min_n = body.pop("min_peer_n", None)
+            return await _send_json(send, 200, idx.leakage_batch(body, min_n))
+    except (KeyError, ValueError, TypeError) as e:
+        return await _send_json(send, 400, {"error": f"bad request: {e!r}"})
+
+    return await _send_json(send, 404, {"error": f"no route for {method} {path}"})
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.scoring_api", description="Serve elasticity + leakage lookups.")
+    p.add_argument("--artifact-dir", default=ARTIFACT_DIR)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    args = p.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("The scoring API needs an ASGI server: pip install uvicorn", file=sys.stderr)
+        return 1
+
+    store.artifact_dir = args.artifact_dir
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
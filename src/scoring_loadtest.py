@@ -0,0 +1,136 @@
+"""
+Load test for the local scoring API (src.scoring_api). Standard library only.
+
+    python -m src.scoring_loadtest --artifact-dir out/latest --url http://127.0.0.1:8000 \
+        --connections 32 --seconds 10 --batch-share 0.1
+
+Opens keep-alive HTTP/1.1 connections and replays a mix of single lookups
+(elasticity + leakage) and small batch POSTs built from real cube keys, then
+prints throughput and latency percentiles.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+
+RECONNECT_SECONDS = 0.05
+
+
+def _build_requests(artifact_dir: str, n: int, batch_share: float, batch_size: int, seed: int = 0) -> list[bytes]:
+    keys = pd.read_parquet(os.path.join(artifact_dir, "elasticity_cube.parquet"), columns=["sku", "segment", "region"])
+    keys = keys.astype(str).to_numpy().tolist()
+    rng = random.Random(seed)
+
+    reqs = []
+    for _ in range(n):
+        r = rng.random()
+        if r < batch_share:
+            rows = [rng.choice(keys) for _ in range(batch_size)]
+            body = {"sku": [k[0] for k in rows], "segment": [k[1] for k in rows], "region": [k[2] for k in rows]}
+            path = "/elasticity/batch"
+            if rng.random() < 0.5:
+                body["discount_pct"] = [rng.uniform(0.05, 0.35) for _ in rows]
+                path = "/leakage/batch"
+            payload = json.dumps(body).encode()
+            reqs.append(
+                f"POST {path} HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+            )
+        else:
+            sku, seg, reg = rng.choice(keys)
+            if r < (1 + batch_share) / 2:
+                path = "/elasticity?" + urlencode({"sku": sku, "segment": seg, "region": reg})
+            else:
+                path = "/leakage?" + urlencode({"sku": sku, "segment": seg, "region": reg, "discount_pct": round(rng.uniform(0.05, 0.35), 4)})
+            reqs.append(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+    return reqs
+
+
+async def _read_response(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def _worker(host: str, port: int, reqs: list[bytes], deadline: float, latencies: list, errors: list, offset: int):
+    # A refused/reset connection or a malformed response is counted as an error
+    # and the worker reconnects; it never aborts the run.
+    i = offset
+    while time.perf_counter() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            errors.append(type(e).__name__)
+            await asyncio.sleep(RECONNECT_SECONDS)
+            continue
+        try:
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                writer.write(reqs[i % len(reqs)])
+                await writer.drain()
+                i += 1
+                status = await _read_response(reader)
+                latencies.append(time.perf_counter() - t0)
+                if status != 200:
+                    errors.append(status)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, IndexError) as e:
+            errors.append(type(e).__name__)
+        finally:
+            writer.close()
+
+
+async def run_load(url: str, reqs: list[bytes], connections: int, seconds: float) -> dict:
+    u = urlsplit(url)
+    latencies, errors = [], []
+    t0 = time.perf_counter()
+    deadline = t0 + seconds
+    await asyncio.gather(*[
+        _worker(u.hostname, u.port or 80, reqs, deadline, latencies, errors, offset=i * 997)
+        for i in range(connections)
+    ])
+    elapsed = time.perf_counter() - t0
+
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "errors_by_kind": dict(Counter(str(e) for e in errors)),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3) if len(lat_ms) else None,
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 3) if len(lat_ms) else None,
+        "p99_ms": round(float(np.percentile(lat_ms, 99)), 3) if len(lat_ms) else None,
+    }
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.scoring_loadtest")
+    p.add_argument("--artifact-dir", required=True, help="Batch output dir (for realistic keys)")
+    p.add_argument("--url", default="http://127.0.0.1:8000")
+    p.add_argument("--connections", type=int, default=32)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--batch-share", type=float, default=0.1, help="Share of requests that are batch POSTs")
+    p.add_argument("--batch-size", type=int, default=50)
+    args = p.parse_args(argv)
+
+    reqs = _build_requests(args.artifact_dir, 5000, args.batch_share, args.batch_size)
+    result = asyncio.run(run_load(args.url, reqs, args.connections, args.seconds))
+    print(json.dumps(result, indent=2))
+    return 0 if result["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
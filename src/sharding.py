@@ -0,0 +1,465 @@
+"""
+Sharded multi-process execution of the leakage and customer-feature stages.
+
+Peer groups never cross regions and customer features never cross customers,
+so both stages split cleanly by a partition key:
+
+  sharded_leakage            leakage_flags per region shard + rep leaderboard
+  sharded_customer_features  build_customer_features per customer_id shard
+  sharded_leakage_by_customer  leakage_summary_by_customer per customer_id shard
+
+Whole key groups go to one shard: few groups (regions) are packed by size,
+many groups (customers) are assigned by hashed key code. Rows are reordered
+by shard once and written into one multiprocessing.shared_memory block; each
+worker attaches and works on zero-copy column views of its contiguous slice.
+Workers write their outputs back the same way, so no frame is pickled in either
+direction. Results come back in the original row / group order, identical to
+the single-process functions.
+
+Reps span regions, so the rep leaderboard is merged from per-shard partials:
+sums (and sum + count for the mean discount) add up, distinct customers / SKUs
+come from the union of per-shard (rep, value) pairs (or, with approx_distinct,
+from merged per-shard HyperLogLog sketches), and leakage_rate uses the total
+row count.
+
+    python -m src.sharding check --rows 1e6 --workers 1,2,4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from src.memory import low_memory, set_low_memory
+from src.poc2_features import build_customer_features
+from src.poc2_leakage import leakage_flags, leakage_summary_by_customer
+from src.sketches import ROLLUPS, HLLSketches
+
+LEAKAGE_SHARD_KEYS = ["region"]
+CUSTOMER_SHARD_KEYS = ["customer_id"]
+HASH_MIN_GROUPS_PER_SHARD = 64  # above this, hash by key code instead of packing by size
+
+# Columns the rep partials read from the flagged shard
+REP_COLUMNS = ["sales_rep_id", "customer_id", "sku", "leakage_flag", "leakage_dollars_est", "discount_pct", "revenue", "gm"]
+
+
+def available_workers() -> int:
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+# -----------------------------
+# Partitioning
+# -----------------------------
+def shard_ids(df: pd.DataFrame, keys: list[str], n_shards: int) -> np.ndarray:
+    """Shard per row; every key group lands in exactly one shard (null keys form one group)."""
+    codes = df.groupby(keys, observed=True, sort=True, dropna=False).ngroup().to_numpy()
+    sizes = np.bincount(codes)
+    if len(sizes) >= HASH_MIN_GROUPS_PER_SHARD * n_shards:
+        return (codes % n_shards).astype(np.int32)
+
+    # Largest group first onto the least loaded shard
+    assign = np.empty(len(sizes), dtype=np.int32)
+    loads = np.zeros(n_shards, dtype=np.int64)
+    for g in np.argsort(-sizes, kind="stable"):
+        s = int(loads.argmin())
+        assign[g] = s
+        loads[s] += sizes[g]
+    return assign[codes]
+
+
+# -----------------------------
+# Frames <-> shared memory
+# -----------------------------
+def _encode(s: pd.Series) -> tuple[np.ndarray, tuple]:
+    """(fixed-width array, how to rebuild the column)."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.cat.codes.to_numpy(), ("category", s.dtype)
+    if isinstance(s.dtype, np.dtype) and s.dtype.kind in "biufcmM":
+        return s.to_numpy(), ("plain", None)
+    # Object, string and other extension columns hold pointers / masks that mean
+    # nothing in another process. Sorted codes: shards see categoricals that group
+    # and sort like the values; the original dtype is restored after gathering.
+    codes, uniques = pd.factorize(s, sort=True, use_na_sentinel=True)
+    return codes.astype(np.int32), ("object", (pd.CategoricalDtype(uniques), s.dtype))
+
+
+def _decode(values: np.ndarray, how: tuple):
+    kind, meta = how
+    if kind == "category":
+        return pd.Categorical.from_codes(values, dtype=meta)
+    if kind == "object":
+        return pd.Categorical.from_codes(values, dtype=meta[0])
+    return values
+
+
+def _to_object(codes: np.ndarray, dtype: pd.CategoricalDtype) -> np.ndarray:
+    out = np.asarray(dtype.categories, dtype=object).take(codes)
+    if len(codes) and codes.min() < 0:
+        out[codes < 0] = None
+    return out
+
+
+def to_shared(df: pd.DataFrame, order: np.ndarray | None = None) -> tuple[shared_memory.SharedMemory, dict]:
+    """Copies `df` (rows in `order`) into a new shared memory block; returns it and its spec."""
+    encoded = []
+    offset = 0
+    for c in df.columns:
+        values, how = _encode(df[c])
+        if order is not None:
+            values = values[order]
+        offset = -(-offset // 8) * 8  # 8-byte aligned columns
+        encoded.append((c, values, how, offset))
+        offset += values.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    cols = []
+    for c, values, how, off in encoded:
+        np.ndarray(values.shape, values.dtype, buffer=shm.buf, offset=off)[:] = values
+        cols.append((c, values.dtype.str, off, how))
+    return shm, {"name": shm.name, "rows": len(df), "columns": cols}
+
+
+def from_shared(shm: shared_memory.SharedMemory, spec: dict, start: int = 0, stop: int | None = None) -> pd.DataFrame:
+    """Frame over rows [start, stop) of a block; numeric and categorical columns are views."""
+    stop = spec["rows"] if stop is None else stop
+    data = {}
+    for c, dtype, off, how in spec["columns"]:
+        dt = np.dtype(dtype)
+        arr = np.ndarray((spec["rows"],), dt, buffer=shm.buf, offset=off)[start:stop]
+        data[c] = _decode(arr, how)
+    return pd.DataFrame(data, copy=False)
+
+
+def _release(shm: shared_memory.SharedMemory, unlink: bool = False):
+    shm.close()
+    if unlink:
+        shm.unlink()
+
+
+def _unlink(spec: dict):
+    """Frees a worker's output block (already gone is fine)."""
+    try:
+        shm = shared_memory.SharedMemory(name=spec["name"])
+    except FileNotFoundError:
+        return
+    _release(shm, unlink=True)
+
+
+def _collect(futures: list, spec_of=lambda r: r) -> list:
+    """
+    Every future's result. If any worker failed, the output blocks the others
+    created are unlinked before the first error is re-raised.
+    """
+    results, error = [], None
+    for f in futures:
+        try:
+            results.append(f.result())
+        except BaseException as e:
+            error = error or e
+    if error is not None:
+        for r in results:
+            _unlink(spec_of(r))
+        raise error
+    return results
+
+
+def _gather(results: list[tuple[dict, np.ndarray]], n_rows: int, objects: dict) -> pd.DataFrame:
+    """
+    Reassembles worker outputs (spec, original row positions) into one frame, then
+    frees them (all of them, even if reading one fails). Columns named in `objects`
+    (non-numeric columns of the input, shipped as categoricals) get their original
+    dtype back.
+    """
+    cols = {}
+    done = 0
+    try:
+        for spec, positions in results:
+            shm = shared_memory.SharedMemory(name=spec["name"])
+            done += 1
+            try:
+                for c, dtype, off, how in spec["columns"]:
+                    raw = np.ndarray((spec["rows"],), np.dtype(dtype), buffer=shm.buf, offset=off)
+                    if c not in cols:
+                        cols[c] = (np.empty(n_rows, dtype=raw.dtype), how)
+                    cols[c][0][positions] = raw
+            finally:
+                _release(shm, unlink=True)
+    finally:
+        for spec, _ in results[done:]:
+            _unlink(spec)
+
+    out = {}
+    for c, (values, (kind, meta)) in cols.items():
+        if kind == "category" and c in objects:
+            out[c] = _restore(_to_object(values, meta), objects[c])
+        elif kind == "category":
+            out[c] = pd.Categorical.from_codes(values, dtype=meta)
+        else:
+            out[c] = values
+    return pd.DataFrame(out, copy=False)
+
+
+def _restore(values: np.ndarray, dtype):
+    return values if dtype == object else pd.array(values, dtype=dtype)
+
+
+def _object_columns(spec: dict) -> dict:
+    """Original dtype of each column shipped as codes."""
+    return {c: how[1][1] for c, _, _, how in spec["columns"] if how[0] == "object"}
+
+
+# -----------------------------
+# Workers
+# -----------------------------
+def _worker_init(low_mem: bool):
+    set_low_memory(low_mem)
+
+
+def _leakage_worker(spec: dict, start: int, stop: int, percentile: float, min_peer_n: int, columns, approx_distinct: bool):
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    try:
+        shard = from_shared(shm, spec, start, stop)
+        keep = None if columns is None else list(dict.fromkeys(list(columns) + REP_COLUMNS))
+        flagged = leakage_flags(shard, percentile=percentile, min_peer_n=min_peer_n, columns=keep)
+        del shard
+        partial = rep_partials(flagged, approx_distinct)
+        if columns is not None:
+            flagged = flagged[list(columns)]
+        out, out_spec = to_shared(flagged)
+        del flagged  # references the input block's columns until here
+    finally:
+        _release(shm)
+    out.close()  # the parent unlinks after gathering
+    return out_spec, partial
+
+
+def _frame_worker(fn, spec: dict, start: int, stop: int, kwargs: dict):
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    try:
+        res = fn(from_shared(shm, spec, start, stop), **kwargs)
+    finally:
+        _release(shm)
+    out, out_spec = to_shared(res)
+    out.close()
+    return out_spec
+
+
+def _plan(df: pd.DataFrame, keys: list[str], n_shards: int):
+    """Stable row order grouping shards together + (start, stop) per non-empty shard."""
+    ids = shard_ids(df, keys, n_shards)
+    order = np.argsort(ids, kind="stable")
+    bounds = np.searchsorted(ids[order], np.arange(n_shards + 1))
+    slices = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    return order, slices
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(low_memory(),))
+
+
+# -----------------------------
+# Rep leaderboard across shards
+# -----------------------------
+REP_SUMS = ["leakage_dollars_est", "discount_pct", "revenue", "gm"]
+
+
+def rep_partials(flagged: pd.DataFrame, approx_distinct: bool = False) -> dict:
+    """
+    Mergeable per-rep pieces of leakage_summary_by_rep for one shard (float sums in
+    float64). Distinct customers / SKUs are (rep, value) pairs, or sketches with approx_distinct.
+    """
+    d = flagged[["sales_rep_id", "leakage_flag"]].copy()
+    for c in REP_SUMS:
+        d[c] = flagged[c].astype(np.float64)
+    sums = d.groupby("sales_rep_id", observed=True).agg(
+        leakage_txns=("leakage_flag", "sum"),
+        leakage_est_dollars=("leakage_dollars_est", "sum"),
+        disc_sum=("discount_pct", "sum"),
+        disc_n=("discount_pct", "count"),
+        revenue=("revenue", "sum"),
+        gm=("gm", "sum"),
+    )
+    return {
+        "sums": sums,
+        "rows": len(flagged),
+        "dtypes": flagged[REP_SUMS].dtypes.to_dict(),
+        **{
+            name: HLLSketches.from_values(flagged["sales_rep_id"], flagged[col], ROLLUPS[f"rep_{name}"][2])
+            if approx_distinct else flagged[["sales_rep_id", col]].drop_duplicates()
+            for name, col in (("customers", "customer_id"), ("skus", "sku"))
+        },
+    }
+
+
+def merge_rep_partials(partials: list[dict], sort: bool = True) -> pd.DataFrame:
+    """Same frame as leakage_summary_by_rep over all shards' rows."""
+    sums = pd.concat([p["sums"] for p in partials]).groupby(level=0, observed=True).sum()
+    dtypes = partials[0]["dtypes"]
+    rep = pd.DataFrame({
+        "leakage_txns": sums["leakage_txns"],
+        "leakage_est_dollars": sums["leakage_est_dollars"].astype(dtypes["leakage_dollars_est"]),
+        "avg_discount": (sums["disc_sum"] / sums["disc_n"]).astype(dtypes["discount_pct"]),
+        "revenue": sums["revenue"].astype(dtypes["revenue"]),
+        "gm": sums["gm"].astype(dtypes["gm"]),
+    })
+    for name in ("customers", "skus"):
+        if isinstance(partials[0][name], HLLSketches):
+            sketch = partials[0][name]
+            for p in partials[1:]:
+                sketch = sketch.merge(p[name])
+            rep[name] = sketch.counts().reindex(rep.index).to_numpy()
+        else:
+            # nunique ignores nulls
+            pairs = pd.concat([p[name] for p in partials]).drop_duplicates().dropna()
+            rep[name] = pairs.groupby("sales_rep_id", observed=True).size()
+    rep = rep.reset_index()
+    rep["gm_pct"] = rep["gm"] / (rep["revenue"] + 1e-9)
+    rep["leakage_rate"] = rep["leakage_txns"] / (sum(p["rows"] for p in partials) + 1e-9)
+    return rep.sort_values("leakage_est_dollars", ascending=False) if sort else rep
+
+
+# -----------------------------
+# Sharded stages
+# -----------------------------
+def sharded_leakage(
+    df: pd.DataFrame,
+    percentile: float = 0.90,
+    min_peer_n: int = 30,
+    columns: list[str] | None = None,
+    workers: int | None = None,
+    shard_keys: list[str] = LEAKAGE_SHARD_KEYS,
+    sort: bool = True,
+    approx_distinct: bool = False,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (leakage_flags, leakage_summary_by_rep) computed per shard in `workers` processes.
+    shard_keys must keep peer groups whole (region, or the full peer key for more shards).
+    """
+    workers = workers or available_workers()
+    order, slices = _plan(df, shard_keys, workers)
+    shm, spec = to_shared(df, order)
+    try:
+        with _pool(workers) as pool:
+            futures = [
+                pool.submit(_leakage_worker, spec, a, b, percentile, min_peer_n, columns, approx_distinct)
+                for a, b in slices
+            ]
+            results = _collect(futures, spec_of=lambda r: r[0])
+    finally:
+        _release(shm, unlink=True)
+    objects = _object_columns(spec)
+    flagged = _gather([(out_spec, order[a:b]) for (out_spec, _), (a, b) in zip(results, slices)], len(df), objects)
+    rep = merge_rep_partials([partial for _, partial in results], sort=sort)
+    for c in objects.keys() & {"sales_rep_id"}:
+        rep[c] = _restore(rep[c].to_numpy(dtype=object), objects[c])
+    return flagged, rep
+
+
+def _sharded_by_customer(fn, df: pd.DataFrame, workers: int | None, **kwargs) -> pd.DataFrame:
+    workers = workers or available_workers()
+    order, slices = _plan(df, CUSTOMER_SHARD_KEYS, workers)
+    shm, spec = to_shared(df, order)
+    try:
+        with _pool(workers) as pool:
+            futures = [pool.submit(_frame_worker, fn, spec, a, b, kwargs) for a, b in slices]
+            specs = _collect(futures)
+    finally:
+        _release(shm, unlink=True)
+
+    # Customer-level outputs: concatenate shards, then the groupby order (sorted keys)
+    offsets = np.cumsum([0] + [s["rows"] for s in specs])
+    res = _gather(
+        [(s, np.arange(offsets[i], offsets[i + 1])) for i, s in enumerate(specs)],
+        int(offsets[-1]),
+        _object_columns(spec),
+    )
+    return res.sort_values("customer_id", kind="stable", ignore_index=True)
+
+
+def sharded_customer_features(df: pd.DataFrame, workers: int | None = None, approx_distinct: bool = False) -> pd.DataFrame:
+    """build_customer_features per customer shard."""
+    return _sharded_by_customer(build_customer_features, df, workers, approx_distinct=approx_distinct)
+
+
+def sharded_leakage_by_customer(txn_flagged: pd.DataFrame, workers: int | None = None, sort: bool = True) -> pd.DataFrame:
+    """leakage_summary_by_customer per customer shard of the flagged transactions."""
+    cust = _sharded_by_customer(leakage_summary_by_customer, txn_flagged, workers, sort=False)
+    return cust.sort_values("leakage_est_dollars", ascending=False) if sort else cust
+
+
+# -----------------------------
+# Equivalence + scaling check
+# -----------------------------
+def check(rows: int, workers: list[int], customers: int) -> pd.DataFrame:
+    from src.backends import assert_same_frame, with_null_key, with_null_peer_keys
+    from src.poc2_leakage import leakage_summary_by_rep
+    from src.synth_data import make_synthetic_transactions
+
+    df = make_synthetic_transactions(rows, seed=7, n_customers=customers)
+
+    t0 = time.perf_counter()
+    flagged = leakage_flags(df)
+    rep = leakage_summary_by_rep(flagged, sort=False)
+    t1 = time.perf_counter()
+    feats = build_customer_features(df)
+    t2 = time.perf_counter()
+    base = {"leakage + rep": t1 - t0, "customer features": t2 - t1}
+
+    out = []
+    for w in workers:
+        t0 = time.perf_counter()
+        s_flagged, s_rep = sharded_leakage(df, workers=w, sort=False)
+        t1 = time.perf_counter()
+        s_feats = sharded_customer_features(df, workers=w)
+        t2 = time.perf_counter()
+        assert_same_frame(s_flagged, flagged)
+        assert_same_frame(s_rep, rep)
+        assert_same_frame(s_feats, feats)
+        for stage, seconds in (("leakage + rep", t1 - t0), ("customer features", t2 - t1)):
+            out.append({
+                "stage": stage, "rows": rows, "workers": w,
+                "single_s": round(base[stage], 3), "sharded_s": round(seconds, 3),
+                "speedup": round(base[stage] / seconds, 2),
+            })
+
+    # Merged per-shard sketches == one sketch over all rows, so the estimates match exactly
+    w = max(workers)
+    assert_same_frame(
+        sharded_leakage(df, workers=w, sort=False, approx_distinct=True)[1],
+        leakage_summary_by_rep(flagged, sort=False, approx_distinct=True),
+    )
+    assert_same_frame(
+        sharded_customer_features(df, workers=w, approx_distinct=True),
+        build_customer_features(df, approx_distinct=True),
+    )
+
+    # Null shard / peer / customer keys behave as in the single-process functions
+    nulls = with_null_key(with_null_peer_keys(df), "customer_id", every=89, start=44)
+    s_flagged, s_rep = sharded_leakage(nulls, workers=w, sort=False)
+    flagged = leakage_flags(nulls)
+    assert_same_frame(s_flagged, flagged)
+    assert_same_frame(s_rep, leakage_summary_by_rep(flagged, sort=False))
+    assert_same_frame(sharded_customer_features(nulls, workers=w), build_customer_features(nulls))
+    return pd.DataFrame(out)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.sharding")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("check", help="Assert identical outputs and time 1..N worker processes")
+    c.add_argument("--rows", type=float, default=1e6)
+    c.add_argument("--workers", default="1,2,4")
+    c.add_argument("--customers", type=int, default=5000)
+    args = p.parse_args(argv)
+
+    res = check(int(args.rows), [int(w) for w in args.workers.split(",") if w], args.customers)
+    print(res.to_string(index=False))
+    print(f"\noutputs identical to the single-process functions (also with null keys); cores available: {available_workers()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
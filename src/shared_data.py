@@ -0,0 +1,93 @@
+"""
+Process-wide transaction dataset shared by the landing page and both engines.
+
+Backed by st.cache_resource: one DataFrame per data source per process,
+handed out by reference on every hit (no pickle round-trip, no copy).
+The frame is shared across pages and sessions, so callers must treat it as
+read-only; every src/ function already copies before adding columns.
+
+A data source is a hashable tuple so it can key every downstream stage:
+  ("synthetic", n_rows, seed)      make_synthetic_transactions
+  ("file", abs_path, mtime)        src.ingest.load_transactions (CSV / Parquet)
+Set PRICING_TRANSACTIONS_PATH to make a real extract the default source.
+With PRICING_LOW_MEMORY=1 both sources are held in the compact layout (src.memory).
+With PRICING_STORE_DIR set, the frame is a read-only memory map of the source's
+column store (src.column_store), shared with every other process on the server.
+"""
+import os
+
+import pandas as pd
+import streamlit as st
+
+from src.synth_data import make_synthetic_transactions
+from src.ingest import load_transactions
+from src import column_store
+from src.instrument import cached_stage, mark_cache_miss
+from src.memory import compact_transactions, float_dtype, low_memory
+
+DEFAULT_N_ROWS = 80000
+DEFAULT_SEED = 42
+TRANSACTIONS_PATH = os.environ.get("PRICING_TRANSACTIONS_PATH", "")
+
+
+def synthetic_source(n_rows: int = DEFAULT_N_ROWS, seed: int = DEFAULT_SEED) -> tuple:
+    return ("synthetic", int(n_rows), int(seed))
+
+
+def file_source(path: str) -> tuple:
+    # mtime in the key: a replaced extract is reloaded instead of served stale
+    path = os.path.abspath(path)
+    return ("file", path, os.path.getmtime(path))
+
+
+def default_source() -> tuple:
+    return file_source(TRANSACTIONS_PATH) if TRANSACTIONS_PATH else synthetic_source()
+
+
+def load_source(source: tuple) -> pd.DataFrame:
+    kind = source[0]
+    if kind == "synthetic":
+        df = make_synthetic_transactions(n_rows=source[1], seed=source[2])
+        return compact_transactions(df) if low_memory() else df
+    if kind == "file":
+        return load_transactions(source[1], float_dtype=float_dtype())
+    raise ValueError(f"Unknown data source {source!r}")
+
+
+@cached_stage("data")
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_dataset(source: tuple) -> pd.DataFrame:
+    mark_cache_miss()
+    if column_store.enabled():
+        return column_store.get_or_build(source, lambda: load_source(source))
+    return load_source(source)
+
+
+def data_source_controls() -> tuple:
+    """Sidebar widgets for the data source; returns the source key for the stages."""
+    path = st.text_input("Transactions file (CSV / Parquet, optional)", value=TRANSACTIONS_PATH).strip()
+    if path:
+        if not os.path.exists(path):
+            st.error(f"File not found: {path}")
+            st.stop()
+        return file_source(path)
+
+    n_rows = st.slider("Synthetic rows", 20000, 150000, DEFAULT_N_ROWS, 10000)
+    seed = st.number_input("Random seed", value=DEFAULT_SEED, step=1)
+    return synthetic_source(n_rows, seed)
+
+
+def ingest_report_panel(df: pd.DataFrame):
+    """Warns when rows of a loaded file were rejected (src.ingest), with reasons and a sample."""
+    report = df.attrs.get("ingest_report")
+    if not report or not report["rows_rejected"]:
+        return
+    st.warning(
+        f"{report['rows_rejected']:,} of {report['rows_read']:,} rows in "
+        f"{os.path.basename(report['path'])} were rejected and are not in the analysis."
+    )
+    with st.expander("Rejected rows"):
+        st.write(pd.Series(report["reject_reasons"], name="rows").rename_axis("reason").to_frame())
+        if report.get("reject_sample"):
+            st.caption(f"First {len(report['reject_sample'])} rejected rows, as read")
+            st.dataframe(pd.DataFrame(report["reject_sample"]), use_container_width=True, hide_index=True)
@@ -0,0 +1,280 @@
+"""
+Mergeable HyperLogLog sketches for approximate distinct counts per group.
+
+One sketch per group (customer, rep) is a row of m = 2**precision uint8
+registers. Values are hashed with pd.util.hash_pandas_object (64-bit, the same
+for object and categorical columns and across processes), so sketches built on
+different days or machines merge by an element-wise max of their registers:
+a merged sketch is identical to one built over the combined transactions.
+
+Error: the relative standard error of an estimate is 1.04 / sqrt(m)
+(precision 9: 4.6%, 12: 1.6%, 14: 0.8%); about 95% of estimates fall within
+twice that. Cardinalities below 2.5 m use linear counting. For small counts a
+single estimate can still be far off. `check` measures a mean relative error of
+about 2% on customer_sku_count (precision 9, 5,000 customers), with a maximum of
+13% at 1M rows and 23% at 100k rows (about 20 SKUs per customer). rep_customers
+and rep_skus (precision 14) stay within 1%. Memory is m bytes per group and
+column, independent of how many rows or distinct values were seen; ROLLUPS
+picks the precision per column.
+
+Used by build_customer_features / leakage_summary_by_rep(approx_distinct=True)
+and by per-day partial rollups that merge into any window without a rescan:
+
+    python -m src.sketches rollup --input day=2026-10-19.parquet --out sketches/2026-10-19.npz
+    python -m src.sketches merge sketches/2026-10-*.npz --out window.csv
+    python -m src.sketches check
+"""
+import argparse
+import io
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PRECISION = 12
+ROW_BLOCK = 1 << 18  # rows hashed per block; bounds the scratch arrays
+
+# name -> (group column, counted column, precision). Customers are many with few
+# distinct SKUs each (linear-counting range, 512 B per customer); reps are few
+# with large counts (16 KB per rep, 0.8% standard error).
+ROLLUPS = {
+    "customer_sku_count": ("customer_id", "sku", 9),
+    "customer_category_count": ("customer_id", "category", 9),
+    "rep_customers": ("sales_rep_id", "customer_id", 14),
+    "rep_skus": ("sales_rep_id", "sku", 14),
+}
+
+
+def relative_error(precision: int = DEFAULT_PRECISION) -> float:
+    """Relative standard error of one estimate."""
+    return 1.04 / np.sqrt(2 ** precision)
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    # frexp's exponent is the bit length; exact through float64 for 32-bit halves
+    hi, lo = (x >> np.uint64(32)).astype(np.float64), (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+_POW2 = np.ldexp(1.0, -np.arange(65))  # 2 ** -register
+ESTIMATE_BLOCK = 1024  # groups per estimate block
+
+
+def _alpha(m: int) -> float:
+    return {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+
+
+class HLLSketches:
+    """HyperLogLog sketches for a set of groups: `keys` (Index) x m registers."""
+
+    def __init__(self, keys: pd.Index, registers: np.ndarray, precision: int):
+        self.keys = keys
+        self.registers = registers
+        self.precision = int(precision)
+
+    @classmethod
+    def from_values(cls, groups: pd.Series, values: pd.Series, precision: int = DEFAULT_PRECISION) -> "HLLSketches":
+        """
+        One sketch per distinct group, fed every (group, value) pair. Pairs with a
+        null group or a null value are skipped, as groupby().nunique() skips them.
+        """
+        p = int(precision)
+        m = 1 << p
+        codes, keys = pd.factorize(groups, sort=True)
+        registers = np.zeros(len(keys) * m, dtype=np.uint8)
+        for start in range(0, len(values), ROW_BLOCK):
+            block = values.iloc[start:start + ROW_BLOCK]
+            h = pd.util.hash_pandas_object(block, index=False).to_numpy()
+            bucket = (h >> np.uint64(64 - p)).astype(np.int64)
+            rest = (h << np.uint64(p)) >> np.uint64(p)  # remaining 64 - p bits
+            rank = ((64 - p) - _bit_length(rest) + 1).astype(np.uint8)
+            block_codes = codes[start:start + ROW_BLOCK].astype(np.int64)
+            ok = (block_codes >= 0) & block.notna().to_numpy()  # code -1 would index the previous group's row
+            np.maximum.at(registers, block_codes[ok] * m + bucket[ok], rank[ok])
+        return cls(pd.Index(keys, name=getattr(groups, "name", None)), registers.reshape(len(keys), m), p)
+
+    def merge(self, other: "HLLSketches") -> "HLLSketches":
+        """Union of both (per group: distinct values seen by either)."""
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {self.precision} and {other.precision}")
+        keys = self.keys.union(other.keys)
+        registers = np.zeros((len(keys), self.registers.shape[1]), dtype=np.uint8)
+        for s in (self, other):
+            rows = keys.get_indexer(s.keys)
+            registers[rows] = np.maximum(registers[rows], s.registers)
+        return HLLSketches(keys.rename(self.keys.name), registers, self.precision)
+
+    def estimate(self) -> pd.Series:
+        """Approximate distinct count per group (float)."""
+        m = self.registers.shape[1]
+        inv = np.empty(len(self.keys))
+        for start in range(0, len(self.keys), ESTIMATE_BLOCK):  # bounds the float scratch
+            block = self.registers[start:start + ESTIMATE_BLOCK]
+            inv[start:start + len(block)] = _POW2[block].sum(axis=1)
+        raw = _alpha(m) * m * m / inv
+        zeros = (self.registers == 0).sum(axis=1)
+        with np.errstate(divide="ignore"):
+            linear = m * np.log(m / np.maximum(zeros, 1))
+        est = np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+        return pd.Series(est, index=self.keys)
+
+    def counts(self) -> pd.Series:
+        """Estimates rounded to int64, the dtype of the exact nunique columns."""
+        return self.estimate().round().astype(np.int64)
+
+    @property
+    def nbytes(self) -> int:
+        return self.registers.nbytes
+
+
+def approx_nunique(df: pd.DataFrame, group: str, column: str, precision: int = DEFAULT_PRECISION) -> pd.Series:
+    """Drop-in for df.groupby(group)[column].nunique() (sorted group index, int64)."""
+    return HLLSketches.from_values(df[group], df[column], precision).counts()
+
+
+# -----------------------------
+# Partial rollups: build per period, persist, merge into any window
+# -----------------------------
+def build_rollup(df: pd.DataFrame) -> dict[str, HLLSketches]:
+    return {
+        name: HLLSketches.from_values(df[group], df[col], precision)
+        for name, (group, col, precision) in ROLLUPS.items()
+        if group in df and col in df
+    }
+
+
+def merge_rollups(rollups: list[dict]) -> dict[str, HLLSketches]:
+    out = {}
+    for rollup in rollups:
+        for name, s in rollup.items():
+            out[name] = out[name].merge(s) if name in out else s
+    return out
+
+
+def rollup_to_bytes(rollup: dict[str, HLLSketches]) -> bytes:
+    """Compressed .npz payload (no pickles: keys are stored as strings)."""
+    arrays = {}
+    for name, s in rollup.items():
+        arrays[f"{name}.keys"] = s.keys.astype(str).to_numpy(dtype=str)
+        arrays[f"{name}.registers"] = s.registers
+        arrays[f"{name}.precision"] = np.array(s.precision)
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **arrays)
+    return buf.getvalue()
+
+
+def rollup_from_bytes(payload: bytes) -> dict[str, HLLSketches]:
+    with np.load(io.BytesIO(payload), allow_pickle=False) as z:
+        names = sorted({k.rsplit(".", 1)[0] for k in z.files})
+        return {
+            n: HLLSketches(
+                pd.Index(z[f"{n}.keys"].astype(object), name=ROLLUPS.get(n, (None,))[0]),
+                z[f"{n}.registers"],
+                int(z[f"{n}.precision"]),
+            )
+            for n in names
+        }
+
+
+def save_rollup(rollup: dict[str, HLLSketches], path: str):
+    with open(path, "wb") as f:
+        f.write(rollup_to_bytes(rollup))
+
+
+def load_rollup(path: str) -> dict[str, HLLSketches]:
+    with open(path, "rb") as f:
+        return rollup_from_bytes(f.read())
+
+
+def rollup_frame(rollup: dict[str, HLLSketches]) -> dict[str, pd.DataFrame]:
+    """Estimates per grouping: {"customer_id": frame, "sales_rep_id": frame}."""
+    frames = {}
+    for name, s in rollup.items():
+        group = ROLLUPS[name][0]
+        col = s.counts().rename(name.split("_", 1)[1])
+        frames[group] = frames[group].join(col, how="outer") if group in frames else col.to_frame()
+    return {g: f.rename_axis(g).reset_index() for g, f in frames.items()}
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def _peak_mb(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    seconds = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return out, seconds, peak
+
+
+def check(sizes: list[int], customers: int) -> pd.DataFrame:
+    """Exact vs approximate per rollup column, plus an exact merge check."""
+    from src.synth_data import make_synthetic_transactions
+
+    rows = []
+    for n in sizes:
+        df = make_synthetic_transactions(n, seed=7, n_customers=customers)
+        for name, (group, col, precision) in ROLLUPS.items():
+            exact, exact_s, exact_mb = _peak_mb(lambda: df.groupby(group, observed=True)[col].nunique())
+            approx, approx_s, approx_mb = _peak_mb(lambda: approx_nunique(df, group, col, precision))
+            err = (approx - exact).abs() / exact
+            rows.append({
+                "rows": n, "column": name, "groups": len(exact), "precision": precision,
+                "std_err": round(relative_error(precision), 4),
+                "max_rel_err": round(float(err.max()), 4), "mean_rel_err": round(float(err.mean()), 4),
+                "exact_s": round(exact_s, 3), "approx_s": round(approx_s, 3),
+                "exact_peak_mb": round(exact_mb, 1), "approx_peak_mb": round(approx_mb, 1),
+            })
+
+        # Partial rollups over halves (e.g. two days) merge to the full sketch exactly
+        half = n // 2
+        merged = merge_rollups([
+            rollup_from_bytes(rollup_to_bytes(build_rollup(df.iloc[:half]))),
+            build_rollup(df.iloc[half:]),
+        ])
+        whole = build_rollup(df)
+        for name in whole:
+            assert merged[name].keys.equals(whole[name].keys), name
+            assert np.array_equal(merged[name].registers, whole[name].registers), name
+    return pd.DataFrame(rows)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m src.sketches")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("rollup", help="Sketch one period's transactions to an .npz file")
+    c.add_argument("--input", required=True, help="CSV/Parquet transactions (validated by src.ingest)")
+    c.add_argument("--out", required=True)
+    c = sub.add_parser("merge", help="Merge period rollups and print (or write) the estimates")
+    c.add_argument("paths", nargs="+")
+    c.add_argument("--out", default=None, help="Write <out>.customer_id.csv / <out>.sales_rep_id.csv")
+    c = sub.add_parser("check", help="Error vs exact nunique, time, peak allocation, merge identity")
+    c.add_argument("--sizes", default="1e5,1e6")
+    c.add_argument("--customers", type=int, default=5000)
+    args = p.parse_args(argv)
+
+    if args.cmd == "rollup":
+        from src.ingest import load_transactions
+
+        save_rollup(build_rollup(load_transactions(args.input)), args.out)
+        print(f"wrote {args.out}")
+    elif args.cmd == "merge":
+        frames = rollup_frame(merge_rollups([load_rollup(path) for path in args.paths]))
+        for group, frame in frames.items():
+            if args.out:
+                frame.to_csv(f"{args.out.removesuffix('.csv')}.{group}.csv", index=False)
+            else:
+                print(frame.to_string(index=False), "\n")
+    else:
+        res = check([int(float(x)) for x in args.sizes.split(",") if x], args.customers)
+        print(res.to_string(index=False))
+        print("\nrollups over two halves, serialized and merged == rollup over all rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
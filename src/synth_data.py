@@ -1,17 +1,20 @@
 import numpy as np
 import pandas as pd
 
-def make_synthetic_transactions(n_rows=80000, seed=42):
+from src.instrument import instrumented
+
+@instrumented
+def make_synthetic_transactions(n_rows=80000, seed=42, n_skus=300, n_customers=500, n_reps=40):
     rng = np.random.default_rng(seed)
 
-    skus = [f"SKU_{i}" for i in range(1, 301)]
+    skus = [f"SKU_{i}" for i in range(1, n_skus + 1)]
     segments = ["DSO", "Clinic", "Small Practice", "Hospital"]
     regions = ["Northeast", "South", "Midwest", "West"]
     categories = ["Dental", "MedSurg", "Lab"]
 
     # NEW: customers + reps (for POC2)
-    customer_ids = [f"CUST_{i}" for i in range(1, 501)]
-    sales_reps = [f"REP_{i}" for i in range(1, 41)]
+    customer_ids = [f"CUST_{i}" for i in range(1, n_customers + 1)]
+    sales_reps = [f"REP_{i}" for i in range(1, n_reps + 1)]
 
     # Segment-level elasticity priors (DSOs tend to be more price sensitive)
     seg_el = {"DSO": -2.2, "Clinic": -1.8, "Small Practice": -1.4, "Hospital": -1.0}
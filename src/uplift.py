@@ -1,4 +1,8 @@
 import numpy as np
+import pandas as pd
+
+from src.instrument import instrumented
+from src.memory import float_dtype, low_memory
 
 def assign_tier(score: float, t1: float, t2: float) -> str:
     if score >= t1:
@@ -8,6 +12,14 @@ def assign_tier(score: float, t1: float, t2: float) -> str:
     else:
         return "🔴 Protect"
 
+def normalize_reward_weights(w_elasticity: float, w_margin: float, w_rev_uplift: float):
+    # Normalize reward weights to sum to 1 (penalty stays separate)
+    s = (w_elasticity + w_margin + w_rev_uplift) or 1.0
+    return w_elasticity / s, w_margin / s, w_rev_uplift / s
+
+TIERS = ["🟢 Tier 1 – Safe Raise", "🟡 Tier 2 – Test Raise", "🔴 Protect"]
+
+@instrumented
 def compute_price_lift_impact(
     df,
     price_increase_pct: float,
@@ -17,48 +29,79 @@ def compute_price_lift_impact(
     w_vol_risk: float = 0.10,   # penalty weight
     t1: float = 0.65,
     t2: float = 0.45,
+    columns: list[str] | None = None,
+    raise_categories: tuple | None = None,
+    cross=None,
 ):
-    df = df.copy()
+    """
+    Adds the simulated price-lift columns and the raise score / tier to the cube.
+    Math runs on float64 scratch arrays that are dropped on return; only the
+    requested output columns (default: input + all computed) are kept, stored
+    in the pipeline float dtype (src.memory).
+    `raise_categories` limits the raise to rows of those categories (None: all rows).
+    `cross` (src.cross_elasticity.cross_operator) adds each row's volume shift from
+    its neighbours' price changes, one sparse mat-vec over the cube rows.
+    """
+    p = price_increase_pct / 100
+    if raise_categories is not None:
+        p = np.where(df["category"].isin(raise_categories).to_numpy(), p, 0.0)
+    avg_price = df["avg_price"].to_numpy(dtype=np.float64)
+    avg_units = df["avg_units"].to_numpy(dtype=np.float64)
+    elasticity = df["elasticity"].to_numpy(dtype=np.float64)
+    out = {}
 
     # New price
-    df["new_price"] = df["avg_price"] * (1 + price_increase_pct / 100)
+    out["new_price"] = avg_price * (1 + p)
 
-    # New units using elasticity (ΔQ% = elasticity * ΔP%)
-    df["new_units"] = df["avg_units"] * (1 + df["elasticity"] * (price_increase_pct / 100))
+    # New units using elasticity (ΔQ% = elasticity * ΔP%), plus cross-price substitution
+    vol_pct = elasticity * p
+    if cross is not None:
+        vol_pct = vol_pct + cross @ np.ascontiguousarray(np.broadcast_to(p, avg_price.shape))
+    out["new_units"] = avg_units * (1 + vol_pct)
 
     # Revenue
-    df["base_revenue"] = df["avg_price"] * df["avg_units"]
-    df["new_revenue"] = df["new_price"] * df["new_units"]
-    df["revenue_delta"] = df["new_revenue"] - df["base_revenue"]
+    out["base_revenue"] = avg_price * avg_units
+    out["new_revenue"] = out["new_price"] * out["new_units"]
+    out["revenue_delta"] = out["new_revenue"] - out["base_revenue"]
 
     # Volume change %
-    df["vol_delta_pct"] = (df["new_units"] - df["avg_units"]) / (df["avg_units"] + 1e-9) * 100
+    out["vol_delta_pct"] = (out["new_units"] - avg_units) / (avg_units + 1e-9) * 100
 
     # ---------- Normalize score components ----------
     # Elasticity: assume plausible band [-4, 0] (less negative is better)
-    df["elasticity_norm"] = ((df["elasticity"] + 4) / 4).clip(0, 1)
+    out["elasticity_norm"] = np.clip((elasticity + 4) / 4, 0, 1)
 
     # Margin: already [0,1]
-    df["margin_norm"] = df["avg_margin"].clip(0, 1)
+    out["margin_norm"] = np.clip(df["avg_margin"].to_numpy(dtype=np.float64), 0, 1)
 
     # Revenue uplift % normalized to [0,1] across rows
-    df["rev_uplift_pct"] = df["revenue_delta"] / (df["base_revenue"] + 1e-9)
-    rev_min = df["rev_uplift_pct"].min()
-    rev_max = df["rev_uplift_pct"].max()
-    df["rev_uplift_norm"] = (df["rev_uplift_pct"] - rev_min) / (rev_max - rev_min + 1e-6)
+    out["rev_uplift_pct"] = out["revenue_delta"] / (out["base_revenue"] + 1e-9)
+    rev_min = pd.Series(out["rev_uplift_pct"]).min()
+    rev_max = pd.Series(out["rev_uplift_pct"]).max()
+    out["rev_uplift_norm"] = (out["rev_uplift_pct"] - rev_min) / (rev_max - rev_min + 1e-6)
 
     # Volume risk penalty: larger drop => higher penalty (0..1)
-    df["vol_risk_norm"] = np.clip(-df["vol_delta_pct"] / 10.0, 0, 1)
+    out["vol_risk_norm"] = np.clip(-out["vol_delta_pct"] / 10.0, 0, 1)
 
     # ---------- Raise score ----------
-    df["raise_score"] = (
-        w_elasticity * df["elasticity_norm"]
-        + w_margin * df["margin_norm"]
-        + w_rev_uplift * df["rev_uplift_norm"]
-        - w_vol_risk * df["vol_risk_norm"]
-    ).clip(0, 1)
+    score = np.clip(
+        w_elasticity * out["elasticity_norm"]
+        + w_margin * out["margin_norm"]
+        + w_rev_uplift * out["rev_uplift_norm"]
+        - w_vol_risk * out["vol_risk_norm"],
+        0, 1,
+    )
+    out["raise_score"] = score
 
-    # Tier assignment
-    df["raise_tier"] = df["raise_score"].apply(lambda s: assign_tier(s, t1, t2))
+    # Tier assignment (same rule as assign_tier, on the float64 score)
+    tier = np.select([score >= t1, score >= t2], TIERS[:2], TIERS[2]).astype(object)
 
-    return df
+    dtype = float_dtype()
+    keep = list(dict.fromkeys(list(df.columns) + list(out) + ["raise_tier"] if columns is None else columns))
+    res = df[[c for c in keep if c in df.columns]].copy()
+    for c in keep:
+        if c in out:
+            res[c] = out[c].astype(dtype, copy=False)
+    if "raise_tier" in keep:
+        res["raise_tier"] = pd.Categorical(tier, categories=TIERS) if low_memory() else tier
+    return res[[c for c in keep if c in res.columns]]
@@ -0,0 +1,103 @@
+"""
+Background warm-up of the shared stage caches for both engines' default parameters.
+
+Started from the landing page; one warm-up per process (held in st.cache_resource).
+Work runs on a small thread pool and writes straight into the same
+st.cache_resource stages the pages read, so the first page visit is a cache hit.
+The threads run without a script run context: st.cache_resource is process-wide,
+so the warm-up does not belong to (or end with) the session that started it.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from src.shared_data import default_source
+from src.app_stages import (
+    DEFAULT_K,
+    DEFAULT_PERCENTILE,
+    DEFAULT_MIN_PEER_N,
+    stage_data,
+    stage_elasticity_cube,
+    stage_segmentation,
+    stage_leakage_flags,
+    stage_leakage_by_customer,
+    stage_leakage_by_rep,
+)
+
+
+class _WarmupThreadFilter(logging.Filter):
+    """Drops Streamlit's "missing ScriptRunContext" warning for the warm-up threads (expected there)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not threading.current_thread().name.startswith("warmup")
+
+
+logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").addFilter(_WarmupThreadFilter())
+
+
+def warmup_tasks(source: tuple) -> list:
+    """(label, fn) pairs. Data runs first; the three branches only share that upstream stage."""
+    def _leakage_summaries():
+        stage_leakage_flags(source, DEFAULT_PERCENTILE, DEFAULT_MIN_PEER_N)
+        stage_leakage_by_customer(source, DEFAULT_PERCENTILE, DEFAULT_MIN_PEER_N)
+        stage_leakage_by_rep(source, DEFAULT_PERCENTILE, DEFAULT_MIN_PEER_N)
+
+    return [
+        ("Shared dataset", lambda: stage_data(source)),
+        ("Elasticity cube (Price Raise)", lambda: stage_elasticity_cube(source)),
+        ("Segmentation (Leakage)", lambda: stage_segmentation(source, DEFAULT_K)),
+        ("Leakage flags + summaries", _leakage_summaries),
+    ]
+
+
+@st.cache_resource(show_spinner=False)
+def _warmup_state() -> dict:
+    return {"lock": threading.Lock(), "started": None, "tasks": {}}
+
+
+def _run(state: dict, label: str, fn):
+    t0 = time.perf_counter()
+    task = state["tasks"][label]
+    task["status"] = "running"
+    try:
+        fn()
+        task["status"] = "done"
+    except Exception as e:  # surfaced on the landing page; pages will recompute on demand
+        task["status"] = f"failed: {e}"
+    task["seconds"] = time.perf_counter() - t0
+
+
+def _warm_all(state: dict, tasks: list):
+    data_label, data_fn = tasks[0]
+    _run(state, data_label, data_fn)
+
+    with ThreadPoolExecutor(max_workers=len(tasks) - 1, thread_name_prefix="warmup") as pool:
+        for label, fn in tasks[1:]:
+            pool.submit(_run, state, label, fn)
+    state["finished"] = time.perf_counter()
+
+
+def start_warmup(source: tuple | None = None) -> dict:
+    """Starts the warm-up once per process and returns its (live) state."""
+    state = _warmup_state()
+    with state["lock"]:
+        if state["started"] is None:
+            tasks = warmup_tasks(source or default_source())
+            state["started"] = time.perf_counter()
+            state["tasks"] = {label: {"status": "queued", "seconds": None} for label, _ in tasks}
+            threading.Thread(
+                target=_warm_all,
+                args=(state, tasks),
+                name="warmup",
+                daemon=True,
+            ).start()
+    return state
+
+
+def warmup_progress(state: dict) -> tuple[float, bool]:
+    tasks = state["tasks"].values()
+    done = sum(t["status"] != "queued" and t["status"] != "running" for t in tasks)
+    return done / max(len(tasks), 1), "finished" in state
@@ -0,0 +1,14 @@
+import pytest
+
+from src.synth_data import make_synthetic_transactions
+from src.memory import compact_transactions
+
+
+@pytest.fixture(scope="session")
+def transactions():
+    return make_synthetic_transactions(n_rows=20000, seed=7, n_customers=300)
+
+
+@pytest.fixture(scope="session")
+def compact(transactions):
+    return compact_transactions(transactions.copy())
@@ -0,0 +1,40 @@
+import pytest
+
+from src.backends import PANDAS, _stage_calls, check_equivalence, with_null_key, with_null_peer_keys
+
+pytest.importorskip("polars")
+
+STAGES = list(_stage_calls(PANDAS, None, None))
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_polars_matches_pandas(transactions, stage):
+    check_equivalence(transactions, "polars", stages=[stage])
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_polars_matches_pandas_compact(compact, stage):
+    check_equivalence(compact, "polars", stages=[stage])
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_polars_matches_pandas_null_peer_keys(transactions, stage):
+    check_equivalence(with_null_peer_keys(transactions), "polars", stages=[stage])
+
+
+def test_null_peer_keys_are_never_flagged(transactions):
+    df = with_null_peer_keys(transactions)
+    flagged = PANDAS.leakage_flags(df)
+    no_peer = df["region"].isna().to_numpy()
+    assert no_peer.any()
+    assert len(flagged) == len(df)
+    assert not flagged["leakage_flag"].to_numpy()[no_peer].any()
+    assert (flagged["peer_n"].to_numpy()[no_peer] == 0).all()
+
+
+@pytest.mark.parametrize("layout", ["transactions", "compact"])
+@pytest.mark.parametrize("column", ["customer_id", "sales_rep_id", "sku", "segment", "category"])
+@pytest.mark.parametrize("stage", STAGES)
+def test_polars_matches_pandas_null_keys(request, layout, column, stage):
+    df = request.getfixturevalue(layout)
+    check_equivalence(with_null_key(df, column, 89, start=44), "polars", stages=[stage])
@@ -0,0 +1,45 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src import column_store
+from src.synth_data import make_synthetic_transactions
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    column_store.configure(str(tmp_path))
+    yield str(tmp_path)
+    column_store.configure(None)
+
+
+def _source(seed):
+    return ("synthetic", 2000, seed)
+
+
+def _load(seed):
+    return lambda: make_synthetic_transactions(n_rows=2000, seed=seed)
+
+
+def test_opened_store_matches_the_loaded_frame(store_dir):
+    df = column_store.get_or_build(_source(1), _load(1))
+    expected = _load(1)()
+    expected = expected.astype({c: "category" for c in expected.columns if expected[c].dtype == object})
+    pd.testing.assert_frame_equal(df, expected)
+    assert column_store.store_of(df) == column_store.store_path(_source(1))
+
+
+def test_builds_evict_least_recently_opened(store_dir, monkeypatch):
+    column_store.get_or_build(_source(0), _load(0))
+    size = column_store._size_mb(column_store.store_path(_source(0)))
+    monkeypatch.setattr(column_store, "STORE_MAX_MB", 2.5 * size)
+
+    column_store.get_or_build(_source(1), _load(1))
+    for s in (0, 1):
+        os.utime(os.path.join(column_store.store_path(_source(s)), "meta.json"), (0, 0))
+    column_store.get_or_build(_source(0), _load(0))  # reopening marks it used
+    column_store.get_or_build(_source(2), _load(2))  # over budget: drops source 1
+
+    stores = {s for s in os.listdir(store_dir) if not s.startswith(".")}
+    assert stores == {os.path.basename(column_store.store_path(_source(s))) for s in (0, 2)}
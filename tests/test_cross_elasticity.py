@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.cross_elasticity import CROSS_CLIP, _planted_transactions, cross_operator, fit_cross_elasticity
+from src.uplift import compute_price_lift_impact
+
+
+@pytest.fixture(scope="module")
+def planted():
+    txns, truth = _planted_transactions(n_skus=300, n_customers=1500, n_cats=2)
+    return txns, truth, fit_cross_elasticity(txns)
+
+
+def test_recovers_planted_effects(planted):
+    _, truth, cross = planted
+    got = truth.merge(cross, on=["sku", "other_sku"], how="left")
+    found = got["cross_elasticity"].notna()
+    assert found.mean() > 0.5
+    assert np.corrcoef(got.loc[found, "e"], got.loc[found, "cross_elasticity"])[0, 1] > 0.8
+    assert cross["cross_elasticity"].abs().max() <= CROSS_CLIP
+    assert (cross["sku"] != cross["other_sku"]).all()
+
+
+def test_no_effects_without_substitution(transactions):
+    cross = fit_cross_elasticity(transactions)
+    assert list(cross.columns) == ["segment", "sku", "other_sku", "cross_elasticity", "pair_n"]
+    assert len(cross) == 0 or cross["cross_elasticity"].abs().mean() < 0.1
+
+
+def test_operator_matches_dense_pairs(planted):
+    txns, _, cross = planted
+    skus = np.unique(txns["sku"])[:20]
+    cube = pd.MultiIndex.from_product(
+        [skus, np.unique(txns["segment"]), ["Northeast", "West"]], names=["sku", "segment", "region"],
+    ).to_frame(index=False)
+    M = cross_operator(cross, cube)
+
+    e = cross.set_index(["segment", "sku", "other_sku"])["cross_elasticity"].to_dict()
+    dense = np.zeros((len(cube), len(cube)))
+    for r, a in cube.iterrows():
+        for s, b in cube.iterrows():
+            if (a["segment"], a["region"]) == (b["segment"], b["region"]):
+                dense[r, s] = e.get((a["segment"], a["sku"], b["sku"]), 0.0)
+    assert M.nnz > 0
+    np.testing.assert_allclose(M.toarray(), dense)
+
+
+def test_plan_applies_cross_shift(planted):
+    txns, _, cross = planted
+    rng = np.random.default_rng(0)
+    cube = pd.MultiIndex.from_product(
+        [np.unique(txns["sku"]), np.unique(txns["segment"]), ["Northeast", "West"]], names=["sku", "segment", "region"],
+    ).to_frame(index=False)
+    cube["category"] = cube["sku"].map(txns.drop_duplicates("sku").set_index("sku")["category"])
+    cube["avg_price"] = rng.lognormal(3.1, 0.5, len(cube))
+    cube["avg_units"] = rng.lognormal(3.5, 0.6, len(cube))
+    cube["avg_margin"] = rng.uniform(0.2, 0.45, len(cube))
+    cube["elasticity"] = np.clip(rng.normal(-1.6, 0.5, len(cube)), -4.0, -0.05)
+    M = cross_operator(cross, cube)
+
+    out = compute_price_lift_impact(cube, price_increase_pct=3.0, raise_categories=("CAT_0",), cross=M)
+    dp = np.where(cube["category"].to_numpy() == "CAT_0", 0.03, 0.0)
+    expected = cube["avg_units"].to_numpy() * (1 + cube["elasticity"].to_numpy() * dp + M @ dp)
+    np.testing.assert_allclose(out["new_units"].to_numpy(), expected, rtol=1e-5)
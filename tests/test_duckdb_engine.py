@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+from src import duckdb_engine  # noqa: E402
+from src.poc2_leakage import leakage_flags  # noqa: E402
+
+STAGES = [
+    "derive_elasticity_cube", "build_customer_features", "leakage_flags",
+    "peer_benchmarks", "leakage_summary_by_customer", "leakage_summary_by_rep",
+]
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["plain", "null keys"])
+def dataset(request, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("duckdb"))
+    duckdb_engine._write_dataset(path, 20000, 3, null_keys=request.param)
+    return path
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_duckdb_matches_pandas(dataset, stage):
+    duckdb_engine.check_equivalence(dataset, stages=[stage])
+
+
+def test_null_peer_keys_are_kept_unflagged(tmp_path):
+    df = duckdb_engine._write_dataset(str(tmp_path), 20000, 2, null_keys=True)
+    got = duckdb_engine.leakage_flags(str(tmp_path))
+    no_peer = df[["sku", "segment", "region"]].isna().any(axis=1).to_numpy()
+    assert len(got) == len(df) == len(leakage_flags(df))
+    assert no_peer.any()
+    assert not got["leakage_flag"].to_numpy()[no_peer].any()
+    assert (got["peer_n"].to_numpy()[no_peer] == 0).all()
+
+
+def test_out_path_writes_every_row(dataset, tmp_path):
+    out = duckdb_engine.leakage_flags(dataset, out_path=str(tmp_path / "flags.parquet"))
+    assert len(pd.read_parquet(out)) == len(pd.read_parquet(dataset))
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ingest import REJECT_SAMPLE_ROWS, UNITS_MAX, load_transactions
+from src.synth_data import make_synthetic_transactions
+
+
+@pytest.fixture
+def extract(tmp_path):
+    df = make_synthetic_transactions(n_rows=3000, seed=3)
+    return df.drop(columns="margin_pct", errors="ignore"), tmp_path
+
+
+def _write(df, tmp_path, name="t.csv"):
+    path = str(tmp_path / name)
+    df.to_csv(path, index=False) if name.endswith(".csv") else df.to_parquet(path, index=False)
+    return path
+
+
+def test_valid_file_loads_every_row(extract):
+    df, tmp = extract
+    out = load_transactions(_write(df, tmp), chunk_rows=700)
+    report = out.attrs["ingest_report"]
+    assert report["rows_loaded"] == len(df) and report["rows_rejected"] == 0
+    assert out["units"].dtype == np.int32 and out["contract_flag"].dtype == np.int8
+    np.testing.assert_allclose(out["net_price"], df["net_price"])
+
+
+def test_invalid_rows_are_rejected_with_reasons(extract):
+    df, tmp = extract
+    bad = df.copy()
+    bad["units"] = bad["units"].astype(np.int64)
+    bad.loc[0, "units"] = UNITS_MAX + 1
+    bad.loc[1, "units"] = -1
+    bad.loc[2, "net_price"] = 0
+    bad.loc[3, "contract_flag"] = 2
+    bad.loc[4, "sku"] = None
+    out = load_transactions(_write(bad, tmp, "t.parquet"), chunk_rows=700)
+    report = out.attrs["ingest_report"]
+    assert report["rows_rejected"] == 5 and len(out) == len(df) - 5
+    assert report["reject_reasons"] == {
+        "units > int32 max": 1, "units < 0": 1, "net_price <= 0": 1, "contract_flag not 0/1": 1, "missing sku": 1,
+    }
+    assert out["units"].min() >= 0
+    assert [r["reject_reason"] for r in report["reject_sample"]][0] == "units > int32 max"
+    json.dumps(report)  # goes into the batch run manifest
+
+
+def test_rejects_only_written_when_asked(extract):
+    df, tmp = extract
+    bad = pd.concat([df.iloc[:5].assign(net_price=-1.0)] * (REJECT_SAMPLE_ROWS // 5 + 1) + [df])
+    path = _write(bad, tmp)
+    out = load_transactions(path, chunk_rows=700)
+    assert len(out.attrs["ingest_report"]["reject_sample"]) == REJECT_SAMPLE_ROWS
+    assert sorted(p.name for p in tmp.iterdir()) == ["t.csv"]
+
+    rejects = str(tmp / "out" / "rejects.csv")
+    (tmp / "out").mkdir()
+    out = load_transactions(path, chunk_rows=700, reject_path=rejects)
+    assert len(pd.read_csv(rejects)) == out.attrs["ingest_report"]["rows_rejected"]
+
+
+def test_categories_sorted_across_chunks(extract):
+    df, tmp = extract
+    out = load_transactions(_write(df.sort_values("sku", ascending=False), tmp), chunk_rows=500)
+    for c in ("sku", "customer_id", "sales_rep_id"):
+        cats = list(out[c].cat.categories)
+        assert cats == sorted(cats)
+
+
+def test_missing_columns_raise(extract):
+    df, tmp = extract
+    with pytest.raises(ValueError, match="missing required columns"):
+        load_transactions(_write(df.drop(columns=["units"]), tmp))
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.scenarios import ScenarioStore, compare_scenarios, make_scenario, tier_transitions
+from src.uplift import TIERS
+
+SOURCE = ("synthetic", 1000, 42)
+
+
+def _scenario(name, seed=0, source=SOURCE, rows=50):
+    rng = np.random.default_rng(seed)
+    sim = pd.DataFrame({
+        "raise_score": rng.random(rows),
+        "raise_tier": rng.choice(TIERS, rows),
+        "revenue_delta": rng.normal(size=rows),
+    })
+    return make_scenario(name, source, {"price_increase_pct": seed}, sim)
+
+
+def _store(*names, max_entries=8):
+    store = ScenarioStore(max_entries)
+    for i, n in enumerate(names):
+        store.save(_scenario(n, seed=i))
+    return store
+
+
+def test_names_are_most_recently_used_first():
+    assert _store("A", "B", "C").names() == ["C", "B", "A"]
+
+
+def test_save_evicts_least_recently_used():
+    store = _store("A", "B", max_entries=2)
+    store.get("A")
+    assert store.save(_scenario("C")) == ["B"]
+    assert store.names() == ["C", "A"]
+
+
+def test_resaving_replaces_in_place():
+    store = _store("A", "B")
+    store.save(_scenario("A", seed=5))
+    assert len(store) == 2 and store.names() == ["A", "B"]
+    assert store.peek("A").params == {"price_increase_pct": 5}
+
+
+def test_peek_does_not_reorder():
+    store = _store("A", "B", "C")
+    for n in ("B", "C", "A"):
+        store.peek(n)
+    assert store.names() == ["C", "B", "A"]
+    store.get("A")
+    assert store.names() == ["A", "C", "B"]
+
+
+def test_names_filter_by_source():
+    store = _store("A")
+    store.save(_scenario("other", source=("file", "/x.csv", 1.0)))
+    assert store.names(SOURCE) == ["A"]
+
+
+def test_compare_against_baseline():
+    a, b = _scenario("A", seed=1), _scenario("B", seed=2)
+    table = compare_scenarios([a, b])
+    assert table["revenue_lift_vs_base"].iloc[0] == 0
+    assert table[list(TIERS)].sum(axis=1).tolist() == [50, 50]
+    assert tier_transitions(a, b).to_numpy().sum() == 50
+
+
+def test_compare_rejects_other_data():
+    with pytest.raises(ValueError):
+        compare_scenarios([_scenario("A"), _scenario("B", source=("file", "/x.csv", 1.0))])
@@ -0,0 +1,59 @@
+import pytest
+
+from src.backends import assert_same_frame, with_null_key, with_null_peer_keys
+from src.poc2_features import build_customer_features
+from src.poc2_leakage import leakage_flags, leakage_summary_by_customer, leakage_summary_by_rep
+from src.sharding import sharded_customer_features, sharded_leakage, sharded_leakage_by_customer
+
+
+def _string_keys(df):
+    out = df.copy()
+    for c in ("customer_id", "sales_rep_id"):
+        out[c] = out[c].astype("string")
+    return out
+
+
+CASES = {
+    "plain": lambda df: df,
+    "null peer keys": with_null_peer_keys,
+    "null customer": lambda df: with_null_key(df, "customer_id", 89, start=44),
+    "null rep": lambda df: with_null_key(df, "sales_rep_id", 89, start=44),
+    "string keys": lambda df: with_null_key(_string_keys(df), "customer_id", 89, start=44),
+}
+
+
+@pytest.fixture(scope="module", params=list(CASES))
+def data(request, transactions):
+    return CASES[request.param](transactions)
+
+
+@pytest.mark.parametrize("approx_distinct", [False, True])
+def test_sharded_leakage_matches_single_process(data, approx_distinct):
+    flagged, rep = sharded_leakage(data, workers=2, sort=False, approx_distinct=approx_distinct)
+    expected = leakage_flags(data)
+    assert_same_frame(flagged, expected)
+    assert_same_frame(rep, leakage_summary_by_rep(expected, sort=False, approx_distinct=approx_distinct))
+
+
+@pytest.mark.parametrize("approx_distinct", [False, True])
+def test_sharded_customer_features_match_single_process(data, approx_distinct):
+    assert_same_frame(
+        sharded_customer_features(data, workers=2, approx_distinct=approx_distinct),
+        build_customer_features(data, approx_distinct=approx_distinct),
+    )
+
+
+def test_sharded_leakage_by_customer_matches_single_process(data):
+    flagged = leakage_flags(data)
+    assert_same_frame(
+        sharded_leakage_by_customer(flagged, workers=2, sort=False),
+        leakage_summary_by_customer(flagged, sort=False),
+    )
+
+
+def test_compact_layout(compact):
+    data = with_null_peer_keys(compact)
+    flagged, rep = sharded_leakage(data, workers=2, sort=False)
+    expected = leakage_flags(data)
+    assert_same_frame(flagged, expected)
+    assert_same_frame(rep, leakage_summary_by_rep(expected, sort=False))
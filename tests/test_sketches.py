@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.backends import with_null_key
+from src.sketches import (
+    ROLLUPS,
+    HLLSketches,
+    approx_nunique,
+    build_rollup,
+    merge_rollups,
+    relative_error,
+    rollup_from_bytes,
+    rollup_to_bytes,
+)
+
+
+def _sketch(df, precision=12):
+    return HLLSketches.from_values(df["sales_rep_id"], df["customer_id"], precision)
+
+
+def _assert_same(a, b):
+    pd.testing.assert_index_equal(a.keys, b.keys)
+    np.testing.assert_array_equal(a.registers, b.registers)
+    assert a.precision == b.precision
+
+
+@pytest.mark.parametrize("parts", [2, 5])
+def test_merged_parts_equal_one_sketch(transactions, parts):
+    shuffled = transactions.sample(frac=1, random_state=0)
+    bounds = np.linspace(0, len(shuffled), parts + 1).astype(int)
+    chunks = [shuffled.iloc[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    merged = _sketch(chunks[0])
+    for c in chunks[1:]:
+        merged = merged.merge(_sketch(c))
+    _assert_same(merged, _sketch(transactions))
+
+
+def test_merge_is_commutative_and_idempotent(transactions):
+    a, b = _sketch(transactions.iloc[:8000]), _sketch(transactions.iloc[8000:])
+    _assert_same(a.merge(b), b.merge(a))
+    _assert_same(a.merge(a), a)
+
+
+def test_merge_rejects_other_precision(transactions):
+    with pytest.raises(ValueError):
+        _sketch(transactions, 10).merge(_sketch(transactions, 12))
+
+
+def test_categorical_and_object_columns_hash_alike(transactions, compact):
+    np.testing.assert_array_equal(_sketch(transactions).registers, _sketch(compact).registers)
+
+
+def test_null_groups_and_values_are_skipped(transactions):
+    nulls = with_null_key(with_null_key(transactions, "sales_rep_id", 7), "customer_id", 11, start=3)
+    kept = nulls.dropna(subset=["sales_rep_id", "customer_id"])
+    _assert_same(_sketch(nulls), _sketch(kept))
+
+
+def test_estimates_within_error_bound(transactions):
+    _, col, precision = ROLLUPS["rep_customers"]
+    exact = transactions.groupby("sales_rep_id")[col].nunique()
+    approx = approx_nunique(transactions, "sales_rep_id", col, precision)
+    pd.testing.assert_index_equal(approx.index, exact.index, check_names=False)
+    assert approx.dtype == np.int64
+    rel = (approx - exact).abs() / exact
+    assert rel.max() < 4 * relative_error(precision)
+
+
+def test_rollups_round_trip_and_merge(transactions):
+    a, b = build_rollup(transactions.iloc[:10000]), build_rollup(transactions.iloc[10000:])
+    merged = merge_rollups([rollup_from_bytes(rollup_to_bytes(a)), rollup_from_bytes(rollup_to_bytes(b))])
+    whole = build_rollup(transactions)
+    assert merged.keys() == whole.keys() == ROLLUPS.keys()
+    for name in ROLLUPS:
+        np.testing.assert_array_equal(merged[name].registers, whole[name].registers)
+        pd.testing.assert_series_equal(merged[name].counts(), whole[name].counts(), check_index_type=False)